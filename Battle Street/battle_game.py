@@ -1,12 +1,30 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # Its banner would land in front of the --headless/--bench JSON on stdout
 import pygame
 import random
 import sys
 import math
+import itertools
 import socket
+import selectors
 import threading
+import csv
+import json
+import asyncio
 import pickle
+import struct
 import time
-import os
+import queue
+import contextlib
+import multiprocessing
+import concurrent.futures
+from collections import OrderedDict, defaultdict, deque
+
+# NumPy is optional - only the array-backed projectile and particle stores need it
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Initialize Pygame
 pygame.init()
@@ -15,10 +33,58 @@ pygame.init()
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 700
 FPS = 60
+TICK_RATE = 60  # Battle simulation ticks per second (all frame-counted timers assume this)
+MAX_RENDER_FPS = 144  # Battle redraw cap; drawing interpolates between simulation ticks
+MAX_CATCHUP_TICKS = 5  # Most ticks simulated in one frame before the backlog is dropped
+
+# Weapon rotation cache settings
+WEAPON_ROTATION_STEP = 5  # Degrees between cached weapon rotations
+WEAPON_ROTATION_CACHE_SIZE = 512  # Max rotated weapon surfaces kept in memory
+TEXT_CACHE_SIZE = 512  # Max rendered text surfaces kept in memory
+DIRTY_RECT_RENDERING = False  # Battle only pushes changed screen areas to the display (for software-rendered screens)
+SPATIAL_HASH_CELL_SIZE = 100  # Pixel size of the collision grid cells projectiles are tested in
+NUMPY_PROJECTILES = False  # Store projectiles in NumPy arrays and update them in batches (for stress matches, needs numpy)
+PROJECTILE_ARRAY_CAPACITY = 1024  # Starting size of the projectile arrays (doubles when full)
+OBJECT_POOL_MAX_FREE = 2048  # Most released projectiles/explosions kept around for reuse
+PARTICLE_POOL_SIZE = 4096  # Hard cap on live explosion particles (oldest are replaced first, needs numpy)
 
 # Network constants
 GAME_PORT = 55664  # Single port for all networking
 BROADCAST_PORT = 55665  # Broadcast discovery port
+NETWORK_SEND_RATE = 30  # State snapshots sent per second during LAN battles (20/30/60 all work)
+NETWORK_STATS_INTERVAL = 10  # Seconds between sync rate/jitter reports in the console
+INTERPOLATION_DELAY = 0.1  # Seconds in the past clients draw remote players at (0 = jump to each snapshot)
+MAX_EXTRAPOLATION = 0.1  # Most seconds a remote player keeps moving past its newest snapshot
+SNAPSHOT_BUFFER_SIZE = 32  # Timestamped positions kept per remote player
+INPUT_HISTORY = 256  # Client inputs kept for replaying after a host correction (~4 s of ticks)
+INPUT_REDUNDANCY = 16  # Most unacknowledged inputs resent in each input message (covers lost datagrams)
+MAX_INPUTS_PER_TICK = 4  # Most queued client inputs the host simulates in one tick (catching up after a burst)
+NO_PLAYER = 255  # my_player_index of a dedicated server (it has no player of its own)
+MATCH_END_LINGER = 1.0  # Seconds a dedicated server keeps syncing after a match is decided
+HANDSHAKE_TIMEOUT = 5.0  # Seconds a joining client gets to send its name (only holds up that client)
+SEND_BUFFER_HIGH = 64 * 1024  # Bytes buffered for a client's TCP connection before its writer waits for it
+SEND_QUEUE_LIMIT = 64  # Frames waiting for one client before the host gives up on it
+SLOW_CLIENT_TIMEOUT = 5.0  # Seconds a client may stay backed up before the host drops it
+NETSIM_RETRANSMIT_TIMEOUT = 0.2  # Seconds the network simulator holds a "lost" TCP chunk (doubling per retry, like TCP)
+NETSIM_REORDER_DELAY = 0.05  # Extra seconds the simulator holds a reordered packet (the next one or two overtake it)
+NETSIM_QUEUE_LIMIT = 0.5  # Seconds of data the simulator's bandwidth cap queues before it drops datagrams
+RELEVANCE_FILTERING = True  # Host updates players far from a client's player (or off screen) less often for that client
+RELEVANCE_MIN_PLAYERS = 5  # Smaller battles update everyone with every snapshot (there's bandwidth to spare)
+RELEVANCE_NEAR = 350  # Pixels around a client's player where everyone is updated with every snapshot
+RELEVANCE_MIN_PRIORITY = 0.2  # Share of snapshots the farthest players still get updated in
+RELEVANCE_OFFSCREEN_FACTOR = 0.5  # Priority multiplier for players outside the screen
+RELEVANCE_INTERACTION_TIME = 2.0  # Seconds two players who shot at each other keep updating each other with every snapshot
+RELEVANCE_AIM_ANGLE = 20  # Degrees off a player a new projectile may fly and still count as shooting at them
+CLIENT_SNAPSHOT_BUDGET = 4000  # State bytes per second per client (None = unlimited) - players that don't fit wait their turn
+TELEMETRY_INTERVAL = 1.0  # Seconds between network telemetry rows (F4 overlay, --telemetry-log)
+TELEMETRY_HISTORY = 300  # Telemetry rows kept in memory
+TELEMETRY_PENDING_ACKS = 1024  # Sent messages remembered for timing their round trip
+TELEMETRY_LOG = None  # .csv or .jsonl file every telemetry row is appended to (--telemetry-log)
+
+# Settings above that the command line changes. Match server workers get them passed in, since a
+# spawned worker process (Windows, macOS) imports this file afresh and would only see the defaults
+COMMAND_LINE_SETTINGS = ("NUMPY_PROJECTILES", "NETWORK_SEND_RATE", "INTERPOLATION_DELAY", "RELEVANCE_FILTERING",
+                         "CLIENT_SNAPSHOT_BUDGET", "TELEMETRY_LOG")
 
 # Colors
 WHITE = (255, 255, 255)
@@ -36,12 +102,11 @@ CYAN = (0, 255, 255)
 DARK_BLUE = (20, 20, 60)
 DARK_GREEN = (20, 60, 20)
 
-# Create screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Battle Street")
+# Screen is created by init_display() so battles can also be simulated headless
+screen = None
 clock = pygame.time.Clock()
 
-# Load weapon textures (AFTER screen is created)
+# Weapon textures (loaded by init_display, AFTER screen is created)
 WEAPON_TEXTURES = {}
 weapon_files = {
     "Fist": "fist.png",
@@ -77,21 +142,35 @@ weapon_files = {
     "Nuke Launcher": "nuke_launcher.png"
 }
 
-for weapon_name, filename in weapon_files.items():
-    # Get the directory where this script is located
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    filepath = os.path.join(script_dir, "weapons", filename)
-    
-    if os.path.exists(filepath):
-        try:
-            WEAPON_TEXTURES[weapon_name] = pygame.image.load(filepath).convert_alpha()
-            print(f"✅ Loaded {weapon_name} texture from {filepath}")
-        except Exception as e:
-            print(f"❌ Error loading {weapon_name}: {e}")
+def load_weapon_textures():
+    """Load every weapon texture (needs the display for convert_alpha)"""
+    for weapon_name, filename in weapon_files.items():
+        # Get the directory where this script is located
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        filepath = os.path.join(script_dir, "weapons", filename)
+        
+        if os.path.exists(filepath):
+            try:
+                WEAPON_TEXTURES[weapon_name] = pygame.image.load(filepath).convert_alpha()
+                print(f"✅ Loaded {weapon_name} texture from {filepath}")
+            except Exception as e:
+                print(f"❌ Error loading {weapon_name}: {e}")
+                WEAPON_TEXTURES[weapon_name] = None
+        else:
+            print(f"⚠️  Missing texture: {filepath}")
             WEAPON_TEXTURES[weapon_name] = None
-    else:
-        print(f"⚠️  Missing texture: {filepath}")
-        WEAPON_TEXTURES[weapon_name] = None
+
+def init_display():
+    """Open the game window and load weapon textures (only needed when drawing)"""
+    global screen
+    if screen is None:
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("Battle Street")
+        load_weapon_textures()
+    return screen
+
+# Stand-in for pygame.key.get_pressed() when nobody is at the keyboard
+NO_KEYS = defaultdict(bool)
 
 # Fonts
 title_font = pygame.font.Font(None, 90)
@@ -99,6 +178,112 @@ menu_font = pygame.font.Font(None, 50)
 text_font = pygame.font.Font(None, 36)
 small_font = pygame.font.Font(None, 28)
 tiny_font = pygame.font.Font(None, 22)
+role_font = pygame.font.Font(None, 80)
+
+class SurfaceCache:
+    """Least-recently-used cache of pre-rendered surfaces with hit/miss counters"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, render):
+        """Return the cached surface for key, calling render() to build it on a miss"""
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        
+        self.misses += 1
+        surface = render()
+        self.surfaces[key] = surface
+        # Evict the least recently used surface once we're over budget
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+    
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+class WeaponRotationCache(SurfaceCache):
+    """Rotated weapon textures, quantized to a fixed angle step"""
+    def __init__(self, step=WEAPON_ROTATION_STEP, max_size=WEAPON_ROTATION_CACHE_SIZE):
+        super().__init__(max_size)
+        self.step = step
+        self.exact = False  # True = rotate to the exact angle every frame (for comparing quality)
+    
+    def rotated(self, weapon_name, texture, angle_deg):
+        """Get the weapon texture rotated by angle_deg (counter-clockwise, like pygame.transform.rotate)"""
+        if self.exact:
+            return pygame.transform.rotate(texture, angle_deg)
+        
+        snapped_angle = round(angle_deg / self.step) * self.step % 360
+        return self.get((weapon_name, snapped_angle), lambda: pygame.transform.rotate(texture, snapped_angle))
+
+WEAPON_ROTATIONS = WeaponRotationCache()
+
+class ObjectPool:
+    """Free list of reusable objects with hit/miss counters"""
+    def __init__(self, cls, max_free=OBJECT_POOL_MAX_FREE):
+        self.cls = cls
+        self.max_free = max_free
+        self.free = []
+        self.hits = 0
+        self.misses = 0
+    
+    def acquire(self, *args):
+        """Reuse a released object (re-running __init__ on it), or make a new one if none are free"""
+        if self.free:
+            self.hits += 1
+            obj = self.free.pop()
+            obj.__init__(*args)
+            return obj
+        self.misses += 1
+        return self.cls(*args)
+    
+    def release(self, obj):
+        """Hand an object back - the caller must not use it afterwards"""
+        if len(self.free) < self.max_free:
+            self.free.append(obj)
+    
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "free": len(self.free),
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+# Rendered text surfaces, so labels that don't change aren't re-rendered every frame
+TEXT_CACHE = SurfaceCache(TEXT_CACHE_SIZE)
+
+def render_text(font, text, color, antialias=True):
+    """Render text with a font, reusing the cached surface when the same label was drawn recently"""
+    color = tuple(color)
+    return TEXT_CACHE.get((font, text, antialias, color), lambda: font.render(text, antialias, color))
+
+# Gradient backdrops, built once per (top color, bottom color, size)
+GRADIENT_BACKDROPS = {}
+
+def get_gradient_backdrop(top_color, bottom_color, size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+    """Get a cached vertical gradient surface that fades from top_color towards bottom_color"""
+    cache_key = (tuple(top_color), tuple(bottom_color), tuple(size))
+    backdrop = GRADIENT_BACKDROPS.get(cache_key)
+    if backdrop is None:
+        width, height = size
+        # Paint a single 1-pixel column, then stretch it sideways in one scale call
+        column = pygame.Surface((1, height))
+        for y in range(height):
+            ratio = y / height
+            column.set_at((0, y), tuple(int(top + (bottom - top) * ratio) for top, bottom in zip(top_color, bottom_color)))
+        backdrop = pygame.transform.scale(column, (width, height)).convert()
+        GRADIENT_BACKDROPS[cache_key] = backdrop
+    return backdrop
 
 # Game state
 class GameState:
@@ -308,6 +493,8 @@ MAPS = {
 
 # Platform class
 class Platform:
+    __slots__ = ("x", "y", "width", "height", "color")
+    
     def __init__(self, x, y, width, height, color=(100, 100, 100)):
         self.x = x
         self.y = y
@@ -351,6 +538,8 @@ class Platform:
 
 # Collectible class
 class Collectible:
+    __slots__ = ("x", "y", "type", "size", "lifetime", "bounce_offset", "bounce_speed")
+    
     def __init__(self, x, y, type):
         self.x = x
         self.y = y
@@ -396,6 +585,10 @@ class Collectible:
                 (self.x - 8, y + 8)
             ])
             
+    def get_rect(self):
+        """Screen area covered by draw(), including the bounce"""
+        return pygame.Rect(self.x - self.size - 1, self.y - self.size - 6, self.size * 2 + 2, self.size * 2 + 12)
+    
     def check_collision(self, player):
         dx = player.x + player.width / 2 - self.x
         dy = player.y + player.height / 2 - self.y
@@ -408,6 +601,7 @@ class ExplosionParticle:
         self.x = x
         self.y = y
         self.base_color = color
+        self.colors = [color, YELLOW, ORANGE, RED, WHITE]  # Fades through these as it burns out
         self.particles = []
         # Create particles in a burst pattern
         for i in range(15):
@@ -424,12 +618,11 @@ class ExplosionParticle:
             })
     
     def update(self):
-        for particle in self.particles[:]:
+        for particle in self.particles:
             particle['x'] += particle['vx']
             particle['y'] += particle['vy']
             particle['life'] -= 1
-            if particle['life'] <= 0:
-                self.particles.remove(particle)
+        self.particles = [particle for particle in self.particles if particle['life'] > 0]
         return len(self.particles) > 0  # Return True if still alive
     
     def draw(self, screen):
@@ -439,12 +632,137 @@ class ExplosionParticle:
             size = int(particle['size'] * life_ratio)
             if size > 0:
                 # Create colorful cartoon explosion with multiple colors
-                colors = [self.base_color, YELLOW, ORANGE, RED, WHITE]
+                colors = self.colors
                 color_idx = int((1 - life_ratio) * (len(colors) - 1))
                 color = colors[min(color_idx, len(colors) - 1)]
                 pygame.draw.circle(screen, color, (int(particle['x']), int(particle['y'])), size)
+    
+    def get_rect(self):
+        """Screen area covered by the remaining particles (None when burnt out)"""
+        if not self.particles:
+            return None
+        left = min(particle['x'] - particle['size'] for particle in self.particles)
+        top = min(particle['y'] - particle['size'] for particle in self.particles)
+        right = max(particle['x'] + particle['size'] for particle in self.particles)
+        bottom = max(particle['y'] + particle['size'] for particle in self.particles)
+        return pygame.Rect(left - 1, top - 1, right - left + 2, bottom - top + 2)
+
+class ParticlePool:
+    """Every explosion particle in one set of preallocated NumPy arrays.
+    
+    Slots are handed out round-robin, so once the pool is full the oldest particles get replaced first.
+    Moves the same way as ExplosionParticle and draws the same pixels, just in batches.
+    """
+    BURST_SIZE = 15
+    MAX_LIFE = 40
+    
+    def __init__(self, capacity=PARTICLE_POOL_SIZE):
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.size = np.zeros(capacity, dtype=np.int64)
+        self.life = np.zeros(capacity, dtype=np.int64)  # 0 = free slot
+        self.color_index = np.zeros(capacity, dtype=np.int64)
+        self.palette = []  # Burst base colors (color_index points in here)
+        self.sprites = {}  # (color_index, shade, size) -> pre-drawn circle
+        self.next_slot = 0
+    
+    def clear(self):
+        self.life[:] = 0
+        self.next_slot = 0
+    
+    def palette_index(self, color):
+        color = tuple(color)
+        if color not in self.palette:
+            self.palette.append(color)
+        return self.palette.index(color)
+    
+    def emit_burst(self, x, y, color):
+        """Start an explosion (same random rolls, in the same order, as ExplosionParticle)"""
+        vx, vy, sizes, lives = [], [], [], []
+        for i in range(self.BURST_SIZE):
+            angle = (i / self.BURST_SIZE) * 2 * math.pi
+            speed = random.uniform(2, 5)
+            vx.append(math.cos(angle) * speed)
+            vy.append(math.sin(angle) * speed)
+            sizes.append(random.randint(3, 8))
+            lives.append(random.randint(20, 40))
+        
+        slots = (self.next_slot + np.arange(self.BURST_SIZE)) % self.capacity
+        self.next_slot = (self.next_slot + self.BURST_SIZE) % self.capacity
+        self.x[slots] = x
+        self.y[slots] = y
+        self.vx[slots] = vx
+        self.vy[slots] = vy
+        self.size[slots] = sizes
+        self.life[slots] = lives
+        self.color_index[slots] = self.palette_index(color)
+    
+    def update(self):
+        alive = self.life > 0
+        self.x[alive] += self.vx[alive]
+        self.y[alive] += self.vy[alive]
+        self.life[alive] -= 1
+    
+    def sprite(self, color_index, shade, size):
+        """Pre-drawn particle circle (shade 0 = burst color, then YELLOW, ORANGE, RED, WHITE)"""
+        key = (color_index, shade, size)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            color = [self.palette[color_index], YELLOW, ORANGE, RED, WHITE][shade]
+            sprite = pygame.Surface((size * 2 + 1, size * 2 + 1), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, color, (size, size), size)
+            self.sprites[key] = sprite
+        return sprite
+    
+    def draw(self, screen):
+        """Draw every live particle in one blits() call and return the screen rects touched"""
+        live = np.flatnonzero(self.life > 0)
+        if len(live) == 0:
+            return []
+        # Fade out as life decreases
+        life_ratio = self.life[live] / self.MAX_LIFE
+        sizes = (self.size[live] * life_ratio).astype(np.int64)
+        shades = np.minimum(((1 - life_ratio) * 4).astype(np.int64), 4)
+        visible = sizes > 0
+        xs = self.x[live][visible].astype(np.int64)
+        ys = self.y[live][visible].astype(np.int64)
+        sizes = sizes[visible]
+        blits = [(self.sprite(color_index, shade, size), (x - size, y - size))
+                 for x, y, size, shade, color_index in zip(xs.tolist(), ys.tolist(), sizes.tolist(),
+                                                           shades[visible].tolist(), self.color_index[live][visible].tolist())]
+        return screen.blits(blits)
+
+# Shared explosion particle pool (None = each explosion keeps its own particle list)
+EXPLOSION_PARTICLES = ParticlePool() if np is not None else None
+
+# Recycled ExplosionParticle objects for when there's no particle pool
+EXPLOSION_POOL = ObjectPool(ExplosionParticle)
+
+def spawn_explosion(player, x, y, color):
+    """Start an explosion effect for a player's hit"""
+    if EXPLOSION_PARTICLES is not None:
+        EXPLOSION_PARTICLES.emit_burst(x, y, color)
+    else:
+        player.explosions.append(EXPLOSION_POOL.acquire(x, y, color))
 
 class Player:
+    # Every attribute is declared up front - no per-player __dict__
+    __slots__ = (
+        "x", "y", "width", "height", "color", "speed", "health", "max_health", "controls", "weapon", "owned_weapons",
+        "projectiles", "explosions", "coins", "defense", "facing_right", "shoot_cooldown", "prev_x", "prev_y",
+        "username", "role", "is_ghost", "team",
+        "build_resources", "in_vent", "vent_timer", "vent_cooldown_timer", "structures",
+        "is_trapped", "trap_timer", "trap_cooldown_timer", "cage_x", "cage_y",
+        "vehicle", "owned_vehicles",
+        "hat", "skin", "visor", "owned_cosmetics",
+        "temp_speed_boost", "temp_damage_boost", "temp_speed_duration", "temp_damage_duration",
+        "target_x", "target_y",
+        "velocity_y", "gravity", "jump_power", "on_ground", "ground_y",
+    )
+    
     def __init__(self, x, y, color, controls, username="Player", role="Fighter"):
         self.x = x
         self.y = y
@@ -456,12 +774,15 @@ class Player:
         self.max_health = 100
         self.controls = controls
         self.weapon = "Fist"
-        self.projectiles = []
+        self.owned_weapons = [self.weapon]
+        self.projectiles = []  # Swapped for a ProjectileView when the NumPy store is on
         self.explosions = []
         self.coins = 0
         self.defense = 0
         self.facing_right = True
         self.shoot_cooldown = 0
+        self.prev_x = x  # Position at the previous simulation tick (for interpolation)
+        self.prev_y = y
         
         # Username and role system
         self.username = username
@@ -620,7 +941,7 @@ class Player:
             # Apply damage boost
             damage = weapon_data["damage"] + self.temp_damage_boost
             
-            projectile = Projectile(
+            projectile = PROJECTILE_POOL.acquire(
                 start_x,
                 start_y,
                 dx,
@@ -665,7 +986,9 @@ class Player:
         
         return False
     
-    def draw(self, screen):
+    def draw(self, screen, pos=None):
+        """Draw at pos (e.g. blended between ticks) instead of where the player really is, if given"""
+        x, y = (self.x, self.y) if pos is None else pos
         vehicle_data = VEHICLES[self.vehicle]
         vehicle_color = vehicle_data["color"] if vehicle_data["color"] else self.color
         
@@ -677,105 +1000,118 @@ class Player:
                 player_color = COSMETICS[self.skin]["color"]
             
             # Draw player body with outline
-            pygame.draw.rect(screen, BLACK, (self.x - 2, self.y - 2, self.width + 4, self.height + 4))
-            pygame.draw.rect(screen, player_color, (self.x, self.y, self.width, self.height))
+            pygame.draw.rect(screen, BLACK, (x - 2, y - 2, self.width + 4, self.height + 4))
+            pygame.draw.rect(screen, player_color, (x, y, self.width, self.height))
             
             # Draw simple face
-            eye_y = self.y + 15
+            eye_y = y + 15
             if self.facing_right:
-                pygame.draw.circle(screen, WHITE, (int(self.x + 25), eye_y), 5)
-                pygame.draw.circle(screen, BLACK, (int(self.x + 25), eye_y), 2)
+                pygame.draw.circle(screen, WHITE, (int(x + 25), eye_y), 5)
+                pygame.draw.circle(screen, BLACK, (int(x + 25), eye_y), 2)
             else:
-                pygame.draw.circle(screen, WHITE, (int(self.x + 15), eye_y), 5)
-                pygame.draw.circle(screen, BLACK, (int(self.x + 15), eye_y), 2)
+                pygame.draw.circle(screen, WHITE, (int(x + 15), eye_y), 5)
+                pygame.draw.circle(screen, BLACK, (int(x + 15), eye_y), 2)
             
             # Draw visor if equipped
             if self.visor:
                 visor_color = COSMETICS[self.visor]["color"]
-                visor_y = self.y + 12
-                pygame.draw.rect(screen, visor_color, (self.x + 8, visor_y, 24, 8))
-                pygame.draw.rect(screen, BLACK, (self.x + 8, visor_y, 24, 8), 1)
+                visor_y = y + 12
+                pygame.draw.rect(screen, visor_color, (x + 8, visor_y, 24, 8))
+                pygame.draw.rect(screen, BLACK, (x + 8, visor_y, 24, 8), 1)
             
             # Draw hat if equipped
             if self.hat:
                 hat_color = COSMETICS[self.hat]["color"]
-                hat_x = self.x + self.width // 2
-                hat_y = self.y - 5
+                hat_x = x + self.width // 2
+                hat_y = y - 5
                 # Hat brim
-                pygame.draw.ellipse(screen, hat_color, (self.x + 5, hat_y, 30, 10))
+                pygame.draw.ellipse(screen, hat_color, (x + 5, hat_y, 30, 10))
                 # Hat top
-                pygame.draw.rect(screen, hat_color, (self.x + 10, hat_y - 15, 20, 15))
-                pygame.draw.rect(screen, BLACK, (self.x + 10, hat_y - 15, 20, 15), 1)
+                pygame.draw.rect(screen, hat_color, (x + 10, hat_y - 15, 20, 15))
+                pygame.draw.rect(screen, BLACK, (x + 10, hat_y - 15, 20, 15), 1)
         elif self.vehicle == "Tank":
             # Draw tank
             # Tank body
-            pygame.draw.rect(screen, BLACK, (self.x - 2, self.y - 2, self.width + 4, self.height + 4))
-            pygame.draw.rect(screen, vehicle_color, (self.x, self.y + 20, self.width, self.height - 20))
+            pygame.draw.rect(screen, BLACK, (x - 2, y - 2, self.width + 4, self.height + 4))
+            pygame.draw.rect(screen, vehicle_color, (x, y + 20, self.width, self.height - 20))
             # Tank turret
-            pygame.draw.circle(screen, vehicle_color, (int(self.x + self.width // 2), int(self.y + 25)), 20)
-            pygame.draw.circle(screen, BLACK, (int(self.x + self.width // 2), int(self.y + 25)), 20, 2)
+            pygame.draw.circle(screen, vehicle_color, (int(x + self.width // 2), int(y + 25)), 20)
+            pygame.draw.circle(screen, BLACK, (int(x + self.width // 2), int(y + 25)), 20, 2)
             # Tank barrel (points in facing direction)
-            barrel_x = self.x + self.width // 2
+            barrel_x = x + self.width // 2
             barrel_end = barrel_x + (30 if self.facing_right else -30)
-            pygame.draw.line(screen, BLACK, (barrel_x, self.y + 25), (barrel_end, self.y + 25), 6)
+            pygame.draw.line(screen, BLACK, (barrel_x, y + 25), (barrel_end, y + 25), 6)
             # Tank tracks
-            pygame.draw.rect(screen, BLACK, (self.x, self.y + self.height - 10, self.width, 10), 3)
+            pygame.draw.rect(screen, BLACK, (x, y + self.height - 10, self.width, 10), 3)
         elif self.vehicle == "Rocket":
             # Draw rocket pack
             # Rocket body
-            pygame.draw.ellipse(screen, vehicle_color, (self.x, self.y, self.width, self.height))
-            pygame.draw.ellipse(screen, BLACK, (self.x, self.y, self.width, self.height), 2)
+            pygame.draw.ellipse(screen, vehicle_color, (x, y, self.width, self.height))
+            pygame.draw.ellipse(screen, BLACK, (x, y, self.width, self.height), 2)
             # Rocket flames
-            flame_y = self.y + self.height
+            flame_y = y + self.height
             for i in range(3):
                 flame_size = random.randint(5, 15)
-                flame_x = self.x + self.width // 2 + random.randint(-10, 10)
+                flame_x = x + self.width // 2 + random.randint(-10, 10)
                 flame_colors = [(255, 200, 0), (255, 100, 0), (255, 50, 0)]
                 pygame.draw.circle(screen, flame_colors[i % 3], (flame_x, flame_y + i * 5), flame_size)
             # Cockpit window
-            pygame.draw.circle(screen, (150, 200, 255), (int(self.x + self.width // 2), int(self.y + 20)), 12)
+            pygame.draw.circle(screen, (150, 200, 255), (int(x + self.width // 2), int(y + 20)), 12)
         elif self.vehicle == "Ship":
             # Draw massive battleship
             # Ship hull
-            pygame.draw.rect(screen, BLACK, (self.x - 2, self.y - 2, self.width + 4, self.height + 4))
-            pygame.draw.rect(screen, vehicle_color, (self.x, self.y + 30, self.width, self.height - 30))
+            pygame.draw.rect(screen, BLACK, (x - 2, y - 2, self.width + 4, self.height + 4))
+            pygame.draw.rect(screen, vehicle_color, (x, y + 30, self.width, self.height - 30))
             # Ship bridge/tower
             bridge_w = self.width // 3
-            bridge_x = self.x + self.width // 2 - bridge_w // 2
-            pygame.draw.rect(screen, vehicle_color, (bridge_x, self.y, bridge_w, 40))
-            pygame.draw.rect(screen, BLACK, (bridge_x, self.y, bridge_w, 40), 2)
+            bridge_x = x + self.width // 2 - bridge_w // 2
+            pygame.draw.rect(screen, vehicle_color, (bridge_x, y, bridge_w, 40))
+            pygame.draw.rect(screen, BLACK, (bridge_x, y, bridge_w, 40), 2)
             # Windows
             for i in range(3):
                 win_x = bridge_x + 10 + i * 15
-                pygame.draw.rect(screen, CYAN, (win_x, self.y + 10, 10, 8))
+                pygame.draw.rect(screen, CYAN, (win_x, y + 10, 10, 8))
             # Missile launchers
             for i in range(4):
-                launcher_x = self.x + 10 + i * 35
-                pygame.draw.rect(screen, DARK_GRAY, (launcher_x, self.y + 50, 10, 20))
-                pygame.draw.rect(screen, RED, (launcher_x + 2, self.y + 50, 6, 15))
+                launcher_x = x + 10 + i * 35
+                pygame.draw.rect(screen, DARK_GRAY, (launcher_x, y + 50, 10, 20))
+                pygame.draw.rect(screen, RED, (launcher_x + 2, y + 50, 6, 15))
         
         # Draw weapon on player/vehicle
-        self.draw_weapon(screen)
+        self.draw_weapon(screen, (x, y))
         
         # Draw health bar with border
         bar_width = self.width
         bar_height = 8
         health_ratio = max(0, self.health / self.max_health)
-        pygame.draw.rect(screen, BLACK, (self.x - 2, self.y - 15, bar_width + 4, bar_height + 4))
-        pygame.draw.rect(screen, DARK_GRAY, (self.x, self.y - 13, bar_width, bar_height))
-        pygame.draw.rect(screen, GREEN if health_ratio > 0.3 else RED, (self.x, self.y - 13, bar_width * health_ratio, bar_height))
-        
-    def draw_weapon(self, screen):
+        pygame.draw.rect(screen, BLACK, (x - 2, y - 15, bar_width + 4, bar_height + 4))
+        pygame.draw.rect(screen, DARK_GRAY, (x, y - 13, bar_width, bar_height))
+        pygame.draw.rect(screen, GREEN if health_ratio > 0.3 else RED, (x, y - 13, bar_width * health_ratio, bar_height))
+        
+    def get_draw_bounds(self, pos=None):
+        """Screen area draw() can touch: body, vehicle extras, hat, health bar and held weapon"""
+        x, y = (self.x, self.y) if pos is None else pos
+        reach = 45
+        weapon_texture = WEAPON_TEXTURES.get(self.weapon)
+        if weapon_texture is not None:
+            # Rotated weapon sits 25px out from the center and can be as wide as its diagonal
+            reach = max(reach, 25 + max(weapon_texture.get_size()))
+        return pygame.Rect(x, y, self.width, self.height).inflate(reach * 2, reach * 2)
+    
+    def draw_weapon(self, screen, pos=None):
         """Draw the equipped weapon on the player, rotating towards mouse cursor"""
+        x, y = (self.x, self.y) if pos is None else pos
         # Check if weapon texture exists
         if self.weapon not in WEAPON_TEXTURES:
             return
         
         weapon_texture = WEAPON_TEXTURES[self.weapon]
+        if weapon_texture is None:
+            return
         
         # Calculate weapon position (from player's hand)
-        center_x = self.x + self.width // 2
-        center_y = self.y + self.height // 2
+        center_x = x + self.width // 2
+        center_y = y + self.height // 2
         
         # Calculate angle to target (mouse cursor)
         dx = self.target_x - center_x
@@ -791,8 +1127,8 @@ class Player:
         else:
             self.facing_right = False
         
-        # Rotate the weapon texture to point at mouse
-        rotated_weapon = pygame.transform.rotate(weapon_texture, -angle_deg)
+        # Rotate the weapon texture to point at mouse (cached per angle step)
+        rotated_weapon = WEAPON_ROTATIONS.rotated(self.weapon, weapon_texture, -angle_deg)
         
         # Get the rect for positioning
         weapon_rect = rotated_weapon.get_rect()
@@ -807,27 +1143,75 @@ class Player:
         # Draw the weapon
         screen.blit(rotated_weapon, weapon_rect)
         
-    def update_projectiles(self, other_player):
+    def update_projectiles(self, spatial_hash, team_mode=False):
+        """Move each projectile once and hit the first enemy barrier or player in its grid cell"""
         for proj in self.projectiles[:]:
             proj.update()
             if proj.x < 0 or proj.x > SCREEN_WIDTH or proj.y < 0 or proj.y > SCREEN_HEIGHT:
                 self.projectiles.remove(proj)
-            elif proj.check_collision(other_player):
-                damage = max(1, proj.damage - other_player.defense)
-                other_player.health -= damage
-                # Create explosion effect if weapon has explosion
-                if proj.has_explosion:
-                    explosion = ExplosionParticle(proj.x, proj.y, proj.color)
-                    self.explosions.append(explosion)
-                self.projectiles.remove(proj)
+                PROJECTILE_POOL.release(proj)
+                continue
+            
+            for occupant, barrier_owner in spatial_hash.query_point(proj.x, proj.y):
+                if barrier_owner is not None:
+                    # Engineer barrier - only blocks shots from other teams
+                    if (barrier_owner.team != self.team and occupant["health"] > 0 and
+                        occupant["x"] < proj.x < occupant["x"] + occupant["width"] and
+                        occupant["y"] < proj.y < occupant["y"] + occupant["height"]):
+                        occupant["health"] -= proj.damage
+                        if occupant["health"] <= 0:
+                            barrier_owner.structures.remove(occupant)
+                            print("🔨 Barrier destroyed!")
+                        self.projectiles.remove(proj)
+                        PROJECTILE_POOL.release(proj)
+                        break
+                elif occupant is not self and occupant.health > 0 and proj.check_collision(occupant):
+                    # Friendly fire prevention: skip teammates
+                    if team_mode and occupant.team == self.team:
+                        continue
+                    damage = max(1, proj.damage - occupant.defense)
+                    occupant.health -= damage
+                    # Create explosion effect if weapon has explosion
+                    if proj.has_explosion:
+                        spawn_explosion(self, proj.x, proj.y, proj.color)
+                    self.projectiles.remove(proj)
+                    PROJECTILE_POOL.release(proj)
+                    break
     
     def update_explosions(self):
         """Update all explosion effects"""
         for explosion in self.explosions[:]:
             if not explosion.update():
                 self.explosions.remove(explosion)
+                EXPLOSION_POOL.release(explosion)
+    
+    def clear_projectiles(self):
+        """Remove every projectile, handing them back to the pool"""
+        if isinstance(self.projectiles, list):
+            for proj in self.projectiles:
+                PROJECTILE_POOL.release(proj)
+        self.projectiles.clear()
+    
+    def remove_projectiles(self, net_ids):
+        """Remove the projectiles with these network ids (ones already gone are skipped)"""
+        if not isinstance(self.projectiles, list):
+            self.projectiles.remove_ids(net_ids)
+            return
+        for proj in [proj for proj in self.projectiles if proj.net_id in net_ids]:
+            self.projectiles.remove(proj)
+            PROJECTILE_POOL.release(proj)
+    
+    def clear_explosions(self):
+        """Remove every explosion effect, handing them back to the pool"""
+        for explosion in self.explosions:
+            EXPLOSION_POOL.release(explosion)
+        self.explosions = []
+
+PROJECTILE_IDS = itertools.count(1)  # Network ids, so peers can refer to one projectile across snapshots
 
 class Projectile:
+    __slots__ = ("x", "y", "dx", "dy", "damage", "speed", "color", "radius", "has_explosion", "prev_x", "prev_y", "net_id")
+    
     def __init__(self, x, y, dx, dy, damage, speed, color, has_explosion=False):
         self.x = x
         self.y = y
@@ -838,20 +1222,1350 @@ class Projectile:
         self.color = color
         self.radius = 8
         self.has_explosion = has_explosion
+        self.prev_x = x  # Position at the previous simulation tick (for interpolation)
+        self.prev_y = y
+        self.net_id = next(PROJECTILE_IDS) & 0xFFFFFFFF
         
     def update(self):
         self.x += self.speed * self.dx
         self.y += self.speed * self.dy
         
-    def draw(self, screen):
-        pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.radius)
+    def draw(self, screen, pos=None):
+        x, y = (self.x, self.y) if pos is None else pos
+        pygame.draw.circle(screen, self.color, (int(x), int(y)), self.radius)
+    
+    def get_rect(self, pos=None):
+        x, y = (self.x, self.y) if pos is None else pos
+        return pygame.Rect(x - self.radius - 1, y - self.radius - 1, self.radius * 2 + 2, self.radius * 2 + 2)
         
     def check_collision(self, player):
         return (self.x >= player.x and self.x <= player.x + player.width and
                 self.y >= player.y and self.y <= player.y + player.height)
 
-class Game:
+# Recycled Projectile objects (shots, and remote projectiles rebuilt from network packets)
+PROJECTILE_POOL = ObjectPool(Projectile)
+
+class SpatialHash:
+    """Uniform grid that buckets items by every cell their bounding box touches"""
+    def __init__(self, cell_size=SPATIAL_HASH_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)  # (cell_x, cell_y) -> items, in insertion order
+        self.items = []  # Every inserted item, in insertion order
+    
+    def clear(self):
+        self.cells.clear()
+        self.items = []
+    
+    def insert(self, item, x, y, width, height):
+        self.items.append(item)
+        size = self.cell_size
+        for cell_x in range(int(x // size), int((x + width) // size) + 1):
+            for cell_y in range(int(y // size), int((y + height) // size) + 1):
+                self.cells[(cell_x, cell_y)].append(item)
+    
+    def query_point(self, x, y):
+        """Items whose bounding box may contain the point"""
+        return self.cells.get((int(x // self.cell_size), int(y // self.cell_size)), ())
+    
+    def query_cells(self, cells):
+        """Items touching any of the given cells, in insertion order"""
+        found = set()
+        for cell in cells:
+            for item in self.cells.get(cell, ()):
+                found.add(id(item))
+        return [item for item in self.items if id(item) in found]
+
+def team_code(team):
+    """Team number as an int for array comparisons (-1 = no team)"""
+    return -1 if team is None else team
+
+class ProjectileArrays:
+    """Every projectile in a battle as NumPy structure-of-arrays, moved and hit-tested in one batch per tick.
+    
+    Each player's projectiles are reached through a ProjectileView (see Game.attach_projectile_store).
+    """
+    FLOAT_FIELDS = ("x", "y", "prev_x", "prev_y", "dx", "dy", "speed")
+    INT_FIELDS = ("damage", "radius", "color_index", "owner_slot", "team", "net_id")
+    
+    def __init__(self, capacity=PROJECTILE_ARRAY_CAPACITY):
+        for name in self.FLOAT_FIELDS:
+            setattr(self, name, np.zeros(capacity))
+        for name in self.INT_FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=np.int64))
+        self.has_explosion = np.zeros(capacity, dtype=bool)
+        self.clear()
+    
+    def clear(self):
+        self.count = 0
+        self.owners = []  # owner_slot -> Player
+        self.owner_slots = {}  # id(Player) -> owner_slot
+        self.palette = []  # color_index -> color
+        self.rows_by_owner = None  # owner_slot -> its rows in firing order, until the next add or remove
+    
+    def _columns(self):
+        return [getattr(self, name) for name in self.FLOAT_FIELDS + self.INT_FIELDS + ("has_explosion",)]
+    
+    def _grow(self):
+        for name in self.FLOAT_FIELDS + self.INT_FIELDS + ("has_explosion",):
+            old = getattr(self, name)
+            new = np.zeros(len(old) * 2, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+    
+    def slot_for(self, player):
+        slot = self.owner_slots.get(id(player))
+        if slot is None:
+            slot = len(self.owners)
+            self.owners.append(player)
+            self.owner_slots[id(player)] = slot
+        return slot
+    
+    def palette_index(self, color):
+        color = tuple(color)
+        if color not in self.palette:
+            self.palette.append(color)
+        return self.palette.index(color)
+    
+    def append(self, proj, owner):
+        """Copy a Projectile (or anything with the same attributes) into the arrays"""
+        if self.count == len(self.x):
+            self._grow()
+        index = self.count
+        self.count += 1
+        self.rows_by_owner = None
+        self.x[index] = proj.x
+        self.y[index] = proj.y
+        self.prev_x[index] = getattr(proj, "prev_x", proj.x)
+        self.prev_y[index] = getattr(proj, "prev_y", proj.y)
+        self.dx[index] = proj.dx
+        self.dy[index] = proj.dy
+        self.speed[index] = proj.speed
+        self.damage[index] = proj.damage
+        self.radius[index] = proj.radius
+        self.color_index[index] = self.palette_index(proj.color)
+        self.owner_slot[index] = self.slot_for(owner)
+        self.team[index] = team_code(owner.team)
+        self.has_explosion[index] = proj.has_explosion
+        self.net_id[index] = proj.net_id
+    
+    def swap_remove(self, index):
+        """Remove one projectile: the last one moves into its slot"""
+        last = self.count - 1
+        for column in self._columns():
+            column[index] = column[last]
+        self.count = last
+        self.rows_by_owner = None
+    
+    def keep_only(self, keep):
+        """Drop every projectile where keep is False in one pass, keeping firing order"""
+        count = self.count
+        kept = int(keep.sum())
+        if kept != count:
+            for column in self._columns():
+                column[:kept] = column[:count][keep]
+            self.count = kept
+            self.rows_by_owner = None
+    
+    def rows_for(self, player):
+        """Rows holding player's projectiles, oldest first. Grouped for every owner in one pass and kept until
+        the store changes, so len() and loops over each player's projectiles don't rescan the arrays every time"""
+        if self.rows_by_owner is None:
+            owner_slot = self.owner_slot[:self.count]
+            order = np.argsort(owner_slot, kind="stable")
+            ends = np.cumsum(np.bincount(owner_slot, minlength=len(self.owners)))
+            self.rows_by_owner = np.split(order, ends[:-1])
+        slot = self.owner_slots.get(id(player))
+        if slot is None or slot >= len(self.rows_by_owner):
+            return np.zeros(0, dtype=np.int64)
+        return self.rows_by_owner[slot]
+    
+    def store_previous_positions(self):
+        self.prev_x[:self.count] = self.x[:self.count]
+        self.prev_y[:self.count] = self.y[:self.count]
+    
+    def update(self, spatial_hash, team_mode=False):
+        """Batched Player.update_projectiles for everyone: same hit rules, hits resolve in firing order"""
+        count = self.count
+        if count == 0:
+            return
+        # Dead players' projectiles hang in the air, like before
+        owner_alive = np.array([owner.health > 0 for owner in self.owners], dtype=bool)
+        moving = owner_alive[self.owner_slot[:count]]
+        
+        x = self.x[:count]
+        y = self.y[:count]
+        x[moving] += self.speed[:count][moving] * self.dx[:count][moving]
+        y[moving] += self.speed[:count][moving] * self.dy[:count][moving]
+        done = moving & ((x < 0) | (x > SCREEN_WIDTH) | (y < 0) | (y > SCREEN_HEIGHT))
+        live = moving & ~done
+        if not live.any():
+            self.keep_only(~done)
+            return
+        damage = self.damage[:count]
+        owner_slot = self.owner_slot[:count]
+        team = self.team[:count]
+        
+        # Only test what's bucketed in the grid cells the live projectiles are in (all on screen, so cells are >= 0)
+        cell_size = spatial_hash.cell_size
+        cell_keys = np.unique((x[live] // cell_size).astype(np.int64) * 65536 + (y[live] // cell_size).astype(np.int64))
+        cells = [divmod(key, 65536) for key in cell_keys.tolist()]
+        
+        for occupant, barrier_owner in spatial_hash.query_cells(cells):
+            if barrier_owner is not None:
+                # Engineer barrier - only blocks shots from other teams
+                if occupant["health"] <= 0:
+                    continue
+                hits = np.flatnonzero(live & (team != team_code(barrier_owner.team)) &
+                                      (x > occupant["x"]) & (x < occupant["x"] + occupant["width"]) &
+                                      (y > occupant["y"]) & (y < occupant["y"] + occupant["height"]))
+                dealt = damage[hits]
+                health = occupant["health"]
+            else:
+                if occupant.health <= 0:
+                    continue
+                target_mask = live & (owner_slot != self.owner_slots.get(id(occupant), -1))
+                # Friendly fire prevention: skip teammates
+                if team_mode:
+                    target_mask &= team != team_code(occupant.team)
+                hits = np.flatnonzero(target_mask & (x >= occupant.x) & (x <= occupant.x + occupant.width) &
+                                      (y >= occupant.y) & (y <= occupant.y + occupant.height))
+                dealt = np.maximum(1, damage[hits] - occupant.defense)
+                health = occupant.health
+            if len(hits) == 0:
+                continue
+            
+            # Shots after the target is already destroyed fly on through
+            landed = health - (np.cumsum(dealt) - dealt) > 0
+            hits = hits[landed]
+            health -= int(dealt[landed].sum())
+            live[hits] = False
+            done[hits] = True
+            if barrier_owner is not None:
+                occupant["health"] = health
+                if health <= 0:
+                    barrier_owner.structures.remove(occupant)
+                    print("🔨 Barrier destroyed!")
+            else:
+                occupant.health = health
+                # Create explosion effects for explosive weapons
+                for index in hits[self.has_explosion[hits]].tolist():
+                    owner = self.owners[owner_slot[index]]
+                    spawn_explosion(owner, float(x[index]), float(y[index]), self.palette[self.color_index[index]])
+        
+        self.keep_only(~done)
+
+class ProjectileView:
+    """One player's slice of a ProjectileArrays, usable like the old Player.projectiles list"""
+    def __init__(self, store, owner):
+        self.store = store
+        self.owner = owner
+    
+    def __len__(self):
+        return len(self.store.rows_for(self.owner))
+    
+    def __iter__(self):
+        return iter([ArrayProjectile(self.store, index) for index in self.store.rows_for(self.owner).tolist()])
+    
+    def __getitem__(self, index):
+        rows = self.store.rows_for(self.owner)
+        if isinstance(index, slice):
+            # Like list slicing: projectiles[:] gives a list to loop over, same as iterating the view
+            return [ArrayProjectile(self.store, row) for row in rows[index].tolist()]
+        return ArrayProjectile(self.store, int(rows[index]))
+    
+    def append(self, proj):
+        """Copy a projectile into the store (a plain Projectile goes back to the pool)"""
+        self.store.append(proj, self.owner)
+        if type(proj) is Projectile:
+            PROJECTILE_POOL.release(proj)
+    
+    def remove(self, proj):
+        self.store.swap_remove(proj.index)
+    
+    def remove_ids(self, net_ids):
+        rows = self.store.rows_for(self.owner)
+        gone = rows[np.isin(self.store.net_id[rows], list(net_ids))]
+        if len(gone):
+            keep = np.ones(self.store.count, dtype=bool)
+            keep[gone] = False
+            self.store.keep_only(keep)
+    
+    def clear(self):
+        rows = self.store.rows_for(self.owner)
+        if len(rows):
+            keep = np.ones(self.store.count, dtype=bool)
+            keep[rows] = False
+            self.store.keep_only(keep)
+
+def _array_projectile_field(name, cast):
+    """Property that reads/writes one column of a ProjectileArrays as a plain Python value"""
+    def get(self):
+        return cast(getattr(self.store, name)[self.index])
+    def set(self, value):
+        getattr(self.store, name)[self.index] = value
+    return property(get, set)
+
+class ArrayProjectile(Projectile):
+    """Projectile view onto one row of a ProjectileArrays (draw, get_rect etc. work as usual).
+    Only valid until the store next changes shape (update, remove, clear).
+    """
+    __slots__ = ("store", "index")
+    
+    x = _array_projectile_field("x", float)
+    y = _array_projectile_field("y", float)
+    prev_x = _array_projectile_field("prev_x", float)
+    prev_y = _array_projectile_field("prev_y", float)
+    dx = _array_projectile_field("dx", float)
+    dy = _array_projectile_field("dy", float)
+    speed = _array_projectile_field("speed", float)
+    damage = _array_projectile_field("damage", int)
+    radius = _array_projectile_field("radius", int)
+    net_id = _array_projectile_field("net_id", int)
+    has_explosion = _array_projectile_field("has_explosion", bool)
+    
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+    
+    @property
+    def color(self):
+        return self.store.palette[self.store.color_index[self.index]]
+    
+    @color.setter
+    def color(self, value):
+        self.store.color_index[self.index] = self.store.palette_index(value)
+
+# Network protocol - every TCP message is a frame: header (version, message type, tick, payload length) + payload.
+# In battle, state and acks go over UDP as one frame per datagram, the tick doubling as sequence number.
+PROTOCOL_VERSION = 4
+MAX_FRAME_SIZE = 1 << 20  # Bigger "frames" mean the stream is garbage, not a real message
+SNAPSHOT_HISTORY = 256  # Most snapshots kept per peer as possible delta baselines
+MSG_HELLO = 1  # Client -> host: player name (utf-8)
+MSG_WELCOME = 2  # Host -> client: assigned player index
+MSG_START = 3  # Host -> clients: battle starts, payload is the map name
+MSG_STATE = 4  # Game state snapshot, full or a delta against an acknowledged one
+MSG_ACK = 5  # "I have snapshot <tick>" - the sender may diff against it from now on
+MSG_EVENT = 6  # Host -> clients over TCP: hits and knockouts, which must never get lost
+MSG_INPUT = 7  # Client -> host: the client's newest unacknowledged inputs, tick-tagged
+MSG_INPUT_ACK = 8  # Host -> client: last input it simulated and where that left the client's player
+MSG_LOOKUP = 9  # Client -> match server front-end: lobby code (ascii)
+MSG_LOBBY = 10  # Front-end -> client: port of that lobby's match, 0 if it doesn't know the code
+MSG_ROSTER = 11  # Host -> clients: everyone in the lobby and their colors (see encode_roster)
+MSG_COLOR = 12  # Client -> host: color index the client would like
+REPLACEABLE_MESSAGES = (MSG_STATE, MSG_INPUT_ACK)  # Only the newest one is worth sending to a client that's behind
+UDP_MAX_DATAGRAM = 1400  # Bigger state frames go over TCP instead (keeps datagrams under a typical MTU)
+
+FRAME_HEADER = struct.Struct("!BBII")
+STATE_HEADER = struct.Struct("!BdIB")  # sender index, timestamp, baseline tick (0 = full snapshot), changed player count
+PLAYER_DELTA_HEADER = struct.Struct("!BH")  # player index, mask of the fields that follow
+PROJECTILE_EVENTS_HEADER = struct.Struct("!HH")  # projectiles added, projectiles removed
+PROJECTILE_RECORD = struct.Struct("!IffffHBBB?")  # id, x, y, dx, dy, damage, rgb, has explosion
+PROJECTILE_ID = struct.Struct("!I")
+DATAGRAM_HEADER = struct.Struct("!B")  # Sender player index, then one frame
+EVENT_RECORD = struct.Struct("!BBf")  # event kind, player index, health after
+EVENT_HIT = 1
+EVENT_KNOCKOUT = 2
+INPUT_RECORD = struct.Struct("!IBhh")  # input tick, buttons, shot target x, y
+INPUT_ACK_RECORD = struct.Struct("!Ifff??")  # input tick, x, y, velocity y, on ground, facing right
+
+# Input buttons - what a client player did in one game tick
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4  # W: jump, or fly up
+INPUT_DOWN = 8  # S: fly down
+INPUT_JUMP = 16  # Space
+INPUT_SHOOT = 32  # Clicked this tick (at the record's target)
+
+# Player fields in mask bit order, each packed on its own so changes can be found by comparing bytes
+SNAPSHOT_FIELDS = (
+    ("x", struct.Struct("!f")),
+    ("y", struct.Struct("!f")),
+    ("health", struct.Struct("!f")),
+    ("max_health", struct.Struct("!f")),
+    ("velocity_y", struct.Struct("!f")),
+    ("weapon", struct.Struct("!B")),
+    ("color", struct.Struct("!BBB")),
+    ("facing_right", struct.Struct("!?")),
+    ("on_ground", struct.Struct("!?")),
+)
+ALL_FIELDS_MASK = (1 << len(SNAPSHOT_FIELDS)) - 1
+PLAYER_FIELDS = struct.Struct("!" + "".join(field.format.lstrip("!") for _, field in SNAPSHOT_FIELDS))
+FIELD_SLICES = []  # Where each field sits in a PLAYER_FIELDS record
+for _, field in SNAPSHOT_FIELDS:
+    start = FIELD_SLICES[-1].stop if FIELD_SLICES else 0
+    FIELD_SLICES.append(slice(start, start + field.size))
+
+WEAPON_NAMES = list(WEAPONS.keys())  # Weapons go over the wire as their index in this list
+WEAPON_IDS = {name: index for index, name in enumerate(WEAPON_NAMES)}
+
+class ProtocolError(Exception):
+    """Bytes from the network that don't decode to a valid message"""
+
+def encode_frame(msg_type, tick, payload=b""):
+    return FRAME_HEADER.pack(PROTOCOL_VERSION, msg_type, tick & 0xFFFFFFFF, len(payload)) + payload
+
+class FrameDecoder:
+    """Reassembles frames from a TCP byte stream, however recv() split or merged them"""
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+    
+    def feed(self, data):
+        self.buffer += data
+    
+    def next_frame(self):
+        """Pop the next complete (msg_type, tick, payload), or None until more bytes arrive"""
+        if len(self.buffer) < FRAME_HEADER.size:
+            return None
+        version, msg_type, tick, length = FRAME_HEADER.unpack_from(self.buffer)
+        if version != PROTOCOL_VERSION or length > self.max_frame_size:
+            # Can't find the next frame boundary after this - the connection is unusable
+            self.buffer.clear()
+            raise ProtocolError(f"bad frame header (version {version}, length {length})")
+        end = FRAME_HEADER.size + length
+        if len(self.buffer) < end:
+            return None
+        payload = bytes(self.buffer[FRAME_HEADER.size:end])
+        del self.buffer[:end]
+        return msg_type, tick, payload
+    
+    def frames(self):
+        """Pop every complete frame"""
+        frames = []
+        frame = self.next_frame()
+        while frame is not None:
+            frames.append(frame)
+            frame = self.next_frame()
+        return frames
+
+def recv_frame(sock, decoder):
+    """Block until one whole frame arrives on sock (bytes past it stay buffered in the decoder)"""
+    frame = decoder.next_frame()
+    while frame is None:
+        data = sock.recv(4096)
+        if not data:
+            raise ConnectionError("connection closed")
+        decoder.feed(data)
+        frame = decoder.next_frame()
+    return frame
+
+async def read_frame(reader, decoder):
+    """recv_frame for an asyncio stream"""
+    frame = decoder.next_frame()
+    while frame is None:
+        data = await reader.read(4096)
+        if not data:
+            raise ConnectionError("connection closed")
+        decoder.feed(data)
+        frame = decoder.next_frame()
+    return frame
+
+def encode_roster(names, color_indexes):
+    """ROSTER payload: player count, then a color index and length-prefixed utf-8 name per player"""
+    parts = [struct.pack("!B", len(names))]
+    for name, color_index in zip(names, color_indexes):
+        name_bytes = name.encode()[:255]
+        parts.append(struct.pack("!BB", color_index, len(name_bytes)) + name_bytes)
+    return b"".join(parts)
+
+def decode_roster(payload):
+    """[(name, color index)] from a ROSTER payload"""
+    if not payload:
+        raise ProtocolError("empty roster")
+    roster = []
+    offset = 1
+    for _ in range(payload[0]):
+        if offset + 2 > len(payload):
+            raise ProtocolError("truncated roster")
+        color_index, length = struct.unpack_from("!BB", payload, offset)
+        offset += 2
+        if offset + length > len(payload):
+            raise ProtocolError("truncated roster")
+        roster.append((payload[offset:offset + length].decode(errors="replace"), color_index))
+        offset += length
+    if offset != len(payload):
+        raise ProtocolError(f"{len(payload) - offset} stray bytes after roster")
+    return roster
+
+def lookup_lobby(ip_address, code, port=GAME_PORT, timeout=1.0):
+    """Ask a match server front-end which port hosts lobby <code> (None if it isn't one or doesn't know it)"""
+    try:
+        with socket.create_connection((ip_address, port), timeout=timeout) as sock:
+            sock.sendall(encode_frame(MSG_LOOKUP, 0, code.encode("ascii", errors="replace")))
+            msg_type, _, payload = recv_frame(sock, FrameDecoder())
+    except (OSError, ProtocolError):
+        return None  # Nothing there, or a plain host (it hangs up on anything but a hello)
+    if msg_type != MSG_LOBBY or len(payload) != 2:
+        return None
+    lobby_port, = struct.unpack("!H", payload)
+    return lobby_port or None
+
+def parse_address(text, default_port=GAME_PORT):
+    """(ip, port) from "ip" or "ip:port\""""
+    host, _, port = text.rpartition(":")
+    if not host:
+        return text, default_port
+    return host, int(port)
+
+def encode_datagram(sender_index, frame):
+    return DATAGRAM_HEADER.pack(sender_index) + frame
+
+def decode_datagram(data):
+    """(sender index, msg_type, tick, payload) from one UDP datagram"""
+    start = DATAGRAM_HEADER.size + FRAME_HEADER.size
+    if len(data) < start:
+        raise ProtocolError(f"runt datagram ({len(data)} bytes)")
+    sender_index, = DATAGRAM_HEADER.unpack_from(data)
+    version, msg_type, tick, length = FRAME_HEADER.unpack_from(data, DATAGRAM_HEADER.size)
+    if version != PROTOCOL_VERSION or length != len(data) - start:
+        raise ProtocolError(f"bad datagram header (version {version}, length {length})")
+    return sender_index, msg_type, tick, data[start:]
+
+def encode_events(events):
+    return b"".join(EVENT_RECORD.pack(*event) for event in events)
+
+def decode_events(payload):
+    """[(kind, player index, health)] from an EVENT payload"""
+    if len(payload) % EVENT_RECORD.size:
+        raise ProtocolError(f"event message of {len(payload)} bytes")
+    return [EVENT_RECORD.unpack_from(payload, offset) for offset in range(0, len(payload), EVENT_RECORD.size)]
+
+def encode_inputs(inputs):
+    """INPUT payload for [(input tick, buttons, target x, target y)]"""
+    return struct.pack("!B", len(inputs)) + b"".join(INPUT_RECORD.pack(*entry) for entry in inputs)
+
+def decode_inputs(payload):
+    if not payload or len(payload) != 1 + payload[0] * INPUT_RECORD.size:
+        raise ProtocolError(f"input message of {len(payload)} bytes")
+    return [INPUT_RECORD.unpack_from(payload, 1 + i * INPUT_RECORD.size) for i in range(payload[0])]
+
+def decode_input_ack(payload):
+    """(input tick, x, y, velocity y, on ground, facing right)"""
+    if len(payload) != INPUT_ACK_RECORD.size:
+        raise ProtocolError(f"input ack of {len(payload)} bytes")
+    return INPUT_ACK_RECORD.unpack(payload)
+
+def input_buttons(keys, controls):
+    """INPUT_* bits for the movement keys held down"""
+    buttons = 0
+    if keys[controls["left"]]:
+        buttons |= INPUT_LEFT
+    if keys[controls["right"]]:
+        buttons |= INPUT_RIGHT
+    if keys[pygame.K_w]:
+        buttons |= INPUT_UP
+    if keys[pygame.K_s]:
+        buttons |= INPUT_DOWN
+    if keys[pygame.K_SPACE]:
+        buttons |= INPUT_JUMP
+    return buttons
+
+def apply_player_input(player, buttons, platforms):
+    """One tick of movement from INPUT_* bits - the predicting client and the host must run exactly this"""
+    keys = defaultdict(bool)
+    keys[player.controls["left"]] = bool(buttons & INPUT_LEFT)
+    keys[player.controls["right"]] = bool(buttons & INPUT_RIGHT)
+    keys[pygame.K_w] = bool(buttons & INPUT_UP)
+    keys[pygame.K_s] = bool(buttons & INPUT_DOWN)
+    keys[pygame.K_SPACE] = bool(buttons & INPUT_JUMP)
+    player.move(keys, platforms)
+    # Handle jump separately (W key for jump, not Space which is for shooting)
+    if buttons & INPUT_UP and player.on_ground:
+        player.velocity_y = player.jump_power
+        player.on_ground = False
+
+def pack_snapshot(sync_data):
+    """sync_data (see Game.build_sync_data) as {index: (packed fields, {projectile id: packed record})}"""
+    snapshot = {}
+    for player_data in sync_data['all_players']:
+        color = player_data['color']
+        record = PLAYER_FIELDS.pack(
+            player_data['x'], player_data['y'], player_data['health'], player_data['max_health'],
+            player_data['velocity_y'], WEAPON_IDS.get(player_data['weapon'], 0), color[0], color[1], color[2],
+            player_data['facing_right'], player_data['on_ground'])
+        fields = tuple(record[field_slice] for field_slice in FIELD_SLICES)
+        projectiles = {}
+        for pid, px, py, pdx, pdy, pdamage, pcolor, pexplosion in player_data['projectiles']:
+            projectiles[pid] = PROJECTILE_RECORD.pack(pid, px, py, pdx, pdy, pdamage, pcolor[0], pcolor[1], pcolor[2], pexplosion)
+        snapshot[player_data['index']] = (fields, projectiles)
+    return snapshot
+
+def encode_snapshot(sender_index, timestamp, snapshot, baseline_tick=0, baseline=None):
+    """STATE payload for a packed snapshot: everything, or only what changed since baseline.
+    Projectiles are never resent - only their additions and removals are.
+    """
+    parts = []
+    changed = 0
+    for index, (fields, projectiles) in snapshot.items():
+        old = baseline.get(index) if baseline else None
+        if old is None:
+            mask = ALL_FIELDS_MASK
+            added = list(projectiles)
+            removed = []
+        else:
+            old_fields, old_projectiles = old
+            mask = 0
+            for bit, (new_value, old_value) in enumerate(zip(fields, old_fields)):
+                if new_value != old_value:
+                    mask |= 1 << bit
+            added = [pid for pid in projectiles if pid not in old_projectiles]
+            removed = [pid for pid in old_projectiles if pid not in projectiles]
+            if not mask and not added and not removed:
+                continue  # Nothing new about this player
+        added = added[:0xFFFF]
+        removed = removed[:0xFFFF]
+        parts.append(PLAYER_DELTA_HEADER.pack(index, mask))
+        parts.extend(value for bit, value in enumerate(fields) if mask & (1 << bit))
+        parts.append(PROJECTILE_EVENTS_HEADER.pack(len(added), len(removed)))
+        parts.extend(projectiles[pid] for pid in added)
+        parts.extend(PROJECTILE_ID.pack(pid) for pid in removed)
+        changed += 1
+    return STATE_HEADER.pack(sender_index, timestamp, baseline_tick if baseline else 0, changed) + b"".join(parts)
+
+def decode_snapshot(payload, baselines):
+    """Inverse of encode_snapshot, given the receiver's {tick: snapshot} history.
+    Returns (sync_data with only the changed players and fields, the full rebuilt snapshot)
+    """
+    try:
+        sender_index, timestamp, baseline_tick, changed = STATE_HEADER.unpack_from(payload)
+        if baseline_tick:
+            baseline = baselines.get(baseline_tick)
+            if baseline is None:
+                raise ProtocolError(f"delta against unknown snapshot {baseline_tick}")
+        else:
+            baseline = {}
+        offset = STATE_HEADER.size
+        snapshot = dict(baseline)
+        all_players = []
+        for _ in range(changed):
+            index, mask = PLAYER_DELTA_HEADER.unpack_from(payload, offset)
+            offset += PLAYER_DELTA_HEADER.size
+            old_fields, old_projectiles = baseline.get(index, (None, {}))
+            if mask > ALL_FIELDS_MASK or (old_fields is None and mask != ALL_FIELDS_MASK):
+                raise ProtocolError(f"bad field mask {mask:#x} for player {index}")
+            if mask == ALL_FIELDS_MASK:
+                # Whole record - one unpack
+                x, y, health, max_health, velocity_y, weapon_id, r, g, b, facing_right, on_ground = PLAYER_FIELDS.unpack_from(payload, offset)
+                record = payload[offset:offset + PLAYER_FIELDS.size]
+                offset += PLAYER_FIELDS.size
+                fields = [record[field_slice] for field_slice in FIELD_SLICES]
+                player_data = {'index': index, 'x': x, 'y': y, 'health': health, 'max_health': max_health,
+                               'velocity_y': velocity_y, 'weapon': weapon_id, 'color': (r, g, b),
+                               'facing_right': facing_right, 'on_ground': on_ground}
+            else:
+                fields = list(old_fields)
+                player_data = {'index': index}
+                for bit, (key, field) in enumerate(SNAPSHOT_FIELDS):
+                    if mask & (1 << bit):
+                        value = field.unpack_from(payload, offset)
+                        fields[bit] = payload[offset:offset + field.size]
+                        offset += field.size
+                        player_data[key] = value if key == "color" else value[0]
+            if 'weapon' in player_data:
+                if player_data['weapon'] >= len(WEAPON_NAMES):
+                    raise ProtocolError(f"unknown weapon id {player_data['weapon']}")
+                player_data['weapon'] = WEAPON_NAMES[player_data['weapon']]
+            
+            added_count, removed_count = PROJECTILE_EVENTS_HEADER.unpack_from(payload, offset)
+            offset += PROJECTILE_EVENTS_HEADER.size
+            projectiles = dict(old_projectiles)
+            added = []
+            for _ in range(added_count):
+                pid, px, py, pdx, pdy, pdamage, pr, pg, pb, pexplosion = PROJECTILE_RECORD.unpack_from(payload, offset)
+                raw = payload[offset:offset + PROJECTILE_RECORD.size]
+                offset += PROJECTILE_RECORD.size
+                projectiles[pid] = raw
+                added.append((pid, px, py, pdx, pdy, pdamage, (pr, pg, pb), pexplosion))
+            removed = []
+            for _ in range(removed_count):
+                pid, = PROJECTILE_ID.unpack_from(payload, offset)
+                offset += PROJECTILE_ID.size
+                projectiles.pop(pid, None)
+                removed.append(pid)
+            
+            if baseline_tick:
+                player_data['projectiles_added'] = added
+                player_data['projectiles_removed'] = removed
+            else:
+                player_data['projectiles'] = added  # Full snapshot replaces the whole list
+            snapshot[index] = (tuple(fields), projectiles)
+            all_players.append(player_data)
+    except struct.error as e:
+        raise ProtocolError(f"truncated state message: {e}")
+    if offset != len(payload):
+        raise ProtocolError(f"{len(payload) - offset} stray bytes after state message")
+    return {'sender_index': sender_index, 'all_players': all_players, 'timestamp': timestamp}, snapshot
+
+def encode_sync_data(sync_data):
+    """Full (non-delta) STATE payload for sync_data"""
+    return encode_snapshot(sync_data['sender_index'], sync_data['timestamp'], pack_snapshot(sync_data))
+
+def decode_sync_data(payload):
+    """sync_data from a full STATE payload"""
+    return decode_snapshot(payload, {})[0]
+
+def relevance_priorities(players, viewer_index, interactions, now):
+    """How much each player matters to the client playing players[viewer_index], as the share of snapshots it
+    should be updated in: everyone near, anyone it shot at or got shot at by in the last RELEVANCE_INTERACTION_TIME
+    (interactions: (index, index) -> time, see Game.note_interactions) and its own player every time, the farther
+    away the less often, and off-screen players less again. None (everything, every time) for a client without
+    a player or in battles of fewer than RELEVANCE_MIN_PLAYERS."""
+    if len(players) < RELEVANCE_MIN_PLAYERS or not 0 <= viewer_index < len(players):
+        return None
+    viewer = players[viewer_index]
+    center = (viewer.x + viewer.width / 2, viewer.y + viewer.height / 2)
+    screen_rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    priorities = {}
+    for index, player in enumerate(players):
+        if index == viewer_index:
+            priorities[index] = 4.0  # Own player goes first
+        elif now - interactions.get((viewer_index, index), -RELEVANCE_INTERACTION_TIME) < RELEVANCE_INTERACTION_TIME:
+            priorities[index] = 1.0
+        else:
+            distance = math.dist(center, (player.x + player.width / 2, player.y + player.height / 2))
+            priority = 1.0 if distance <= RELEVANCE_NEAR else max(RELEVANCE_MIN_PRIORITY, (RELEVANCE_NEAR / distance) ** 2)
+            if not screen_rect.colliderect((player.x, player.y, player.width, player.height)):
+                priority *= RELEVANCE_OFFSCREEN_FACTOR
+            priorities[index] = priority
+    return priorities
+
+class SnapshotEncoder:
+    """Sending side of state sync to one peer - diffs against the newest snapshot the peer acknowledged"""
+    def __init__(self):
+        self.sent = OrderedDict()  # tick -> packed snapshot, oldest first
+        self.acked_tick = 0
+        self.priority = defaultdict(float)  # Player index -> priority accumulated since its last update (see select)
+        self.held = 0  # Player updates put off for priority or budget
+    
+    def ack(self, tick):
+        if tick > self.acked_tick and tick in self.sent:
+            self.acked_tick = tick
+            # The peer never gets a delta against anything older again
+            while next(iter(self.sent)) < tick:
+                self.sent.popitem(last=False)
+    
+    def encode(self, tick, sync_data, snapshot=None, priorities=None, budget=None):
+        """STATE payload for sync_data (pass its pack_snapshot() when sending one snapshot to many peers).
+        With priorities ({index: share of snapshots}, see relevance_priorities) and/or a budget in bytes,
+        only the players that are due and fit get updated (see select)."""
+        if snapshot is None:
+            snapshot = pack_snapshot(sync_data)
+        baseline = self.sent.get(self.acked_tick)
+        if baseline and (priorities is not None or budget is not None):
+            snapshot = self.select(snapshot, baseline, priorities or {}, budget)
+        payload = encode_snapshot(sync_data['sender_index'], sync_data['timestamp'], snapshot,
+                                  self.acked_tick, baseline)
+        self.sent[tick] = snapshot
+        if len(self.sent) > SNAPSHOT_HISTORY:
+            # Peer is way behind on acks - it gets full snapshots until it catches up
+            self.sent.popitem(last=False)
+        return payload
+    
+    def select(self, snapshot, baseline, priorities, budget):
+        """The snapshot to send: players whose accumulated priority reached 1 as they are now, highest first while
+        their deltas fit in budget bytes, and everyone else as in baseline - which encodes to nothing, so the peer
+        keeps what it has. Players put off keep accumulating and go first next time."""
+        selected = {}
+        due = []
+        for index, record in snapshot.items():
+            old = baseline.get(index)
+            if old is None or (record[0] == old[0] and record[1].keys() == old[1].keys()):
+                selected[index] = record  # New to the peer (must be sent), or nothing to send anyway
+                continue
+            self.priority[index] += priorities.get(index, 1.0)
+            if self.priority[index] >= 1.0:
+                due.append(index)
+            else:
+                selected[index] = old
+                self.held += 1
+        spent = 0
+        for index in sorted(due, key=lambda index: -self.priority[index]):
+            if budget is not None:
+                cost = len(encode_snapshot(0, 0, {index: snapshot[index]}, 1, baseline)) - STATE_HEADER.size
+                if spent and spent + cost > budget:
+                    # Doesn't fit this time (the first one always goes, so a big update can't be starved)
+                    selected[index] = baseline[index]
+                    self.held += 1
+                    continue
+                spent += cost
+            selected[index] = snapshot[index]
+            self.priority[index] = 0.0
+        return selected
+
+class SnapshotDecoder:
+    """Receiving side of state sync from one peer - rebuilds snapshots from deltas and keeps them as baselines"""
+    def __init__(self):
+        self.received = OrderedDict()  # tick -> rebuilt snapshot, oldest first
+        self.latest_tick = 0
+        self.stale = 0  # Snapshots dropped for arriving after a newer one (UDP reordering)
+        self.decoded = 0  # Snapshots applied
+    
+    def decode(self, tick, payload):
+        """sync_data for a STATE frame (only changed players/fields), or None if it's older than what we have"""
+        if tick <= self.latest_tick:
+            self.stale += 1
+            return None
+        sync_data, snapshot = decode_snapshot(payload, self.received)
+        baseline_tick = STATE_HEADER.unpack_from(payload)[2]
+        # The sender only moves its baseline forward, so older snapshots are never needed again
+        while self.received and (next(iter(self.received)) < baseline_tick or len(self.received) >= SNAPSHOT_HISTORY):
+            self.received.popitem(last=False)
+        self.received[tick] = snapshot
+        self.latest_tick = tick
+        self.decoded += 1
+        return sync_data
+
+class TickScheduler:
+    """Paces a loop at a fixed rate against absolute deadlines, so sleep overshoot doesn't pile up as drift"""
+    def __init__(self, rate, clock=time.perf_counter):
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.clock = clock
+        self.next_tick = clock()
+        self.last_tick = None
+        self.intervals = deque(maxlen=rate * 5)  # Seconds between the last ticks
+        self.ticks = 0
+        self.skipped = 0
+    
+    def time_until_next(self):
+        return max(0.0, self.next_tick - self.clock())
+    
+    def due(self):
+        return self.clock() >= self.next_tick
+    
+    def tick(self):
+        """Mark a due tick as run and schedule the next one"""
+        now = self.clock()
+        if self.last_tick is not None:
+            self.intervals.append(now - self.last_tick)
+        self.last_tick = now
+        self.ticks += 1
+        self.next_tick += self.period
+        if now - self.next_tick > self.period:
+            # Fell more than a tick behind (stalled thread, sleeping laptop) - skip ahead instead of bursting
+            missed = int((now - self.next_tick) / self.period)
+            self.skipped += missed
+            self.next_tick += missed * self.period
+    
+    def stats(self):
+        """Achieved rate and jitter (spread of the tick intervals) over the last few seconds"""
+        if not self.intervals:
+            return {"target_hz": self.rate, "rate_hz": 0.0, "jitter_ms": 0.0, "max_interval_ms": 0.0, "skipped": self.skipped}
+        mean = sum(self.intervals) / len(self.intervals)
+        variance = sum((interval - mean) ** 2 for interval in self.intervals) / len(self.intervals)
+        return {
+            "target_hz": self.rate,
+            "rate_hz": round(1.0 / mean, 2) if mean > 0 else 0.0,
+            "jitter_ms": round(math.sqrt(variance) * 1000, 3),
+            "max_interval_ms": round(max(self.intervals) * 1000, 2),
+            "skipped": self.skipped
+        }
+
+class NetworkTelemetry:
+    """Counters for our side of a LAN battle: bytes and messages in and out, decode and send errors,
+    round trip per peer and how long we wait between snapshots. The network thread counts, the game loop
+    turns them into a row per TELEMETRY_INTERVAL (see Game.sample_telemetry) for the F4 overlay and --telemetry-log."""
     def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        """Start from zero (every battle)"""
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages_in = 0
+        self.messages_out = 0
+        self.decode_errors = 0
+        self.send_errors = 0
+        self.last_error = None
+        self.pending_acks = OrderedDict()  # (peer, tick) -> when it was first sent, oldest first
+        self.rtt = {}  # Peer -> smoothed round trip in seconds
+        self.last_snapshot = None  # When the newest snapshot arrived
+        self.max_snapshot_gap = 0.0  # Longest wait between two snapshots since the last row
+        self.history = deque(maxlen=TELEMETRY_HISTORY)
+        self.last_sample = time.perf_counter()
+        self.last_counts = (0, 0, 0, 0)
+    
+    def count_in(self, size=0, messages=0):
+        self.bytes_in += size
+        self.messages_in += messages
+    
+    def count_out(self, size, messages=1):
+        self.bytes_out += size
+        self.messages_out += messages
+    
+    def expect_ack(self, peer, tick):
+        """Time how long until peer acknowledges tick (only its first send counts)"""
+        if (peer, tick) not in self.pending_acks:
+            self.pending_acks[(peer, tick)] = time.perf_counter()
+            if len(self.pending_acks) > TELEMETRY_PENDING_ACKS:
+                self.pending_acks.popitem(last=False)
+    
+    def acked(self, peer, tick):
+        sent = self.pending_acks.pop((peer, tick), None)
+        if sent is not None:
+            sample = time.perf_counter() - sent
+            rtt = self.rtt.get(peer)
+            self.rtt[peer] = sample if rtt is None else rtt * 0.875 + sample * 0.125  # Smoothed like TCP's
+    
+    def snapshot_received(self):
+        now = time.perf_counter()
+        if self.last_snapshot is not None:
+            self.max_snapshot_gap = max(self.max_snapshot_gap, now - self.last_snapshot)
+        self.last_snapshot = now
+    
+    def error(self, kind, error):
+        """A frame we couldn't decode ("decode") or send ("send") - counted instead of silently dropped"""
+        if kind == "decode":
+            self.decode_errors += 1
+        else:
+            self.send_errors += 1
+        self.last_error = f"{kind}: {error}"
+    
+    def sample(self, **fields):
+        """The row for the time since the last one: per-second rates and totals, plus the given fields"""
+        now = time.perf_counter()
+        elapsed = max(now - self.last_sample, 0.001)
+        counts = (self.bytes_in, self.bytes_out, self.messages_in, self.messages_out)
+        rates = [round((count - last) / elapsed, 1) for count, last in zip(counts, self.last_counts)]
+        self.last_sample, self.last_counts = now, counts
+        row = {
+            "time": round(time.time(), 3),
+            "bytes_in_per_s": rates[0],
+            "bytes_out_per_s": rates[1],
+            "messages_in_per_s": rates[2],
+            "messages_out_per_s": rates[3],
+            "decode_errors": self.decode_errors,
+            "send_errors": self.send_errors,
+            "snapshot_age_ms": None if self.last_snapshot is None else round((now - self.last_snapshot) * 1000, 1),
+            "max_snapshot_gap_ms": round(self.max_snapshot_gap * 1000, 1)
+        }
+        self.max_snapshot_gap = 0.0
+        row.update(fields)
+        self.history.append(row)
+        return row
+
+def write_telemetry_row(path, row):
+    """Append a telemetry row to a .csv file (header first if it's new) or else a JSON-lines file"""
+    if path.endswith(".csv"):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(row))
+            if new_file:
+                writer.writeheader()
+            writer.writerow(dict(row, clients=json.dumps(row["clients"])))
+    else:
+        with open(path, "a") as f:
+            f.write(json.dumps(row) + "\n")
+
+class SnapshotBuffer:
+    """Timestamped positions of one remote player, oldest first"""
+    def __init__(self, size=SNAPSHOT_BUFFER_SIZE):
+        self.samples = deque(maxlen=size)  # (timestamp, x, y)
+    
+    def add(self, timestamp, x, y):
+        if self.samples and timestamp <= self.samples[-1][0]:
+            return  # Late or duplicate snapshot
+        self.samples.append((timestamp, x, y))
+    
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+    
+    def sample(self, render_time, max_extrapolation=MAX_EXTRAPOLATION):
+        """(x, y) at render_time - interpolated between the snapshots around it, or carried on
+        along the last movement for at most max_extrapolation past the newest one. None if empty."""
+        samples = self.samples
+        if not samples:
+            return None
+        newest = samples[-1]
+        if render_time >= newest[0]:
+            if len(samples) < 2:
+                return newest[1], newest[2]
+            previous = samples[-2]
+            ahead = min(render_time - newest[0], max_extrapolation)
+            span = newest[0] - previous[0]
+            return (newest[1] + (newest[1] - previous[1]) / span * ahead,
+                    newest[2] + (newest[2] - previous[2]) / span * ahead)
+        # Usually the wanted pair is one of the last few, so walk back from the newest
+        for i in range(len(samples) - 2, -1, -1):
+            older = samples[i]
+            if older[0] <= render_time:
+                newer = samples[i + 1]
+                t = (render_time - older[0]) / (newer[0] - older[0])
+                return older[1] + (newer[1] - older[1]) * t, older[2] + (newer[2] - older[2]) * t
+        return samples[0][1], samples[0][2]
+
+class RemotePlayerInterpolator:
+    """SnapshotBuffers for every remote player, drawn `delay` seconds behind the sender's clock so there's
+    (nearly) always a newer snapshot to move towards, however unevenly the snapshots arrive"""
+    def __init__(self, delay=INTERPOLATION_DELAY, max_extrapolation=MAX_EXTRAPOLATION):
+        self.delay = delay
+        self.max_extrapolation = max_extrapolation
+        self.buffers = defaultdict(SnapshotBuffer)  # player index -> SnapshotBuffer
+        # Local clock minus sender clock, as seen by the least delayed recent snapshots
+        self.clock_offsets = deque(maxlen=SNAPSHOT_BUFFER_SIZE * 4)
+        self.clock_offset = None
+        self.lock = threading.Lock()  # Snapshots come in on the network thread, positions are read by the game loop
+    
+    def add_snapshot(self, timestamp, positions, now=None):
+        """positions: {player index: (x, y)} as of the sender's timestamp"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.clock_offsets.append(now - timestamp)
+            self.clock_offset = min(self.clock_offsets)
+            for index, (x, y) in positions.items():
+                self.buffers[index].add(timestamp, x, y)
+    
+    def latest_position(self, index):
+        with self.lock:
+            latest = self.buffers[index].latest() if index in self.buffers else None
+        return None if latest is None else (latest[1], latest[2])
+    
+    def positions(self, now=None):
+        """{player index: (x, y)} to show right now"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if self.clock_offset is None:
+                return {}
+            render_time = now - self.clock_offset - self.delay
+            return {index: buffer.sample(render_time, self.max_extrapolation)
+                    for index, buffer in self.buffers.items() if buffer.samples}
+
+class ClientConnection:
+    """Host side of one client's TCP connection, served by the host's asyncio loop (see Game.run_host_loop).
+    Quacks like a socket for the rest of the game: sendall() only queues the frame and the client's own
+    writer task sends it, waiting for the client whenever its buffer is full - a slow client holds up nobody else.
+    While it waits, a newer state or input ack replaces the queued one; a client that stays backed up
+    for SLOW_CLIENT_TIMEOUT (or piles up SEND_QUEUE_LIMIT frames) gets dropped."""
+    
+    def __init__(self, loop, reader, writer):
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+        self.decoder = FrameDecoder()
+        self.address = writer.get_extra_info("peername")
+        self.name = ""
+        self.outbox = deque()  # [message type, frame] waiting to be written
+        self.outbox_ready = asyncio.Event()
+        self.closed = False
+        self.backed_up_since = None  # When frames started waiting behind a full buffer
+        self.lagging = False  # Flagged once a state had to be replaced
+        self.max_depth = 0
+        self.replaced = 0  # Frames superseded before they were sent
+        writer.transport.set_write_buffer_limits(high=SEND_BUFFER_HIGH)
+    
+    def sendall(self, frame):
+        """Queue one frame for this client (safe from any thread)"""
+        if self.closed:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.enqueue, frame)
+        except RuntimeError:
+            self.closed = True  # Loop already shut down
+    
+    def enqueue(self, frame):
+        if self.closed:
+            return
+        msg_type = frame[1] if len(frame) > 1 else None
+        if self.outbox:
+            if self.backed_up_since is None:
+                self.backed_up_since = time.time()
+            elif time.time() - self.backed_up_since > SLOW_CLIENT_TIMEOUT:
+                print(f"⚠️ Dropping {self.name or self.address[0]}: backed up for {SLOW_CLIENT_TIMEOUT:.0f}s")
+                self.drop()
+                return
+        if msg_type in REPLACEABLE_MESSAGES:
+            # Only the newest one matters (a newer state is a delta against an acked one, not the queued one)
+            for entry in self.outbox:
+                if entry[0] == msg_type:
+                    entry[1] = frame
+                    self.replaced += 1
+                    if not self.lagging:
+                        self.lagging = True
+                        print(f"⚠️ {self.name or self.address[0]} is falling behind - sending only its newest state")
+                    return
+        self.outbox.append([msg_type, frame])
+        self.max_depth = max(self.max_depth, len(self.outbox))
+        if len(self.outbox) > SEND_QUEUE_LIMIT:
+            print(f"⚠️ Dropping {self.name or self.address[0]}: {len(self.outbox)} frames waiting")
+            self.drop()
+            return
+        self.outbox_ready.set()
+    
+    async def write_loop(self):
+        try:
+            while True:
+                await self.outbox_ready.wait()
+                while self.outbox:
+                    _, frame = self.outbox.popleft()
+                    self.writer.write(frame)
+                    await self.writer.drain()  # Backpressure: wait until this client takes it
+                self.outbox_ready.clear()
+                self.backed_up_since = None
+        except (ConnectionError, OSError):
+            self.closed = True
+    
+    def stats(self):
+        """Send queue depth right now and at worst, frames replaced, bytes in the socket buffer"""
+        return {"depth": len(self.outbox), "max_depth": self.max_depth, "replaced": self.replaced,
+                "buffered_bytes": self.writer.transport.get_write_buffer_size() if not self.closed else 0,
+                "lagging": self.lagging, "dropped": self.closed}
+    
+    def close(self):
+        """Hang up (safe from any thread)"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.loop.call_soon_threadsafe(self.writer.close)
+        except RuntimeError:
+            pass
+    
+    def drop(self):
+        """Cut off a client that stopped keeping up - unlike close(), without waiting for its buffer to empty"""
+        self.closed = True
+        self.outbox.clear()
+        self.writer.transport.abort()
+
+class LinkConditions:
+    """How bad the network between the clients and the host is (the same in both directions)"""
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, reorder=0.0, bandwidth=None):
+        self.latency = latency  # Seconds every packet takes
+        self.jitter = jitter  # Up to this many extra seconds per packet, at random
+        self.loss = loss  # Chance a datagram is lost (a TCP chunk gets resent instead)
+        self.reorder = reorder  # Chance a packet is held back behind the ones sent after it
+        self.bandwidth = bandwidth  # Bytes per second shared by everyone (None = unlimited)
+    
+    def __str__(self):
+        bandwidth = "unlimited" if self.bandwidth is None else f"{self.bandwidth / 1000:g} kB/s"
+        return (f"{self.latency * 1000:g} ms +{self.jitter * 1000:g} ms jitter, {self.loss:.0%} loss, "
+                f"{self.reorder:.0%} reordered, {bandwidth}")
+
+# Scripted network scenarios for the simulator: (seconds, conditions) phases that repeat (None = forever)
+NETSIM_SCENARIOS = {
+    "lan": [(None, LinkConditions(latency=0.001))],
+    "wifi": [(None, LinkConditions(latency=0.005, jitter=0.015, loss=0.01, reorder=0.01))],
+    "classroom": [(None, LinkConditions(latency=0.02, jitter=0.04, loss=0.05, reorder=0.03, bandwidth=32000))],
+    "congested": [(None, LinkConditions(latency=0.01, jitter=0.02, loss=0.02, bandwidth=2000))],
+    "spikes": [(6.0, LinkConditions(latency=0.005, jitter=0.015, loss=0.01)),
+               (2.0, LinkConditions(latency=0.25, jitter=0.1, loss=0.3, reorder=0.1))],
+    "dropouts": [(6.0, LinkConditions(latency=0.005, jitter=0.015, loss=0.01)),
+                 (1.0, LinkConditions(loss=1.0))],
+}
+
+class NetworkSimulator:
+    """Local proxy for trying LAN play on a bad network: clients join it instead of the host (--join 127.0.0.1:55665)
+    and it forwards their TCP lobby connection and their UDP battle datagrams - both on listen_port, like the host -
+    to the host and back, through a scripted scenario of LinkConditions phases.
+    Datagrams are lost, delayed and reordered one by one. TCP data is never lost or reordered, it arrives late:
+    a "lost" chunk is resent after NETSIM_RETRANSMIT_TIMEOUT and holds up everything behind it, like real TCP."""
+    
+    def __init__(self, target_ip, target_port=GAME_PORT, listen_port=GAME_PORT + 1, scenario="wifi", seed=None):
+        self.target = (socket.gethostbyname(target_ip), target_port)
+        self.listen_port = listen_port
+        self.phases = NETSIM_SCENARIOS[scenario] if isinstance(scenario, str) else list(scenario)
+        self.rng = random.Random(seed)
+        self.loop = None
+        self.thread = None
+        self.stop_event = None
+        self.ready = threading.Event()
+        self.error = None
+        self.started = 0.0
+        self.phase = None
+        self.busy_until = {"up": 0.0, "down": 0.0}  # When the bandwidth-capped link is free again, per direction
+        self.udp_socket = None
+        self.udp_links = {}  # Client's UDP address -> our socket towards the host for it
+        self.stats = {"tcp": {"chunks": 0, "bytes": 0, "retransmits": 0, "reordered": 0},
+                      "udp": {"datagrams": 0, "bytes": 0, "lost": 0, "reordered": 0, "queue_drops": 0}}
+    
+    def start(self):
+        """Run the proxy on its own thread (returns once it's listening)"""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait(5.0)
+        if self.error is not None:
+            raise self.error
+    
+    def stop(self):
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:
+                pass  # Loop already gone
+            self.thread.join(2.0)
+    
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.serve())
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+        finally:
+            self.loop.close()
+    
+    async def serve(self):
+        self.stop_event = asyncio.Event()
+        server = await asyncio.start_server(self.handle_tcp, "0.0.0.0", self.listen_port)
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.udp_socket.bind(("0.0.0.0", self.listen_port))
+        except OSError:
+            server.close()
+            self.udp_socket.close()
+            raise
+        self.udp_socket.setblocking(False)
+        self.loop.add_reader(self.udp_socket, self.relay_datagrams, self.udp_socket, None)
+        self.started = self.loop.time()
+        print(f"🌐 Network simulator on port {self.listen_port} -> {self.target[0]}:{self.target[1]}")
+        self.ready.set()
+        try:
+            await self.stop_event.wait()
+        finally:
+            server.close()
+            for sock in [self.udp_socket] + list(self.udp_links.values()):
+                self.loop.remove_reader(sock)
+                sock.close()
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def conditions(self):
+        """Conditions of the scenario phase we're in now"""
+        elapsed = self.loop.time() - self.started
+        if all(seconds is not None for seconds, _ in self.phases):
+            elapsed %= sum(seconds for seconds, _ in self.phases)
+        for index, (seconds, conditions) in enumerate(self.phases):
+            if seconds is None or elapsed < seconds:
+                break
+            elapsed -= seconds
+        if index != self.phase:
+            self.phase = index
+            print(f"🌐 Netsim phase {index + 1}/{len(self.phases)}: {conditions}")
+        return conditions
+    
+    def packet_delay(self, conditions, size, direction, path):
+        """Seconds until a packet sent now arrives (waiting for the bandwidth cap, latency, jitter, being held back),
+        or None if the capped link has NETSIM_QUEUE_LIMIT queued already and the datagram gets dropped"""
+        now = self.loop.time()
+        delay = conditions.latency + self.rng.uniform(0, conditions.jitter)
+        if conditions.bandwidth:
+            departure = max(now, self.busy_until[direction]) + size / conditions.bandwidth
+            if path == "udp" and departure - now > NETSIM_QUEUE_LIMIT:
+                self.stats["udp"]["queue_drops"] += 1
+                return None
+            self.busy_until[direction] = departure
+            delay += departure - now
+        if self.rng.random() < conditions.reorder:
+            delay += NETSIM_REORDER_DELAY
+            self.stats[path]["reordered"] += 1
+        return delay
+    
+    async def handle_tcp(self, reader, writer):
+        """A client connected: connect to the host for it and pump both ways"""
+        try:
+            host_reader, host_writer = await asyncio.open_connection(*self.target)
+        except OSError as e:
+            print(f"🌐 Netsim can't reach the host at {self.target[0]}:{self.target[1]}: {e}")
+            writer.close()
+            return
+        try:
+            await asyncio.gather(self.pump(reader, host_writer, "up"), self.pump(host_reader, writer, "down"))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            host_writer.close()
+            writer.close()
+    
+    async def pump(self, reader, writer, direction):
+        """Forward one direction of a TCP connection, keeping the chunks in order"""
+        stats = self.stats["tcp"]
+        last_delivery = self.loop.time()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                stats["chunks"] += 1
+                stats["bytes"] += len(data)
+                conditions = self.conditions()
+                delay = self.packet_delay(conditions, len(data), direction, "tcp")
+                timeout = NETSIM_RETRANSMIT_TIMEOUT
+                for _ in range(4):
+                    if self.rng.random() >= conditions.loss:
+                        break
+                    delay += timeout
+                    timeout *= 2
+                    stats["retransmits"] += 1
+                # Never before the chunk in front of it (the tiny step keeps equal times in order)
+                last_delivery = max(self.loop.time() + delay, last_delivery + 0.000001)
+                self.loop.call_at(last_delivery, self.deliver_chunk, writer, data)
+        except OSError:
+            pass  # Connection reset
+        # Hang up once everything that was sent has arrived
+        await asyncio.sleep(max(0.0, last_delivery - self.loop.time()) + 0.001)
+        writer.close()
+    
+    @staticmethod
+    def deliver_chunk(writer, data):
+        if not writer.is_closing():
+            writer.write(data)
+    
+    def relay_datagrams(self, sock, client_address):
+        """Readable callback: datagrams from clients (client_address None) go to the host, the host's go back to client_address"""
+        while True:
+            try:
+                data, address = sock.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue  # e.g. an earlier datagram reported as unreachable
+            if client_address is None:
+                link = self.udp_links.get(address)
+                if link is None:
+                    # One socket per client, so the host tells them apart and we know where its replies go
+                    link = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    link.bind(("0.0.0.0", 0))
+                    link.setblocking(False)
+                    self.loop.add_reader(link, self.relay_datagrams, link, address)
+                    self.udp_links[address] = link
+                self.send_datagram(link, data, self.target, "up")
+            else:
+                self.send_datagram(self.udp_socket, data, client_address, "down")
+    
+    def send_datagram(self, sock, data, address, direction):
+        stats = self.stats["udp"]
+        stats["datagrams"] += 1
+        stats["bytes"] += len(data)
+        conditions = self.conditions()
+        if self.rng.random() < conditions.loss:
+            stats["lost"] += 1
+            return
+        delay = self.packet_delay(conditions, len(data), direction, "udp")
+        if delay is not None:
+            self.loop.call_at(self.loop.time() + delay, self.deliver_datagram, sock, data, address)
+    
+    @staticmethod
+    def deliver_datagram(sock, data, address):
+        try:
+            sock.sendto(data, address)
+        except OSError:
+            pass  # Closed meanwhile, or the other end is gone
+    
+    def print_stats(self):
+        tcp, udp = self.stats["tcp"], self.stats["udp"]
+        print(f"🌐 Netsim: TCP {tcp['chunks']} chunks ({tcp['retransmits']} resent, {tcp['reordered']} held back), "
+              f"UDP {udp['datagrams']} datagrams ({udp['lost']} lost, {udp['queue_drops']} over the bandwidth cap, "
+              f"{udp['reordered']} reordered)")
+
+class Game:
+    def __init__(self, headless=False):
+        # Headless games simulate battles without a window, textures or save file
+        self.headless = headless
+        self.player1_autopilot = headless  # Player 1 is driven by the CPU AI instead of the keyboard
+        if not headless:
+            init_display()
+        
         # Start with username input, but will skip if we have saved username
         self.state = GameState.USERNAME_INPUT
         self.has_saved_username = False  # Will be set in load_progress
@@ -864,8 +2578,48 @@ class Game:
         self.is_network_game = False
         self.is_host = False
         self.network_socket = None
-        self.client_connections = []  # List of client connections (for host)
-        self.network_thread = None
+        self.client_connections = []  # ClientConnection per client, in player order (for host)
+        self.host_loop = None  # asyncio loop running all host networking (see run_host_loop)
+        self.host_stop = None  # asyncio.Event that shuts it down
+        self.host_decoder = FrameDecoder()  # Frames from the host (for clients)
+        self.snapshot_encoders = {}  # Peer socket -> SnapshotEncoder (delta state we send)
+        self.snapshot_decoders = {}  # Peer socket -> SnapshotDecoder (delta state we receive)
+        self.udp_socket = None  # Battle state transport (host: bound to GAME_PORT)
+        self.peer_udp_addresses = {}  # Peer socket -> UDP address its state goes to
+        self.event_health = {}  # Player index -> health at the last hit/knockout event (for host)
+        self.interpolation_delay = INTERPOLATION_DELAY
+        self.remote_interpolator = None  # RemotePlayerInterpolator while a client is in battle
+        # Client-side prediction: inputs we simulated ourselves, replayed on top of each host correction
+        self.input_tick = 0
+        self.input_history = deque(maxlen=INPUT_HISTORY)  # (input tick, buttons, target x, target y)
+        self.acked_input_tick = 0
+        self.pending_shot = None  # Mouse target clicked since the last tick
+        self.pending_reconcile = None  # Newest INPUT_ACK from the host, applied by the game loop
+        self.pending_projectiles = deque()  # (player, full list?, removed ids, added, speed) from snapshots, applied by the game loop
+        self.sync_lock = threading.Lock()
+        self.host_sync_data = None  # Host: newest build_sync_data from the game loop, waiting for host_sync_loop to send it
+        self.prediction_error = 0.0  # Pixels the last correction moved our player
+        self.host_health = {}  # Player index -> health according to the host
+        # Host side: client inputs waiting to be simulated, and what the last simulated one led to
+        self.remote_inputs = {}  # Player index -> deque of (input tick, buttons, target x, target y)
+        self.last_input_tick = {}  # Player index -> newest input tick received
+        self.input_acks = {}  # Player index -> INPUT_ACK_RECORD values
+        self.peer_indexes = {}  # Peer socket -> player index
+        self.lost_peers = set()  # Peers whose connection dropped during the battle
+        # Dedicated server: no window and no player of its own - clients are players 0, 1, 2...
+        self.dedicated_server = False
+        self.first_client_index = 1  # Host is player 0 otherwise
+        self.match_over_time = None  # When a dedicated server's match was decided
+        self.game_port = GAME_PORT  # TCP lobby + UDP battle port (host: ours, client: the host's)
+        self.network_tick = 0  # Counts sent state messages
+        self.network_send_rate = NETWORK_SEND_RATE
+        self.network_sync_stats = {}  # Latest TickScheduler.stats() of the sync loop
+        self.telemetry = NetworkTelemetry()
+        self.last_interaction = {}  # Host: (player index, player index) -> time one last shot at the other (see relevance_priorities)
+        self.known_projectiles = {}  # Host: player index -> its projectiles in the last snapshot
+        self.show_telemetry = False  # F4 network overlay during battles
+        self.send_queue_stats = {}  # Host: client name -> ClientConnection.stats()
+        self.network_thread = None  # Host: runs host_loop; client: unused
         self.broadcast_socket = None
         self.opponent_data = None
         self.cpu_shoot_timer = 0
@@ -953,7 +2707,8 @@ class Game:
         self.player_colors = [RED, BLUE, GREEN, YELLOW, PURPLE, ORANGE, CYAN, (255, 100, 150), (150, 255, 100), (255, 200, 100)]
         
         # Load saved progress (after both players are created)
-        self.load_progress()
+        if not headless:
+            self.load_progress()
         
         # If we have a saved username, skip straight to menu
         if self.has_saved_username:
@@ -969,6 +2724,23 @@ class Game:
         self.platforms = []
         self.generate_map_platforms()
         
+        # Collision grid for projectiles, rebuilt every tick
+        self.spatial_hash = SpatialHash()
+        
+        # Optional NumPy store holding every player's projectiles
+        self.projectile_store = ProjectileArrays() if NUMPY_PROJECTILES and np is not None else None
+        
+        # Pre-rendered battle backgrounds (one per map and screen size)
+        self.battle_background_cache = {}
+        self.battle_background = None
+        
+        # Dirty-rect rendering (battle only): areas drawn last frame get repainted from the background
+        self.dirty_rect_mode = DIRTY_RECT_RENDERING
+        self.battle_full_redraw = True
+        self.previous_dirty_rects = []
+        self.display_update_rects = None  # None = flip the whole screen
+        self.last_drawn_state = None
+        
     def assign_random_roles(self):
         """Randomly assign roles to all players before battle"""
         # All available roles (not just team-only ones for now)
@@ -986,7 +2758,7 @@ class Game:
             self.player2.build_resources = ROLES[self.player2.role].get("resources", 0)
             print(f"🤖 CPU assigned role: {self.player2.role}")
     
-    def reset_battle(self):
+    def reset_battle(self, map_name=None):
         # Apply vehicle stats to ensure size/health are correct
         self.apply_vehicle_stats(self.player1)
         self.apply_vehicle_stats(self.player2)
@@ -1002,10 +2774,12 @@ class Game:
         self.player2.y = self.player2.ground_y  # Start on ground
         self.player2.velocity_y = 0
         self.player2.on_ground = True
-        self.player1.projectiles = []
-        self.player2.projectiles = []
-        self.player1.explosions = []
-        self.player2.explosions = []
+        self.player1.clear_projectiles()
+        self.player2.clear_projectiles()
+        self.player1.clear_explosions()
+        self.player2.clear_explosions()
+        if EXPLOSION_PARTICLES is not None:
+            EXPLOSION_PARTICLES.clear()
         
         # Clear Engineer structures and reset role-specific attributes
         self.player1.structures = []
@@ -1036,15 +2810,23 @@ class Game:
         # Reset collectibles
         self.collectibles = []
         self.collectible_spawn_timer = 0
+        self.match_over_time = None
         
-        # Choose random map
-        map_names = list(MAPS.keys())
-        self.current_map = random.choice(map_names)
+        # Choose random map (unless one was asked for)
+        if map_name is None:
+            map_names = list(MAPS.keys())
+            map_name = random.choice(map_names)
+        self.current_map = map_name
         print(f"Battle Map: {MAPS[self.current_map]['name']}")
         
         # Regenerate platforms for the new map
         self.generate_map_platforms()
         
+        # Render the map's static scenery once instead of every frame
+        if not self.headless:
+            self.battle_background = self.get_battle_background(self.current_map)
+        self.battle_full_redraw = True
+        
         # Team mode: spawn CPU teammates
         if self.team_mode_enabled and self.is_cpu_mode:
             # Clear any existing team structures first
@@ -1090,6 +2872,39 @@ class Game:
         else:
             self.all_players = [self.player1, self.player2]
         
+        # Fresh input streams (see network_sync_loop)
+        self.input_tick = 0
+        self.input_history.clear()
+        self.acked_input_tick = 0
+        self.pending_shot = None
+        self.pending_reconcile = None
+        self.pending_projectiles.clear()
+        with self.sync_lock:
+            self.host_sync_data = None
+        self.host_health = {}
+        self.remote_inputs = {i: deque() for i in range(self.first_client_index, len(self.all_players))}
+        self.last_input_tick = {}
+        self.input_acks = {}
+        
+        # Fresh battle, fresh projectile store
+        if self.projectile_store is not None:
+            self.projectile_store.clear()
+        self.attach_projectile_store()
+        
+        # Nobody should slide in from where they stood last battle
+        self.store_previous_positions()
+        
+    def attach_projectile_store(self):
+        """Point every player's projectiles at the shared NumPy store (when it's on)"""
+        if self.projectile_store is None:
+            return
+        for player in self.all_players:
+            if not isinstance(player.projectiles, ProjectileView) or player.projectiles.store is not self.projectile_store:
+                old_projectiles = list(player.projectiles)
+                player.projectiles = ProjectileView(self.projectile_store, player)
+                for proj in old_projectiles:
+                    player.projectiles.append(proj)
+    
     def spawn_teams(self):
         """Spawn CPU teammates and enemy teams for team mode"""
         self.all_players = []
@@ -1165,17 +2980,15 @@ class Game:
     
     def draw_username_input(self):
         # Gradient background
-        for y in range(SCREEN_HEIGHT):
-            color_val = int(30 + (y / SCREEN_HEIGHT) * 50)
-            pygame.draw.line(screen, (color_val + 20, color_val, color_val + 30), (0, y), (SCREEN_WIDTH, y))
+        screen.blit(get_gradient_backdrop((50, 30, 60), (100, 80, 110)), (0, 0))
         
         # Title
-        title = title_font.render("WELCOME TO BATTLE STREET", True, YELLOW)
+        title = render_text(title_font, "WELCOME TO BATTLE STREET", YELLOW)
         title_rect = title.get_rect(center=(SCREEN_WIDTH // 2, 150))
         screen.blit(title, title_rect)
         
         # Instructions
-        inst_text = menu_font.render("Enter Your Username:", True, WHITE)
+        inst_text = render_text(menu_font, "Enter Your Username:", WHITE)
         inst_rect = inst_text.get_rect(center=(SCREEN_WIDTH // 2, 280))
         screen.blit(inst_text, inst_rect)
         
@@ -1190,7 +3003,7 @@ class Game:
         pygame.draw.rect(screen, YELLOW, (input_box_x, input_box_y, input_box_width, input_box_height), 4)
         
         # Draw username text
-        username_text = text_font.render(self.player_username, True, BLACK)
+        username_text = render_text(text_font, self.player_username, BLACK)
         username_rect = username_text.get_rect(midleft=(input_box_x + 15, input_box_y + input_box_height // 2))
         screen.blit(username_text, username_rect)
         
@@ -1200,30 +3013,28 @@ class Game:
             pygame.draw.line(screen, BLACK, (cursor_x, input_box_y + 15), (cursor_x, input_box_y + input_box_height - 15), 3)
         
         # Hint text
-        hint = small_font.render("(Required - Type your name and press ENTER)", True, LIGHT_GRAY)
+        hint = render_text(small_font, "(Required - Type your name and press ENTER)", LIGHT_GRAY)
         hint_rect = hint.get_rect(center=(SCREEN_WIDTH // 2, 450))
         screen.blit(hint, hint_rect)
         
         # Show error if trying to continue without username
         if not self.player_username and hasattr(self, 'show_username_error'):
-            error = text_font.render("Username is required!", True, RED)
+            error = render_text(text_font, "Username is required!", RED)
             error_rect = error.get_rect(center=(SCREEN_WIDTH // 2, 520))
             screen.blit(error, error_rect)
     
     def draw_role_select(self):
         # Dramatic dark background with gradient
-        for y in range(SCREEN_HEIGHT):
-            color_val = int(10 + (y / SCREEN_HEIGHT) * 30)
-            pygame.draw.line(screen, (color_val, color_val + 10, color_val + 20), (0, y), (SCREEN_WIDTH, y))
+        screen.blit(get_gradient_backdrop((10, 20, 30), (40, 50, 60)), (0, 0))
         
         # Pulsing effect for dramatic reveal
         pulse = abs(math.sin(pygame.time.get_ticks() * 0.003)) * 30
         
         # Title with glow
-        title = title_font.render("ROLE REVEAL", True, YELLOW)
+        title = render_text(title_font, "ROLE REVEAL", YELLOW)
         title_rect = title.get_rect(center=(SCREEN_WIDTH // 2, 80))
         # Glow effect
-        glow = title_font.render("ROLE REVEAL", True, (255, 255, int(100 + pulse)))
+        glow = render_text(title_font, "ROLE REVEAL", (255, 255, int(100 + pulse)))
         glow_rect = glow.get_rect(center=(SCREEN_WIDTH // 2 + 2, 82))
         screen.blit(glow, glow_rect)
         screen.blit(title, title_rect)
@@ -1248,21 +3059,20 @@ class Game:
         pygame.draw.rect(screen, role_data["color"], (card_x, card_y, card_width, card_height), 5)
         
         # Username
-        username_text = text_font.render(self.player1.username, True, CYAN)
+        username_text = render_text(text_font, self.player1.username, CYAN)
         username_rect = username_text.get_rect(center=(SCREEN_WIDTH // 2, card_y + 40))
         screen.blit(username_text, username_rect)
         
         # "You are..."
-        you_are_text = small_font.render("You are a...", True, LIGHT_GRAY)
+        you_are_text = render_text(small_font, "You are a...", LIGHT_GRAY)
         you_are_rect = you_are_text.get_rect(center=(SCREEN_WIDTH // 2, card_y + 80))
         screen.blit(you_are_text, you_are_rect)
         
         # BIG ROLE NAME
-        role_name_large = pygame.font.Font(None, 80)
-        role_text = role_name_large.render(self.player1.role.upper(), True, role_data["color"])
+        role_text = render_text(role_font, self.player1.role.upper(), role_data["color"])
         role_rect = role_text.get_rect(center=(SCREEN_WIDTH // 2, card_y + 160))
         # Shadow
-        role_shadow = role_name_large.render(self.player1.role.upper(), True, BLACK)
+        role_shadow = render_text(role_font, self.player1.role.upper(), BLACK)
         shadow_rect = role_shadow.get_rect(center=(SCREEN_WIDTH // 2 + 3, card_y + 163))
         screen.blit(role_shadow, shadow_rect)
         screen.blit(role_text, role_rect)
@@ -1277,40 +3087,38 @@ class Game:
                 line = test_line
             else:
                 if line:
-                    desc_line = small_font.render(line, True, WHITE)
+                    desc_line = render_text(small_font, line, WHITE)
                     desc_rect = desc_line.get_rect(center=(SCREEN_WIDTH // 2, desc_y))
                     screen.blit(desc_line, desc_rect)
                     desc_y += 30
                 line = word + " "
         if line:
-            desc_line = small_font.render(line, True, WHITE)
+            desc_line = render_text(small_font, line, WHITE)
             desc_rect = desc_line.get_rect(center=(SCREEN_WIDTH // 2, desc_y))
             screen.blit(desc_line, desc_rect)
         
         # CPU role (small display in corner)
         if self.is_cpu_mode:
             cpu_role_data = ROLES[self.player2.role]
-            cpu_text = tiny_font.render(f"CPU is: {self.player2.role}", True, cpu_role_data["color"])
+            cpu_text = render_text(tiny_font, f"CPU is: {self.player2.role}", cpu_role_data["color"])
             screen.blit(cpu_text, (20, SCREEN_HEIGHT - 100))
         
         # Continue prompt (pulsing)
         alpha = int(128 + 127 * abs(math.sin(pygame.time.get_ticks() * 0.005)))
-        continue_text = menu_font.render("Press ENTER to Begin Battle", True, (255, 255, 255, alpha))
+        continue_text = render_text(menu_font, "Press ENTER to Begin Battle", (255, 255, 255, alpha))
         continue_rect = continue_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 60))
         screen.blit(continue_text, continue_rect)
     
     def draw_menu(self):
         # Gradient background
-        for y in range(SCREEN_HEIGHT):
-            color_val = int(20 + (y / SCREEN_HEIGHT) * 40)
-            pygame.draw.line(screen, (color_val, color_val, color_val + 20), (0, y), (SCREEN_WIDTH, y))
+        screen.blit(get_gradient_backdrop((20, 20, 40), (60, 60, 80)), (0, 0))
         
         # Title with shadow
-        title_shadow = title_font.render("BATTLE STREET", True, BLACK)
+        title_shadow = render_text(title_font, "BATTLE STREET", BLACK)
         title_shadow_rect = title_shadow.get_rect(center=(SCREEN_WIDTH // 2 + 4, 124))
         screen.blit(title_shadow, title_shadow_rect)
         
-        title = title_font.render("BATTLE STREET", True, YELLOW)
+        title = render_text(title_font, "BATTLE STREET", YELLOW)
         title_rect = title.get_rect(center=(SCREEN_WIDTH // 2, 120))
         screen.blit(title, title_rect)
         
@@ -1330,25 +3138,23 @@ class Game:
                 pygame.draw.rect(screen, LIGHT_GRAY, button_rect, 2)
                 color = WHITE
             
-            text = menu_font.render(option, True, color)
+            text = render_text(menu_font, option, color)
             text_rect = text.get_rect(center=(SCREEN_WIDTH // 2, y_pos))
             screen.blit(text, text_rect)
             
         # Instructions
-        instructions = small_font.render("Use Arrow Keys to navigate, Enter to select", True, LIGHT_GRAY)
+        instructions = render_text(small_font, "Use Arrow Keys to navigate, Enter to select", LIGHT_GRAY)
         inst_rect = instructions.get_rect(center=(SCREEN_WIDTH // 2, 630))
         screen.blit(instructions, inst_rect)
         
     def draw_mode_select(self):
         # Gradient background
-        for y in range(SCREEN_HEIGHT):
-            color_val = int(20 + (y / SCREEN_HEIGHT) * 40)
-            pygame.draw.line(screen, (color_val, color_val, color_val + 20), (0, y), (SCREEN_WIDTH, y))
+        screen.blit(get_gradient_backdrop((20, 20, 40), (60, 60, 80)), (0, 0))
         
         # Title with shadow
-        title_shadow = title_font.render("Select Mode", True, BLACK)
+        title_shadow = render_text(title_font, "Select Mode", BLACK)
         screen.blit(title_shadow, title_shadow.get_rect(center=(SCREEN_WIDTH // 2 + 4, 154)))
-        title = title_font.render("Select Mode", True, YELLOW)
+        title = render_text(title_font, "Select Mode", YELLOW)
         title_rect = title.get_rect(center=(SCREEN_WIDTH // 2, 150))
         screen.blit(title, title_rect)
         
@@ -1367,26 +3173,31 @@ class Game:
                 pygame.draw.rect(screen, LIGHT_GRAY, button_rect, 2)
                 color = WHITE
             
-            text = menu_font.render(option, True, color)
+            text = render_text(menu_font, option, color)
             text_rect = text.get_rect(center=(SCREEN_WIDTH // 2, y_pos))
             screen.blit(text, text_rect)
             
-        instructions = small_font.render("Arrow Keys: Navigate | Enter: Select | ESC: Back", True, LIGHT_GRAY)
+        instructions = render_text(small_font, "Arrow Keys: Navigate | Enter: Select | ESC: Back", LIGHT_GRAY)
         inst_rect = instructions.get_rect(center=(SCREEN_WIDTH // 2, 600))
         screen.blit(instructions, inst_rect)
         
-    def draw_battle(self):
-        # Get current map data
-        map_data = MAPS[self.current_map]
+    def get_battle_background(self, map_name):
+        """Get the cached static background for a map, rendering it on first use"""
+        cache_key = (map_name, screen.get_size())
+        if cache_key not in self.battle_background_cache:
+            self.battle_background_cache[cache_key] = self.render_battle_background(map_name)
+        return self.battle_background_cache[cache_key]
+    
+    def render_battle_background(self, map_name):
+        """Render everything in a map that never changes during a match"""
+        background = pygame.Surface(screen.get_size()).convert()
+        
+        # Get map data
+        map_data = MAPS[map_name]
         
         # Sky gradient background
-        sky_color = map_data["sky_color"]
-        for y in range(SCREEN_HEIGHT - 200):
-            ratio = y / (SCREEN_HEIGHT - 200)
-            r = int(sky_color[0] + (map_data["bg_color"][0] - sky_color[0]) * ratio)
-            g = int(sky_color[1] + (map_data["bg_color"][1] - sky_color[1]) * ratio)
-            b = int(sky_color[2] + (map_data["bg_color"][2] - sky_color[2]) * ratio)
-            pygame.draw.line(screen, (r, g, b), (0, y), (SCREEN_WIDTH, y))
+        sky = get_gradient_backdrop(map_data["sky_color"], map_data["bg_color"], (SCREEN_WIDTH, SCREEN_HEIGHT - 200))
+        background.blit(sky, (0, 0))
         
         # Draw map decorations
         if map_data["decoration"] == "buildings":
@@ -1399,8 +3210,8 @@ class Game:
                 bldg_width = 160
                 bldg_y = SCREEN_HEIGHT - 200 - bldg_height
                 color = building_colors[i % len(building_colors)]
-                pygame.draw.rect(screen, color, (bldg_x, bldg_y, bldg_width, bldg_height))
-                pygame.draw.rect(screen, BLACK, (bldg_x, bldg_y, bldg_width, bldg_height), 2)
+                pygame.draw.rect(background, color, (bldg_x, bldg_y, bldg_width, bldg_height))
+                pygame.draw.rect(background, BLACK, (bldg_x, bldg_y, bldg_width, bldg_height), 2)
                 # Windows
                 for row in range(3, bldg_height // 25):
                     for col in range(2, bldg_width // 30):
@@ -1408,55 +3219,92 @@ class Game:
                         window_y = bldg_y + row * 25
                         is_lit = (i + row + col) % 3 == 0
                         window_color = YELLOW if is_lit else (50, 50, 70)
-                        pygame.draw.rect(screen, window_color, (window_x, window_y, 15, 18))
+                        pygame.draw.rect(background, window_color, (window_x, window_y, 15, 18))
         elif map_data["decoration"] == "cacti":
             # Draw cacti for Desert map
             for i in range(8):
                 x = i * 130 + 50
                 y = SCREEN_HEIGHT - 250
                 # Cactus body
-                pygame.draw.rect(screen, GREEN, (x, y, 30, 80))
-                pygame.draw.rect(screen, GREEN, (x - 20, y + 20, 20, 30))
-                pygame.draw.rect(screen, GREEN, (x + 30, y + 30, 20, 25))
+                pygame.draw.rect(background, GREEN, (x, y, 30, 80))
+                pygame.draw.rect(background, GREEN, (x - 20, y + 20, 20, 30))
+                pygame.draw.rect(background, GREEN, (x + 30, y + 30, 20, 25))
         elif map_data["decoration"] == "trees":
             # Draw trees for Grassland map
             for i in range(10):
                 x = i * 105 + 30
                 y = SCREEN_HEIGHT - 260
                 # Tree trunk
-                pygame.draw.rect(screen, (101, 67, 33), (x, y + 30, 20, 40))
+                pygame.draw.rect(background, (101, 67, 33), (x, y + 30, 20, 40))
                 # Tree foliage
-                pygame.draw.circle(screen, (34, 139, 34), (x + 10, y + 20), 35)
+                pygame.draw.circle(background, (34, 139, 34), (x + 10, y + 20), 35)
         elif map_data["decoration"] == "pillars":
             # Draw pillars for Arena map
             for i in range(6):
                 x = i * 180 + 60
                 y = SCREEN_HEIGHT - 350
                 # Pillar
-                pygame.draw.rect(screen, (150, 150, 150), (x, y, 50, 150))
-                pygame.draw.rect(screen, (120, 120, 120), (x + 10, y + 10, 30, 130))
-                pygame.draw.rect(screen, (180, 180, 180), (x, y, 50, 20))
+                pygame.draw.rect(background, (150, 150, 150), (x, y, 50, 150))
+                pygame.draw.rect(background, (120, 120, 120), (x + 10, y + 10, 30, 130))
+                pygame.draw.rect(background, (180, 180, 180), (x, y, 50, 20))
         
         # Draw ground
         ground_color = map_data["ground_color"]
-        pygame.draw.rect(screen, ground_color, (0, SCREEN_HEIGHT - 200, SCREEN_WIDTH, 40))
-        pygame.draw.rect(screen, tuple(max(0, c - 30) for c in ground_color), (0, SCREEN_HEIGHT - 160, SCREEN_WIDTH, 40))
-        pygame.draw.rect(screen, tuple(max(0, c - 50) for c in ground_color), (0, SCREEN_HEIGHT - 120, SCREEN_WIDTH, 120))
+        pygame.draw.rect(background, ground_color, (0, SCREEN_HEIGHT - 200, SCREEN_WIDTH, 40))
+        pygame.draw.rect(background, tuple(max(0, c - 30) for c in ground_color), (0, SCREEN_HEIGHT - 160, SCREEN_WIDTH, 40))
+        pygame.draw.rect(background, tuple(max(0, c - 50) for c in ground_color), (0, SCREEN_HEIGHT - 120, SCREEN_WIDTH, 120))
         
         # Draw road lines for Street map only
-        if self.current_map == "Street":
+        if map_name == "Street":
             for i in range(0, SCREEN_WIDTH, 60):
-                pygame.draw.rect(screen, YELLOW, (i, SCREEN_HEIGHT - 65, 40, 5))
-            pygame.draw.rect(screen, WHITE, (0, SCREEN_HEIGHT - 125, SCREEN_WIDTH, 3))
-            pygame.draw.rect(screen, WHITE, (0, SCREEN_HEIGHT - 10, SCREEN_WIDTH, 3))
+                pygame.draw.rect(background, YELLOW, (i, SCREEN_HEIGHT - 65, 40, 5))
+            pygame.draw.rect(background, WHITE, (0, SCREEN_HEIGHT - 125, SCREEN_WIDTH, 3))
+            pygame.draw.rect(background, WHITE, (0, SCREEN_HEIGHT - 10, SCREEN_WIDTH, 3))
         
         # Draw platforms
         for platform in self.platforms:
-            platform.draw(screen)
+            platform.draw(background)
+        
+        return background
+    
+    def store_previous_positions(self):
+        """Remember positions before a simulation tick so drawing can blend between ticks"""
+        for player in self.all_players:
+            player.prev_x = player.x
+            player.prev_y = player.y
+            if isinstance(player.projectiles, list):
+                for proj in player.projectiles:
+                    proj.prev_x = proj.x
+                    proj.prev_y = proj.y
+        if self.projectile_store is not None:
+            self.projectile_store.store_previous_positions()
+    
+    def draw_battle(self, alpha=None):
+        """alpha: how far between the previous and the current tick to draw players and projectiles (None = current).
+        The blended positions are only passed to the draw calls - the network threads read and write the real ones."""
+        def position(obj):
+            if alpha is None:
+                return obj.x, obj.y
+            x, y = obj.x, obj.y
+            return obj.prev_x + (x - obj.prev_x) * alpha, obj.prev_y + (y - obj.prev_y) * alpha
+        
+        # Static scenery (sky, decorations, ground, platforms) is pre-rendered once per map
+        if self.battle_background is None:
+            self.battle_background = self.get_battle_background(self.current_map)
+        
+        # In dirty-rect mode, only repaint the background where last frame drew something
+        full_redraw = not self.dirty_rect_mode or self.battle_full_redraw
+        if full_redraw:
+            screen.blit(self.battle_background, (0, 0))
+        else:
+            for rect in self.previous_dirty_rects:
+                screen.blit(self.battle_background, rect, rect)
+        dirty_rects = []  # Everything drawn on top of the background this frame
         
         # Draw collectibles
         for collectible in self.collectibles:
             collectible.draw(screen)
+            dirty_rects.append(collectible.get_rect())
         
         # Draw Engineer barriers
         for player in self.all_players:
@@ -1470,6 +3318,7 @@ class Game:
                         health_ratio = structure["health"] / 50
                         pygame.draw.rect(screen, RED, (structure["x"], structure["y"] - 10, structure["width"], 5))
                         pygame.draw.rect(screen, GREEN, (structure["x"], structure["y"] - 10, structure["width"] * health_ratio, 5))
+                        dirty_rects.append(pygame.Rect(structure["x"], structure["y"] - 10, structure["width"], structure["height"] + 10))
         
         # Draw trapped player cages
         for player in self.all_players:
@@ -1482,6 +3331,7 @@ class Game:
                 
                 # Cage background
                 pygame.draw.rect(screen, (50, 50, 50, 100), (cage_x, cage_y, cage_width, cage_height))
+                dirty_rects.append(pygame.Rect(cage_x, cage_y, cage_width + 5, cage_height + 5))
                 
                 # Vertical bars
                 for i in range(5):
@@ -1495,8 +3345,8 @@ class Game:
                 
                 # Timer display
                 time_left = player.trap_timer / 60  # Convert to seconds
-                timer_text = tiny_font.render(f"{time_left:.1f}s", True, RED)
-                screen.blit(timer_text, (player.cage_x, player.cage_y - 35))
+                timer_text = render_text(tiny_font, f"{time_left:.1f}s", RED)
+                dirty_rects.append(screen.blit(timer_text, (player.cage_x, player.cage_y - 35)))
          
         for player in self.all_players:
             # Ghost mode: only draw if alive OR if viewer is also dead/ghost
@@ -1509,66 +3359,78 @@ class Game:
                     should_draw = True
             
             if should_draw:
+                x, y = position(player)
                 # Draw with transparency if ghost
                 if player.is_ghost:
                     # Create semi-transparent surface
                     ghost_surface = pygame.Surface((player.width, player.height), pygame.SRCALPHA)
                     ghost_surface.fill((*player.color, 100))  # 100 = semi-transparent
-                    screen.blit(ghost_surface, (player.x, player.y))
+                    dirty_rects.append(screen.blit(ghost_surface, (x, y)))
                     
                     # Draw ghost label
-                    ghost_text = tiny_font.render("👻 GHOST", True, (150, 150, 255))
-                    screen.blit(ghost_text, (player.x, player.y - 50))
+                    ghost_text = render_text(tiny_font, "👻 GHOST", (150, 150, 255))
+                    dirty_rects.append(screen.blit(ghost_text, (x, y - 50)))
                 else:
-                    player.draw(screen)
+                    player.draw(screen, (x, y))
+                    dirty_rects.append(player.get_draw_bounds((x, y)))
                 
                 # Draw username above player
-                username_text = small_font.render(player.username, True, WHITE)
-                username_rect = username_text.get_rect(center=(player.x + player.width // 2, player.y - 30))
+                username_text = render_text(small_font, player.username, WHITE)
+                username_rect = username_text.get_rect(center=(x + player.width // 2, y - 30))
                 # Background for username
                 bg_rect = pygame.Rect(username_rect.x - 5, username_rect.y - 2, username_rect.width + 10, username_rect.height + 4)
                 pygame.draw.rect(screen, BLACK, bg_rect)
                 pygame.draw.rect(screen, ROLES[player.role]["color"], bg_rect, 2)
                 screen.blit(username_text, username_rect)
+                dirty_rects.append(bg_rect)
                 
                 # Draw role badge
-                role_text = tiny_font.render(player.role, True, ROLES[player.role]["color"])
-                role_rect = role_text.get_rect(center=(player.x + player.width // 2, player.y - 12))
-                screen.blit(role_text, role_rect)
+                role_text = render_text(tiny_font, player.role, ROLES[player.role]["color"])
+                role_rect = role_text.get_rect(center=(x + player.width // 2, y - 12))
+                dirty_rects.append(screen.blit(role_text, role_rect))
                 
         # Draw projectiles and explosions for all players
         for player in self.all_players:
             for proj in player.projectiles:
-                proj.draw(screen)
+                pos = position(proj)
+                proj.draw(screen, pos)
+                dirty_rects.append(proj.get_rect(pos))
             for explosion in player.explosions:
                 explosion.draw(screen)
+                explosion_rect = explosion.get_rect()
+                if explosion_rect:
+                    dirty_rects.append(explosion_rect)
+        if EXPLOSION_PARTICLES is not None:
+            dirty_rects.extend(EXPLOSION_PARTICLES.draw(screen))
             
         # Draw player info panels with backgrounds
         # Player 1 panel (local player)
         pygame.draw.rect(screen, (0, 0, 0, 128), (0, 0, 280, 80))
         pygame.draw.rect(screen, BLACK, (5, 5, 270, 70), 2)
+        dirty_rects.append(pygame.Rect(0, 0, 280, 80))
         
         if self.is_network_game:
-            p1_label = text_font.render(f"You (P1)", True, RED)
+            p1_label = render_text(text_font, f"You (P1)", RED)
         else:
-            p1_label = text_font.render(f"P1 Coins: {self.player1.coins}", True, YELLOW)
-        screen.blit(p1_label, (15, 12))
+            p1_label = render_text(text_font, f"P1 Coins: {self.player1.coins}", YELLOW)
+        dirty_rects.append(screen.blit(p1_label, (15, 12)))
         
-        p1_weapon = small_font.render(f"Weapon: {self.player1.weapon}", True, WHITE)
-        screen.blit(p1_weapon, (15, 45))
+        p1_weapon = render_text(small_font, f"Weapon: {self.player1.weapon}", WHITE)
+        dirty_rects.append(screen.blit(p1_weapon, (15, 45)))
         
         # Opponent panel
         pygame.draw.rect(screen, (0, 0, 0, 128), (SCREEN_WIDTH - 250, 0, 250, 80))
         pygame.draw.rect(screen, BLACK, (SCREEN_WIDTH - 245, 5, 240, 70), 2)
+        dirty_rects.append(pygame.Rect(SCREEN_WIDTH - 250, 0, 250, 80))
         
         if self.is_network_game:
-            opponent_label = text_font.render(f"Opponent", True, CYAN)
+            opponent_label = render_text(text_font, f"Opponent", CYAN)
         else:
-            opponent_label = text_font.render(f"CPU", True, CYAN)
-        screen.blit(opponent_label, (SCREEN_WIDTH - 200, 12))
+            opponent_label = render_text(text_font, f"CPU", CYAN)
+        dirty_rects.append(screen.blit(opponent_label, (SCREEN_WIDTH - 200, 12)))
         
-        p2_weapon = small_font.render(f"Weapon: {self.player2.weapon}", True, WHITE)
-        screen.blit(p2_weapon, (SCREEN_WIDTH - 240, 45))
+        p2_weapon = render_text(small_font, f"Weapon: {self.player2.weapon}", WHITE)
+        dirty_rects.append(screen.blit(p2_weapon, (SCREEN_WIDTH - 240, 45)))
         
         # Engineer wood inventory and buy button
         if self.player1.role == "Engineer":
@@ -1580,31 +3442,43 @@ class Game:
             # Draw button background
             pygame.draw.rect(screen, (80, 50, 20), (button_x, button_y, button_width, button_height))
             pygame.draw.rect(screen, YELLOW, (button_x, button_y, button_width, button_height), 3)
+            dirty_rects.append(pygame.Rect(button_x, button_y, button_width, button_height))
             
             # Wood inventory display
-            wood_text = small_font.render(f"Wood: {int(self.player1.build_resources)}", True, WHITE)
-            screen.blit(wood_text, (button_x + 10, button_y + 8))
+            wood_text = render_text(small_font, f"Wood: {int(self.player1.build_resources)}", WHITE)
+            dirty_rects.append(screen.blit(wood_text, (button_x + 10, button_y + 8)))
             
             # Buy button text
-            buy_text = tiny_font.render("Press B: Buy Wood", True, YELLOW)
-            screen.blit(buy_text, (button_x + 10, button_y + 32))
-            cost_text = tiny_font.render("(25 coins)", True, LIGHT_GRAY)
-            screen.blit(cost_text, (button_x + 35, button_y + 48))
+            buy_text = render_text(tiny_font, "Press B: Buy Wood", YELLOW)
+            dirty_rects.append(screen.blit(buy_text, (button_x + 10, button_y + 32)))
+            cost_text = render_text(tiny_font, "(25 coins)", LIGHT_GRAY)
+            dirty_rects.append(screen.blit(cost_text, (button_x + 35, button_y + 48)))
         
         # Draw controls at bottom with background
         pygame.draw.rect(screen, (0, 0, 0, 128), (0, SCREEN_HEIGHT - 40, SCREEN_WIDTH, 40))
+        dirty_rects.append(pygame.Rect(0, SCREEN_HEIGHT - 40, SCREEN_WIDTH, 40))
         
         # Update controls text based on vehicle
         if self.player1.vehicle == "Ship" or self.player1.vehicle == "Rocket":
-            controls1 = tiny_font.render("A/D=Move | W/S=Up/Down | Click=Shoot | ESC=Menu", True, WHITE)
+            controls1 = render_text(tiny_font, "A/D=Move | W/S=Up/Down | Click=Shoot | ESC=Menu", WHITE)
         else:
-            controls1 = tiny_font.render("A/D=Move | Space=Jump | Click=Shoot | ESC=Menu", True, WHITE)
+            controls1 = render_text(tiny_font, "A/D=Move | Space=Jump | Click=Shoot | ESC=Menu", WHITE)
         controls_rect = controls1.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 28))
-        screen.blit(controls1, controls_rect)
+        dirty_rects.append(screen.blit(controls1, controls_rect))
         
         # Draw minimap for Ship vehicle
         if self.player1.vehicle == "Ship":
-            self.draw_minimap()
+            dirty_rects.append(self.draw_minimap())
+        
+        if self.show_telemetry:
+            dirty_rects.append(self.draw_telemetry_overlay())
+        
+        # Remember what was drawn so the next frame can erase it, and tell run() what to push
+        screen_rect = screen.get_rect()
+        dirty_rects = [rect.clip(screen_rect) for rect in dirty_rects]
+        self.display_update_rects = None if full_redraw else self.previous_dirty_rects + dirty_rects
+        self.previous_dirty_rects = dirty_rects
+        self.battle_full_redraw = False
         
     def draw_minimap(self):
         """Draw minimap for the Ship vehicle showing exterior view"""
@@ -1619,7 +3493,7 @@ class Game:
         pygame.draw.rect(screen, YELLOW, (minimap_x, minimap_y, minimap_width, minimap_height), 3)
         
         # Draw minimap title
-        minimap_title = tiny_font.render("RADAR", True, YELLOW)
+        minimap_title = render_text(tiny_font, "RADAR", YELLOW)
         screen.blit(minimap_title, (minimap_x + 5, minimap_y + 5))
         
         # Calculate scaling factor for minimap
@@ -1657,16 +3531,17 @@ class Game:
             grid_y = minimap_y + i * (minimap_height // 4)
             pygame.draw.line(screen, (40, 40, 60), (minimap_x, grid_y), (minimap_x + minimap_width, grid_y))
         
+        # Player markers can poke a few pixels outside the frame
+        return pygame.Rect(minimap_x, minimap_y, minimap_width, minimap_height).inflate(12, 12)
+        
     def draw_shop(self):
         # Gradient background
-        for y in range(SCREEN_HEIGHT):
-            color_val = int(40 + (y / SCREEN_HEIGHT) * 30)
-            pygame.draw.line(screen, (color_val, color_val + 10, color_val + 20), (0, y), (SCREEN_WIDTH, y))
+        screen.blit(get_gradient_backdrop((40, 50, 60), (70, 80, 90)), (0, 0))
         
         # Title with shadow
-        title_shadow = title_font.render("SHOP", True, BLACK)
+        title_shadow = render_text(title_font, "SHOP", BLACK)
         screen.blit(title_shadow, title_shadow.get_rect(center=(SCREEN_WIDTH // 2 + 4, 44)))
-        title = title_font.render("SHOP", True, YELLOW)
+        title = render_text(title_font, "SHOP", YELLOW)
         title_rect = title.get_rect(center=(SCREEN_WIDTH // 2, 40))
         screen.blit(title, title_rect)
         
@@ -1693,7 +3568,7 @@ class Game:
                 tab_color = WHITE
                 pygame.draw.rect(screen, LIGHT_GRAY, tab_rect, 2)
             
-            tab_text = text_font.render(tab_name, True, tab_color)
+            tab_text = render_text(text_font, tab_name, tab_color)
             text_rect = tab_text.get_rect(center=tab_rect.center)
             screen.blit(tab_text, text_rect)
         
@@ -1703,18 +3578,18 @@ class Game:
         pygame.draw.rect(screen, (50, 50, 70), info_rect)
         pygame.draw.rect(screen, YELLOW, info_rect, 2)
         
-        coin_text = text_font.render(f"Coins: {player.coins}", True, YELLOW)
+        coin_text = render_text(text_font, f"Coins: {player.coins}", YELLOW)
         screen.blit(coin_text, (70, 155))
         
         if self.shop_tab == 0:  # Weapons
-            current = small_font.render(f"Weapon: {player.weapon}", True, GREEN)
+            current = render_text(small_font, f"Weapon: {player.weapon}", GREEN)
         elif self.shop_tab == 1:  # Vehicles
-            current = small_font.render(f"Vehicle: {VEHICLES[player.vehicle]['name']}", True, GREEN)
+            current = render_text(small_font, f"Vehicle: {VEHICLES[player.vehicle]['name']}", GREEN)
         elif self.shop_tab == 2:  # Powers
-            current = small_font.render(f"Powers: Coming Soon!", True, GREEN)
+            current = render_text(small_font, f"Powers: Coming Soon!", GREEN)
         elif self.shop_tab == 3:  # Cosmetics
             hat_name = player.hat if player.hat else "None"
-            current = small_font.render(f"Hat: {hat_name}", True, GREEN)
+            current = render_text(small_font, f"Hat: {hat_name}", GREEN)
         screen.blit(current, (70, 180))
         
         # Build items list based on current tab
@@ -1776,12 +3651,13 @@ class Game:
                     is_equipped = player.weapon == item_name
                     
                     status = " [EQUIPPED]" if is_equipped else (" [OWNED]" if is_owned else "")
-                    name_text = small_font.render(f"{item_name}{status}", True, text_color)
+                    name_text = render_text(small_font, f"{item_name}{status}", text_color)
                     screen.blit(name_text, (70, y_pos + 5))
                     
-                    stats_text = tiny_font.render(
+                    stats_text = render_text(
+                        tiny_font,
                         f"Damage: {item_data['damage']} | Speed: {item_data['speed']} | Cost: {item_data['cost']} coins",
-                        True, text_color
+                        text_color
                     )
                     screen.blit(stats_text, (70, y_pos + 32))
                 elif item_type == "vehicle":
@@ -1790,22 +3666,24 @@ class Game:
                     is_equipped = player.vehicle == item_name
                     
                     status = " [ACTIVE]" if is_equipped else (" [OWNED]" if is_owned else "")
-                    name_text = small_font.render(f"{item_data['name']}{status}", True, text_color)
+                    name_text = render_text(small_font, f"{item_data['name']}{status}", text_color)
                     screen.blit(name_text, (70, y_pos + 5))
                     
-                    stats_text = tiny_font.render(
+                    stats_text = render_text(
+                        tiny_font,
                         f"HP: x{item_data['health_multiplier']} | Speed: x{item_data['speed_multiplier']} | "
                         f"{'CAN FLY' if item_data['can_fly'] else 'GROUND'} | Cost: {item_data['cost']} coins",
-                        True, text_color
+                        text_color
                     )
                     screen.blit(stats_text, (70, y_pos + 32))
                 elif item_type == "power":
-                    name_text = small_font.render(f"{item_name}", True, text_color)
+                    name_text = render_text(small_font, f"{item_name}", text_color)
                     screen.blit(name_text, (70, y_pos + 5))
                     
-                    stats_text = tiny_font.render(
+                    stats_text = render_text(
+                        tiny_font,
                         f"{item_data['description']} | Cost: {item_data['cost']} coins",
-                        True, text_color
+                        text_color
                     )
                     screen.blit(stats_text, (70, y_pos + 32))
                 elif item_type == "cosmetic":
@@ -1821,21 +3699,23 @@ class Game:
                         is_equipped = player.visor == item_name
                     
                     status = " [EQUIPPED]" if is_equipped else (" [OWNED]" if is_owned else "")
-                    name_text = small_font.render(f"{item_name}{status}", True, text_color)
+                    name_text = render_text(small_font, f"{item_name}{status}", text_color)
                     screen.blit(name_text, (70, y_pos + 5))
                     
-                    stats_text = tiny_font.render(
+                    stats_text = render_text(
+                        tiny_font,
                         f"{item_data['type'].title()} - {item_data['description']} | Cost: {item_data['cost']} coins",
-                        True, text_color
+                        text_color
                     )
                     screen.blit(stats_text, (70, y_pos + 32))
                 else:  # upgrade
-                    name_text = small_font.render(f"{item_name}", True, text_color)
+                    name_text = render_text(small_font, f"{item_name}", text_color)
                     screen.blit(name_text, (70, y_pos + 5))
                     
-                    stats_text = tiny_font.render(
+                    stats_text = render_text(
+                        tiny_font,
                         f"{item_data['effect'].title()}: +{item_data['value']} | Cost: {item_data['cost']} coins",
-                        True, text_color
+                        text_color
                     )
                     screen.blit(stats_text, (70, y_pos + 32))
         
@@ -1849,17 +3729,15 @@ class Game:
         inst_bg = pygame.Rect(0, SCREEN_HEIGHT - 50, SCREEN_WIDTH, 50)
         pygame.draw.rect(screen, (20, 20, 30), inst_bg)
         if self.shop_tab == 0:
-            inst = tiny_font.render("←→: Switch Tab | ↑↓: Navigate | B: Buy | E: Equip | ESC: Menu", True, WHITE)
+            inst = render_text(tiny_font, "←→: Switch Tab | ↑↓: Navigate | B: Buy | E: Equip | ESC: Menu", WHITE)
         else:
-            inst = tiny_font.render("←→: Switch Tab | ↑↓: Navigate | B: Buy | E: Equip/Activate | ESC: Menu", True, WHITE)
+            inst = render_text(tiny_font, "←→: Switch Tab | ↑↓: Navigate | B: Buy | E: Equip/Activate | ESC: Menu", WHITE)
         inst_rect = inst.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 25))
         screen.blit(inst, inst_rect)
         
     def draw_win_screen(self):
         # Victory gradient background
-        for y in range(SCREEN_HEIGHT):
-            green_val = int(50 + (y / SCREEN_HEIGHT) * 100)
-            pygame.draw.line(screen, (20, green_val, 20), (0, y), (SCREEN_WIDTH, y))
+        screen.blit(get_gradient_backdrop((20, 50, 20), (20, 150, 20)), (0, 0))
         
         # Victory banner
         banner_rect = pygame.Rect(100, 100, SCREEN_WIDTH - 200, 100)
@@ -1867,12 +3745,12 @@ class Game:
         pygame.draw.rect(screen, YELLOW, banner_rect, 5)
         
         # Winner text
-        winner_text = title_font.render(f"{self.winner} WON!", True, YELLOW)
+        winner_text = render_text(title_font, f"{self.winner} WON!", YELLOW)
         screen.blit(winner_text, winner_text.get_rect(center=(SCREEN_WIDTH // 2, 150)))
         
         # Loser text at top
         if self.loser:
-            loser_small = text_font.render(f"{self.loser} Lost", True, RED)
+            loser_small = render_text(text_font, f"{self.loser} Lost", RED)
             screen.blit(loser_small, loser_small.get_rect(center=(SCREEN_WIDTH // 2, 220)))
         
         # Stats panel
@@ -1881,22 +3759,20 @@ class Game:
         pygame.draw.rect(screen, WHITE, stats_rect, 3)
         
         # Coins earned
-        coins_text = title_font.render(f"+{self.coins_earned} Coins!", True, YELLOW)
+        coins_text = render_text(title_font, f"+{self.coins_earned} Coins!", YELLOW)
         screen.blit(coins_text, coins_text.get_rect(center=(SCREEN_WIDTH // 2, 350)))
         
         # Total coins
-        total_text = text_font.render(f"Total Coins: {self.player1.coins}", True, WHITE)
+        total_text = render_text(text_font, f"Total Coins: {self.player1.coins}", WHITE)
         screen.blit(total_text, total_text.get_rect(center=(SCREEN_WIDTH // 2, 420)))
         
         # Continue message
-        continue_text = small_font.render("Press ESC to return to menu", True, LIGHT_GRAY)
+        continue_text = render_text(small_font, "Press ESC to return to menu", LIGHT_GRAY)
         screen.blit(continue_text, continue_text.get_rect(center=(SCREEN_WIDTH // 2, 460)))
         
     def draw_lose_screen(self):
         # Defeat gradient background
-        for y in range(SCREEN_HEIGHT):
-            red_val = int(80 + (y / SCREEN_HEIGHT) * 60)
-            pygame.draw.line(screen, (red_val, 20, 20), (0, y), (SCREEN_WIDTH, y))
+        screen.blit(get_gradient_backdrop((80, 20, 20), (140, 20, 20)), (0, 0))
         
         # Defeat banner
         banner_rect = pygame.Rect(100, 100, SCREEN_WIDTH - 200, 100)
@@ -1904,12 +3780,12 @@ class Game:
         pygame.draw.rect(screen, DARK_GRAY, banner_rect, 5)
         
         # Loser text (Player 1 lost)
-        loser_text = title_font.render(f"{self.loser} LOST", True, WHITE)
+        loser_text = render_text(title_font, f"{self.loser} LOST", WHITE)
         screen.blit(loser_text, loser_text.get_rect(center=(SCREEN_WIDTH // 2, 150)))
         
         # Winner text at bottom of banner
         if self.winner:
-            winner_small = text_font.render(f"{self.winner} Won!", True, GREEN)
+            winner_small = render_text(text_font, f"{self.winner} Won!", GREEN)
             screen.blit(winner_small, winner_small.get_rect(center=(SCREEN_WIDTH // 2, 220)))
         
         # Stats panel
@@ -1919,18 +3795,18 @@ class Game:
         
         # Coins lost
         if self.coins_lost > 0:
-            lost_text = title_font.render(f"-{self.coins_lost} Coins", True, ORANGE)
+            lost_text = render_text(title_font, f"-{self.coins_lost} Coins", ORANGE)
             screen.blit(lost_text, lost_text.get_rect(center=(SCREEN_WIDTH // 2, 350)))
         else:
-            lost_text = text_font.render("No coins lost!", True, GREEN)
+            lost_text = render_text(text_font, "No coins lost!", GREEN)
             screen.blit(lost_text, lost_text.get_rect(center=(SCREEN_WIDTH // 2, 350)))
         
         # Total coins
-        total_text = text_font.render(f"Total Coins: {self.player1.coins}", True, WHITE)
+        total_text = render_text(text_font, f"Total Coins: {self.player1.coins}", WHITE)
         screen.blit(total_text, total_text.get_rect(center=(SCREEN_WIDTH // 2, 420)))
         
         # Continue message
-        continue_text = small_font.render("Press ESC to return to menu", True, LIGHT_GRAY)
+        continue_text = render_text(small_font, "Press ESC to return to menu", LIGHT_GRAY)
         screen.blit(continue_text, continue_text.get_rect(center=(SCREEN_WIDTH // 2, 460)))
         
     def handle_username_input(self, event):
@@ -1966,12 +3842,10 @@ class Game:
     
     def draw_customize(self):
         # Gradient background
-        for y in range(SCREEN_HEIGHT):
-            color_val = int(30 + (y / SCREEN_HEIGHT) * 50)
-            pygame.draw.line(screen, (color_val + 10, color_val + 30, color_val + 10), (0, y), (SCREEN_WIDTH, y))
+        screen.blit(get_gradient_backdrop((40, 60, 40), (90, 110, 90)), (0, 0))
         
         # Title
-        title = title_font.render("CUSTOMIZE", True, YELLOW)
+        title = render_text(title_font, "CUSTOMIZE", YELLOW)
         title_rect = title.get_rect(center=(SCREEN_WIDTH // 2, 50))
         screen.blit(title, title_rect)
         
@@ -1997,7 +3871,7 @@ class Game:
                 tab_color = WHITE
                 pygame.draw.rect(screen, LIGHT_GRAY, tab_rect, 2)
             
-            tab_text = small_font.render(tab_name, True, tab_color)
+            tab_text = render_text(small_font, tab_name, tab_color)
             tab_text_rect = tab_text.get_rect(center=(tab_x + tab_width // 2, tab_y + tab_height // 2))
             screen.blit(tab_text, tab_text_rect)
         
@@ -2006,7 +3880,7 @@ class Game:
         
         if self.customize_tab == 0:  # Username
             # Username editing
-            inst = menu_font.render("Change Your Username:", True, WHITE)
+            inst = render_text(menu_font, "Change Your Username:", WHITE)
             inst_rect = inst.get_rect(center=(SCREEN_WIDTH // 2, content_y))
             screen.blit(inst, inst_rect)
             
@@ -2019,7 +3893,7 @@ class Game:
             pygame.draw.rect(screen, WHITE, (input_box_x, input_box_y, input_box_width, input_box_height))
             pygame.draw.rect(screen, YELLOW, (input_box_x, input_box_y, input_box_width, input_box_height), 4)
             
-            username_text = text_font.render(self.player_username, True, BLACK)
+            username_text = render_text(text_font, self.player_username, BLACK)
             username_rect = username_text.get_rect(midleft=(input_box_x + 15, input_box_y + input_box_height // 2))
             screen.blit(username_text, username_rect)
             
@@ -2028,7 +3902,7 @@ class Game:
                 cursor_x = username_rect.right + 5
                 pygame.draw.line(screen, BLACK, (cursor_x, input_box_y + 15), (cursor_x, input_box_y + input_box_height - 15), 3)
             
-            hint = small_font.render("Type to edit, ENTER to save", True, LIGHT_GRAY)
+            hint = render_text(small_font, "Type to edit, ENTER to save", LIGHT_GRAY)
             screen.blit(hint, (SCREEN_WIDTH // 2 - hint.get_width() // 2, input_box_y + 80))
             
         else:  # Hats, Skins, or Visors
@@ -2039,7 +3913,7 @@ class Game:
             filtered_cosmetics = [(name, data) for name, data in COSMETICS.items() if data['type'] == filter_type]
             
             if not filtered_cosmetics:
-                no_items = text_font.render("No items in this category", True, WHITE)
+                no_items = render_text(text_font, "No items in this category", WHITE)
                 screen.blit(no_items, (SCREEN_WIDTH // 2 - no_items.get_width() // 2, content_y + 100))
             else:
                 # Display cosmetics as cards
@@ -2081,17 +3955,17 @@ class Game:
                     pygame.draw.rect(screen, cosmetic_data['color'], (card_x, card_y, card_width, card_height), 3)
                     
                     # Item name
-                    name_text = small_font.render(cosmetic_name, True, cosmetic_data['color'])
+                    name_text = render_text(small_font, cosmetic_name, cosmetic_data['color'])
                     name_rect = name_text.get_rect(center=(card_x + card_width // 2, card_y + 30))
                     screen.blit(name_text, name_rect)
                     
                     # Status
                     if is_equipped:
-                        status_text = tiny_font.render("[EQUIPPED]", True, GREEN)
+                        status_text = render_text(tiny_font, "[EQUIPPED]", GREEN)
                     elif is_owned:
-                        status_text = tiny_font.render("[OWNED]", True, CYAN)
+                        status_text = render_text(tiny_font, "[OWNED]", CYAN)
                     else:
-                        status_text = tiny_font.render(f"{cosmetic_data['cost']} coins", True, YELLOW)
+                        status_text = render_text(tiny_font, f"{cosmetic_data['cost']} coins", YELLOW)
                     status_rect = status_text.get_rect(center=(card_x + card_width // 2, card_y + 60))
                     screen.blit(status_text, status_rect)
                     
@@ -2103,7 +3977,7 @@ class Game:
                     pygame.draw.rect(screen, WHITE, (preview_x, preview_y, preview_size, preview_size), 2)
                     
                     # Description
-                    desc = tiny_font.render(cosmetic_data['description'][:25], True, WHITE)
+                    desc = render_text(tiny_font, cosmetic_data['description'][:25], WHITE)
                     desc_rect = desc.get_rect(center=(card_x + card_width // 2, card_y + 175))
                     screen.blit(desc, desc_rect)
         
@@ -2112,9 +3986,9 @@ class Game:
         pygame.draw.rect(screen, (20, 20, 30), inst_bg)
         
         if self.customize_tab == 0:
-            inst = small_font.render("←→: Switch Tab | Type to edit | ENTER: Save | ESC: Back to Menu", True, WHITE)
+            inst = render_text(small_font, "←→: Switch Tab | Type to edit | ENTER: Save | ESC: Back to Menu", WHITE)
         else:
-            inst = small_font.render("←→: Switch Tab | ↑↓←→: Navigate | B: Buy | E: Equip | ESC: Back to Menu", True, WHITE)
+            inst = render_text(small_font, "←→: Switch Tab | ↑↓←→: Navigate | B: Buy | E: Equip | ESC: Back to Menu", WHITE)
         screen.blit(inst, (SCREEN_WIDTH // 2 - inst.get_width() // 2, SCREEN_HEIGHT - 30))
     
     def handle_customize_input(self, event):
@@ -2244,6 +4118,19 @@ class Game:
             if event.key == pygame.K_ESCAPE:
                 self.network_running = False  # Stop network sync
                 self.state = GameState.MENU
+            elif event.key == pygame.K_F2:
+                # Compare cached weapon rotations against exact per-frame rotation
+                WEAPON_ROTATIONS.exact = not WEAPON_ROTATIONS.exact
+                print(f"Weapon rotation: {'EXACT' if WEAPON_ROTATIONS.exact else f'CACHED ({WEAPON_ROTATIONS.step} degree steps)'}")
+            elif event.key == pygame.K_F3:
+                # Switch between full-screen flips and dirty-rect updates
+                self.dirty_rect_mode = not self.dirty_rect_mode
+                self.battle_full_redraw = True
+                print(f"Dirty-rect rendering: {'ON' if self.dirty_rect_mode else 'OFF'}")
+            elif event.key == pygame.K_F4:
+                # Network counters overlay (bytes, messages, errors, RTT, snapshot age, send queues)
+                self.show_telemetry = not self.show_telemetry
+                self.battle_full_redraw = True
             elif event.key == pygame.K_b and self.player1.role == "Engineer":
                 # Buy wood for Engineer
                 wood_cost = 25
@@ -2262,6 +4149,9 @@ class Game:
                 if self.is_network_game and self.my_player_index < len(self.all_players):
                     my_player = self.all_players[self.my_player_index]
                     my_player.shoot(mouse_x, mouse_y)
+                    if not self.is_host:
+                        # The host fires the real shot when this tick's input reaches it
+                        self.pending_shot = (max(-32768, min(32767, mouse_x)), max(-32768, min(32767, mouse_y)))
                 else:
                     # CPU mode - player1 shoots
                     self.player1.shoot(mouse_x, mouse_y)
@@ -2743,6 +4633,9 @@ class Game:
     def start_host(self):
         """Start hosting a LAN game with lobby"""
         try:
+            # A lobby left over from the last battle still holds the port
+            self.close_network()
+            
             self.is_host = True
             self.is_network_game = True
             self.is_cpu_mode = False
@@ -2759,35 +4652,76 @@ class Game:
             self.server_ip = socket.gethostbyname(hostname)
             
             # Bind to all interfaces to accept connections from anywhere
-            self.network_socket.bind(('0.0.0.0', GAME_PORT))
-            self.network_socket.listen(10)  # Allow up to 10 connections
+            self.network_socket.bind(('0.0.0.0', self.game_port))
+            self.network_socket.listen(64)  # Lots of players may join at once
             
-            print(f"Server listening on port {GAME_PORT}")
+            # Battle state travels over UDP on the same port number
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind(('0.0.0.0', self.game_port))
+            self.udp_socket.setblocking(False)
             
-            # Initialize lobby
-            self.lobby_players = [self.player_name + " (Host)"]
+            print(f"Server listening on port {self.game_port}")
+            
+            # Initialize lobby (a dedicated server doesn't play, so it isn't in it)
+            self.first_client_index = 0 if self.dedicated_server else 1
+            self.lobby_players = [] if self.dedicated_server else [self.player_name + " (Host)"]
             self.can_start = False
+            self.my_player_index = NO_PLAYER if self.dedicated_server else 0
             
             # Initialize color selections
-            self.player_colors_taken = {0: self.selected_color_index}  # Host gets their selected color
+            self.player_colors_taken = {} if self.dedicated_server else {0: self.selected_color_index}  # Host gets their selected color
             
-            # Start UDP broadcast
+            # Start UDP broadcast (it runs while we're in the lobby, so be in it first)
+            self.state = GameState.HOST_WAIT
             self.start_broadcast()
             
             self.connection_status = f"Lobby created | Code: {self.lobby_code}"
-            self.state = GameState.HOST_WAIT
-            print(f"Lobby code: {self.lobby_code} | Listening on port {GAME_PORT}")
+            print(f"Lobby code: {self.lobby_code} | Listening on port {self.game_port}")
             
-            # Start listening thread for new connections
-            self.network_thread = threading.Thread(target=self.accept_connections, daemon=True)
+            # Joins, lobby, broadcast and battle sync all run on one asyncio loop in one thread
+            self.host_loop = asyncio.new_event_loop()
+            self.host_stop = asyncio.Event()
+            self.network_thread = threading.Thread(target=self.run_host_loop, args=(self.host_loop,), daemon=True)
             self.network_thread.start()
             
         except Exception as e:
             self.connection_status = f"Error: {str(e)}"
             print(f"Host error: {e}")
     
+    def run_host_loop(self, loop):
+        """Host network thread: serve the lobby and battle until close_network"""
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.serve_host())
+        except Exception as e:
+            print(f"Host network error: {e}")
+        finally:
+            loop.close()
+    
+    async def serve_host(self):
+        loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_client_connection, sock=self.network_socket)
+        udp_socket = self.udp_socket
+        loop.add_reader(udp_socket, self.receive_datagrams)
+        broadcast_task = asyncio.create_task(self.broadcast_server())
+        print("Waiting for connections...")
+        
+        await self.host_stop.wait()
+        
+        broadcast_task.cancel()
+        loop.remove_reader(udp_socket)
+        server.close()
+        for client in list(self.client_connections):
+            client.closed = True
+            client.writer.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0)  # Let the streams see their handlers finish
+    
     def start_broadcast(self):
-        """Start broadcasting server availability"""
+        """Open the socket lobby broadcasts go out on (see broadcast_server)"""
         try:
             self.broadcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.broadcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
@@ -2797,20 +4731,19 @@ class Game:
                 self.broadcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             except AttributeError:
                 pass
+            self.broadcast_socket.setblocking(False)
             print(f"Starting broadcast on {self.server_ip}...")
-            broadcast_thread = threading.Thread(target=self.broadcast_server, daemon=True)
-            broadcast_thread.start()
         except Exception as e:
             print(f"Broadcast setup error: {e}")
     
-    def broadcast_server(self):
+    async def broadcast_server(self):
         """Continuously broadcast server info"""
         print(f"Broadcasting on port {BROADCAST_PORT} with code {self.lobby_code}...")
         broadcast_count = 0
         
         while self.is_host and self.state == GameState.HOST_WAIT:
             try:
-                message = f"BATTLE_STREET_SERVER:{self.server_ip}:{len(self.lobby_players)}:{self.lobby_code}"
+                message = f"BATTLE_STREET_SERVER:{self.server_ip}:{len(self.lobby_players)}:{self.lobby_code}:{self.game_port}"
                 
                 # Send to multiple addresses to ensure delivery
                 addresses = [
@@ -2837,47 +4770,112 @@ class Game:
                             print(f"Failed to send to {addr}: {e}")
                 
                 broadcast_count += 1
-                time.sleep(0.5)
+                await asyncio.sleep(0.5)
+            except asyncio.CancelledError:
+                break
             except Exception as e:
                 print(f"Broadcast error: {e}")
                 break
         
         print("Stopped broadcasting")
     
-    def accept_connections(self):
-        """Accept multiple incoming connections"""
-        self.network_socket.settimeout(1.0)
-        print("Waiting for connections...")
-        
-        while self.is_host and len(self.lobby_players) < self.max_players and self.state == GameState.HOST_WAIT:
-            try:
-                client_socket, addr = self.network_socket.accept()
-                print(f"Connection from {addr}")
-                
-                # Receive player name
-                client_socket.settimeout(5.0)
-                player_name = client_socket.recv(1024).decode()
-                
-                # Send player index to client
-                player_index = len(self.client_connections) + 1  # Host is 0, clients are 1, 2, 3...
+    async def handle_client_connection(self, reader, writer):
+        """One client from handshake to hang-up - every client gets its own coroutine, so joins never queue up"""
+        client = ClientConnection(asyncio.get_running_loop(), reader, writer)
+        writer_task = asyncio.create_task(client.write_loop())
+        print(f"Connection from {client.address}")
+        try:
+            # Receive player name
+            msg_type, _, payload = await asyncio.wait_for(read_frame(reader, client.decoder), HANDSHAKE_TIMEOUT)
+            if msg_type != MSG_HELLO:
+                raise ProtocolError(f"expected hello, got message type {msg_type}")
+            if self.state != GameState.HOST_WAIT or len(self.lobby_players) >= self.max_players:
+                print(f"Turned away {client.address[0]}: lobby {'full' if self.state == GameState.HOST_WAIT else 'closed'}")
+                return
+            client.name = payload.decode(errors="replace")
+            
+            # Send player index to client
+            player_index = len(self.client_connections) + self.first_client_index  # Host is 0, clients are 1, 2, 3...
+            client.sendall(encode_frame(MSG_WELCOME, 0, struct.pack("!B", player_index)))
+            print(f"Sent player index {player_index} to {client.name}")
+            
+            self.client_connections.append(client)
+            self.lobby_players.append(client.name)
+            taken = set(self.player_colors_taken.values())
+            self.player_colors_taken[player_index] = next((i for i in range(len(self.available_colors)) if i not in taken), 0)
+            
+            # Update can_start flag
+            self.can_start = len(self.lobby_players) >= 2
+            self.send_roster()
+            print(f"Player {client.name} connected from {client.address[0]}. Total players: {len(self.lobby_players)}")
+            
+            while True:
+                received = await reader.read(65536)
+                if not received:
+                    break
+                client.decoder.feed(received)
                 try:
-                    client_socket.send(str(player_index).encode())
-                    print(f"Sent player index {player_index} to {player_name}")
-                except:
-                    pass
-                
-                self.client_connections.append(client_socket)
-                self.lobby_players.append(player_name)
-                
-                # Update can_start flag
-                self.can_start = len(self.lobby_players) >= 2
-                
-                print(f"Player {player_name} connected from {addr[0]}. Total players: {len(self.lobby_players)}")
-            except socket.timeout:
-                continue
-            except Exception as e:
-                print(f"Connection accept error: {e}")
-                continue
+                    if self.state == GameState.BATTLE:
+                        self.telemetry.count_in(len(received))
+                        self.handle_network_frames(client, client.decoder.frames())
+                    else:
+                        self.handle_lobby_frames(client, client.decoder.frames())
+                except ProtocolError as e:
+                    self.telemetry.error("decode", e)
+                    print(f"Bad data from {client.name}: {e}")
+        except asyncio.TimeoutError:
+            print(f"{client.address[0]} never said hello")
+        except ProtocolError as e:
+            print(f"Bad handshake from {client.address[0]}: {e}")
+        except (ConnectionError, OSError):
+            pass
+        except asyncio.CancelledError:
+            pass  # Host shutting down (see serve_host)
+        finally:
+            self.drop_client(client)
+            writer_task.cancel()
+            client.closed = True
+            writer.close()
+    
+    def drop_client(self, client):
+        """Forget a client that hung up - in the lobby everyone after it moves up a slot"""
+        if client not in self.client_connections:
+            return
+        print(f"{client.name} left")
+        if self.state != GameState.HOST_WAIT:
+            self.lost_peers.add(client)
+            return
+        slot = self.client_connections.index(client)
+        old_indexes = {c: i + self.first_client_index for i, c in enumerate(self.client_connections)}
+        self.client_connections.remove(client)
+        del self.lobby_players[slot + self.first_client_index]
+        colors = [self.player_colors_taken.get(i) for i in range(len(self.lobby_players) + 1)]
+        del colors[slot + self.first_client_index]
+        self.player_colors_taken = {i: color for i, color in enumerate(colors) if color is not None}
+        for i, other in enumerate(self.client_connections):
+            if old_indexes[other] != i + self.first_client_index:
+                other.sendall(encode_frame(MSG_WELCOME, 0, struct.pack("!B", i + self.first_client_index)))
+        self.can_start = len(self.lobby_players) >= 2
+        self.send_roster()
+    
+    def handle_lobby_frames(self, client, frames):
+        """Host: color requests from a client in the lobby"""
+        for msg_type, _, payload in frames:
+            if msg_type == MSG_COLOR and len(payload) == 1 and client in self.client_connections:
+                index = self.client_connections.index(client) + self.first_client_index
+                color_index = payload[0]
+                if color_index < len(self.available_colors) and color_index not in [v for k, v in self.player_colors_taken.items() if k != index]:
+                    self.player_colors_taken[index] = color_index
+                    print(f"{client.name} picked {self.available_colors[color_index][0]}")
+                self.send_roster()  # Tells the client if it didn't get it, too
+    
+    def send_roster(self):
+        """Host: tell every client who's in the lobby in which color (safe from any thread)"""
+        names = list(self.lobby_players)
+        colors = [self.player_colors_taken.get(i, 0) for i in range(len(names))]
+        frame = encode_frame(MSG_ROSTER, 0, encode_roster(names, colors))
+        for client in list(self.client_connections):
+            client.sendall(frame)
     
     def start_server_browser(self):
         """Start scanning for servers"""
@@ -2927,19 +4925,20 @@ class Game:
                             server_ip = parts[1]
                             player_count = parts[2]
                             lobby_code = parts[3]
+                            port = int(parts[4]) if len(parts) >= 5 and parts[4].isdigit() else GAME_PORT  # Older hosts don't send it
                             
                             # Update last broadcast time
                             self.last_broadcast_time = time.time()
                             
-                            print(f"  -> Parsed: IP={server_ip}, Players={player_count}, Code={lobby_code}")
+                            print(f"  -> Parsed: IP={server_ip}, Port={port}, Players={player_count}, Code={lobby_code}")
                             
                             # Update or add server
-                            server_info = {"ip": server_ip, "players": player_count, "code": lobby_code}
+                            server_info = {"ip": server_ip, "players": player_count, "code": lobby_code, "port": port}
                             
                             # Check if server already in list
                             found = False
                             for i, server in enumerate(self.discovered_servers):
-                                if server["ip"] == server_ip or server.get("code") == lobby_code:
+                                if (server["ip"], server.get("port")) == (server_ip, port) or server.get("code") == lobby_code:
                                     self.discovered_servers[i] = server_info
                                     found = True
                                     print(f"  -> Updated existing server")
@@ -2974,13 +4973,22 @@ class Game:
         for server in self.discovered_servers:
             if server.get("code") == code:
                 print(f"Found server with code {code} at IP {server['ip']}")
-                threading.Thread(target=self.start_client, args=(server["ip"],), daemon=True).start()
+                threading.Thread(target=self.start_client, args=(server["ip"], server.get("port", GAME_PORT)), daemon=True).start()
                 return
         
         # Code not found in discovered servers
+        self.connection_status = f"Trying to connect to code '{code}'..."
+        
+        # A match server might host it - ask the front-end on every machine we've heard from (and this one)
+        for ip_address in dict.fromkeys([server["ip"] for server in self.discovered_servers] + ['127.0.0.1']):
+            port = lookup_lobby(ip_address, code)
+            if port is not None:
+                print(f"Match server at {ip_address} has code {code} on port {port}")
+                threading.Thread(target=self.start_client, args=(ip_address, port), daemon=True).start()
+                return
+        
         # Try localhost as fallback (for testing on same computer)
         print(f"Code {code} not in discovered servers, trying localhost...")
-        self.connection_status = f"Trying to connect to code '{code}'..."
         
         # Try localhost first (for same-computer testing)
         try:
@@ -2999,26 +5007,30 @@ class Game:
         self.connection_status = f"Lobby code '{code}' not found. Make sure host is in lobby."
         print(f"No server found with code {code}. Discovered servers: {len(self.discovered_servers)}")
     
-    def start_client(self, ip_address):
+    def start_client(self, ip_address, port=GAME_PORT):
         """Connect to host"""
         try:
-            print(f"Attempting to connect to {ip_address}:{GAME_PORT}...")
+            print(f"Attempting to connect to {ip_address}:{port}...")
             self.is_host = False
             self.is_network_game = True
             self.is_cpu_mode = False
+            self.game_port = port
             
             self.network_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.network_socket.settimeout(10.0)
-            self.network_socket.connect((ip_address, GAME_PORT))
+            self.network_socket.connect((ip_address, port))
             
             # Send player name
-            self.network_socket.send(self.player_name.encode())
+            self.network_socket.sendall(encode_frame(MSG_HELLO, 0, self.player_name.encode()))
             print(f"Connected as {self.player_name}")
             
             # Receive player index from host
             self.network_socket.settimeout(5.0)
-            player_index_str = self.network_socket.recv(1024).decode()
-            self.my_player_index = int(player_index_str)
+            self.host_decoder = FrameDecoder()
+            msg_type, _, payload = recv_frame(self.network_socket, self.host_decoder)
+            if msg_type != MSG_WELCOME or len(payload) != 1:
+                raise ProtocolError(f"expected welcome, got message type {msg_type}")
+            self.my_player_index = payload[0]
             print(f"Assigned player index: {self.my_player_index}")
             
             self.connection_status = "Connected! Waiting for host to start..."
@@ -3042,17 +5054,24 @@ class Game:
             
             while self.state == GameState.HOST_WAIT and not self.is_host:
                 try:
-                    data = self.network_socket.recv(1024)
-                    if not data:
-                        print("Connection closed by host")
-                        break
-                    
-                    message = data.decode()
-                    print(f"Received from host: {message}")
+                    msg_type, _, payload = recv_frame(self.network_socket, self.host_decoder)
+                    print(f"Received message type {msg_type} from host")
                     
-                    if message == "START_GAME":
-                        print("Received START_GAME signal! Entering battle...")
-                        self.reset_battle()
+                    if msg_type == MSG_ROSTER:
+                        # Who's in the lobby, in which color (ours included, as the host accepted it)
+                        roster = decode_roster(payload)
+                        self.lobby_players = [name for name, _ in roster]
+                        self.player_colors_taken = {i: color_index for i, (_, color_index) in enumerate(roster)}
+                        if self.my_player_index in self.player_colors_taken:
+                            self.selected_color_index = self.player_colors_taken[self.my_player_index]
+                    elif msg_type == MSG_WELCOME and len(payload) == 1:
+                        # Someone before us left the lobby
+                        self.my_player_index = payload[0]
+                        print(f"Now player index {self.my_player_index}")
+                    elif msg_type == MSG_START:
+                        map_name = payload.decode(errors="replace")
+                        print(f"Received START_GAME signal! Entering battle on {map_name}...")
+                        self.reset_battle(map_name if map_name in MAPS else None)
                         self.state = GameState.BATTLE
                         self.network_running = True
                         
@@ -3062,6 +5081,9 @@ class Game:
                         
                         break
                         
+                except ConnectionError:
+                    print("Connection closed by host")
+                    break
                 except Exception as e:
                     print(f"Error receiving start signal: {e}")
                     break
@@ -3074,9 +5096,9 @@ class Game:
         screen.fill(DARK_BLUE)
         
         if self.is_host:
-            title = title_font.render("LOBBY", True, YELLOW)
+            title = render_text(title_font, "LOBBY", YELLOW)
         else:
-            title = title_font.render("WAITING FOR HOST", True, YELLOW)
+            title = render_text(title_font, "WAITING FOR HOST", YELLOW)
         screen.blit(title, title.get_rect(center=(SCREEN_WIDTH // 2, 50)))
         
         if self.is_host:
@@ -3085,102 +5107,103 @@ class Game:
             pygame.draw.rect(screen, GREEN, code_box)
             pygame.draw.rect(screen, YELLOW, code_box, 4)
             
-            code_label = tiny_font.render("LOBBY CODE:", True, BLACK)
+            code_label = render_text(tiny_font, "LOBBY CODE:", BLACK)
             screen.blit(code_label, code_label.get_rect(center=(SCREEN_WIDTH // 2, 105)))
             
-            code_text = menu_font.render(self.lobby_code, True, BLACK)
+            code_text = render_text(menu_font, self.lobby_code, BLACK)
             screen.blit(code_text, code_text.get_rect(center=(SCREEN_WIDTH // 2, 130)))
             
             # Show lobby info
-            status = text_font.render(f"Players: {len(self.lobby_players)}/{self.max_players}", True, WHITE)
+            status = render_text(text_font, f"Players: {len(self.lobby_players)}/{self.max_players}", WHITE)
             screen.blit(status, status.get_rect(center=(SCREEN_WIDTH // 2, 180)))
+        else:
+            # Client waiting
+            wait_text = render_text(text_font, self.connection_status, WHITE)
+            screen.blit(wait_text, wait_text.get_rect(center=(SCREEN_WIDTH // 2, 130)))
+        
+        # Color selection (everyone picks their own)
+        color_label = render_text(small_font, "Your Color:", WHITE)
+        screen.blit(color_label, (100, 220))
+        
+        # Color palette
+        color_y = 260
+        for i, (color_name, color_rgb) in enumerate(self.available_colors[:5]):
+            color_x = 100 + i * 80
+            color_box = pygame.Rect(color_x, color_y, 60, 60)
             
-            # Color selection for host
-            color_label = small_font.render("Your Color:", True, WHITE)
-            screen.blit(color_label, (100, 220))
+            # Check if color is taken by another player
+            is_taken = i in [v for k, v in self.player_colors_taken.items() if k != self.my_player_index]
+            is_selected = i == self.selected_color_index
             
-            # Color palette
-            color_y = 260
-            for i, (color_name, color_rgb) in enumerate(self.available_colors[:5]):
-                color_x = 100 + i * 80
-                color_box = pygame.Rect(color_x, color_y, 60, 60)
-                
-                # Check if color is taken by another player
-                is_taken = i in [v for k, v in self.player_colors_taken.items() if k != 0]
-                is_selected = i == self.selected_color_index
-                
-                if is_taken:
-                    # Grayed out with X
-                    pygame.draw.rect(screen, DARK_GRAY, color_box)
-                    pygame.draw.line(screen, RED, (color_x, color_y), (color_x + 60, color_y + 60), 4)
-                    pygame.draw.line(screen, RED, (color_x + 60, color_y), (color_x, color_y + 60), 4)
-                else:
-                    pygame.draw.rect(screen, color_rgb, color_box)
-                
-                if is_selected and not is_taken:
-                    pygame.draw.rect(screen, WHITE, color_box, 4)
-                else:
-                    pygame.draw.rect(screen, BLACK, color_box, 2)
-                
-                name_text = tiny_font.render(color_name, True, WHITE)
-                screen.blit(name_text, (color_x, color_y + 65))
-            
-            # Second row of colors
-            color_y2 = 360
-            for i, (color_name, color_rgb) in enumerate(self.available_colors[5:10]):
-                color_x = 100 + i * 80
-                actual_index = i + 5
-                color_box = pygame.Rect(color_x, color_y2, 60, 60)
-                
-                is_taken = actual_index in [v for k, v in self.player_colors_taken.items() if k != 0]
-                is_selected = actual_index == self.selected_color_index
-                
-                if is_taken:
-                    pygame.draw.rect(screen, DARK_GRAY, color_box)
-                    pygame.draw.line(screen, RED, (color_x, color_y2), (color_x + 60, color_y2 + 60), 4)
-                    pygame.draw.line(screen, RED, (color_x + 60, color_y2), (color_x, color_y2 + 60), 4)
-                else:
-                    pygame.draw.rect(screen, color_rgb, color_box)
-                
-                if is_selected and not is_taken:
-                    pygame.draw.rect(screen, WHITE, color_box, 4)
-                else:
-                    pygame.draw.rect(screen, BLACK, color_box, 2)
-                
-                name_text = tiny_font.render(color_name, True, WHITE)
-                screen.blit(name_text, (color_x, color_y2 + 65))
+            if is_taken:
+                # Grayed out with X
+                pygame.draw.rect(screen, DARK_GRAY, color_box)
+                pygame.draw.line(screen, RED, (color_x, color_y), (color_x + 60, color_y + 60), 4)
+                pygame.draw.line(screen, RED, (color_x + 60, color_y), (color_x, color_y + 60), 4)
+            else:
+                pygame.draw.rect(screen, color_rgb, color_box)
             
-            inst_colors = tiny_font.render("←→: Choose Color", True, LIGHT_GRAY)
-            screen.blit(inst_colors, (100, 450))
+            if is_selected and not is_taken:
+                pygame.draw.rect(screen, WHITE, color_box, 4)
+            else:
+                pygame.draw.rect(screen, BLACK, color_box, 2)
+            
+            name_text = render_text(tiny_font, color_name, WHITE)
+            screen.blit(name_text, (color_x, color_y + 65))
+        
+        # Second row of colors
+        color_y2 = 360
+        for i, (color_name, color_rgb) in enumerate(self.available_colors[5:10]):
+            color_x = 100 + i * 80
+            actual_index = i + 5
+            color_box = pygame.Rect(color_x, color_y2, 60, 60)
+            
+            is_taken = actual_index in [v for k, v in self.player_colors_taken.items() if k != self.my_player_index]
+            is_selected = actual_index == self.selected_color_index
+            
+            if is_taken:
+                pygame.draw.rect(screen, DARK_GRAY, color_box)
+                pygame.draw.line(screen, RED, (color_x, color_y2), (color_x + 60, color_y2 + 60), 4)
+                pygame.draw.line(screen, RED, (color_x + 60, color_y2), (color_x, color_y2 + 60), 4)
+            else:
+                pygame.draw.rect(screen, color_rgb, color_box)
             
-            # Player list
-            list_y = 490
-            players_label = small_font.render("Connected Players:", True, WHITE)
-            screen.blit(players_label, (SCREEN_WIDTH // 2 + 100, list_y))
-            for i, player in enumerate(self.lobby_players):
-                player_text = tiny_font.render(f"{i+1}. {player}", True, GREEN)
-                screen.blit(player_text, (SCREEN_WIDTH // 2 + 100, list_y + 30 + i * 25))
+            if is_selected and not is_taken:
+                pygame.draw.rect(screen, WHITE, color_box, 4)
+            else:
+                pygame.draw.rect(screen, BLACK, color_box, 2)
             
+            name_text = render_text(tiny_font, color_name, WHITE)
+            screen.blit(name_text, (color_x, color_y2 + 65))
+        
+        inst_colors = render_text(tiny_font, "←→: Choose Color", LIGHT_GRAY)
+        screen.blit(inst_colors, (100, 450))
+        
+        # Player list
+        list_y = 490
+        players_label = render_text(small_font, "Connected Players:", WHITE)
+        screen.blit(players_label, (SCREEN_WIDTH // 2 + 100, list_y))
+        for i, player in enumerate(self.lobby_players):
+            player_text = render_text(tiny_font, f"{i+1}. {player}", GREEN)
+            screen.blit(player_text, (SCREEN_WIDTH // 2 + 100, list_y + 30 + i * 25))
+        
+        if self.is_host:
             # Start button or waiting message
             if self.can_start:
                 start_rect = pygame.Rect(SCREEN_WIDTH // 2 - 100, 550, 200, 60)
                 pygame.draw.rect(screen, GREEN, start_rect)
                 pygame.draw.rect(screen, WHITE, start_rect, 3)
-                start_text = menu_font.render("START", True, BLACK)
+                start_text = render_text(menu_font, "START", BLACK)
                 screen.blit(start_text, start_text.get_rect(center=start_rect.center))
                 
-                inst = small_font.render("Press ENTER to start | ESC to cancel", True, LIGHT_GRAY)
+                inst = render_text(small_font, "Press ENTER to start | ESC to cancel", LIGHT_GRAY)
             else:
-                wait_text = text_font.render("Waiting for players...", True, ORANGE)
+                wait_text = render_text(text_font, "Waiting for players...", ORANGE)
                 screen.blit(wait_text, wait_text.get_rect(center=(SCREEN_WIDTH // 2, 570)))
                 
-                inst = small_font.render("Need at least 2 players | ESC to cancel", True, LIGHT_GRAY)
+                inst = render_text(small_font, "Need at least 2 players | ESC to cancel", LIGHT_GRAY)
         else:
-            # Client waiting
-            wait_text = text_font.render(self.connection_status, True, WHITE)
-            screen.blit(wait_text, wait_text.get_rect(center=(SCREEN_WIDTH // 2, 300)))
-            
-            inst = small_font.render("ESC to cancel", True, LIGHT_GRAY)
+            inst = render_text(small_font, "ESC to cancel", LIGHT_GRAY)
         
         screen.blit(inst, inst.get_rect(center=(SCREEN_WIDTH // 2, 640)))
     
@@ -3188,7 +5211,7 @@ class Game:
         """Draw character color selection screen"""
         screen.fill(DARK_BLUE)
         
-        title = title_font.render("Choose Your Color", True, YELLOW)
+        title = render_text(title_font, "Choose Your Color", YELLOW)
         screen.blit(title, title.get_rect(center=(SCREEN_WIDTH // 2, 80)))
         
         # Color palette - first row
@@ -3214,7 +5237,7 @@ class Game:
             else:
                 pygame.draw.rect(screen, BLACK, color_box, 3)
             
-            name_text = small_font.render(color_name, True, WHITE)
+            name_text = render_text(small_font, color_name, WHITE)
             screen.blit(name_text, name_text.get_rect(center=(color_x + 50, color_y + 120)))
         
         # Second row of colors
@@ -3239,7 +5262,7 @@ class Game:
             else:
                 pygame.draw.rect(screen, BLACK, color_box, 3)
             
-            name_text = small_font.render(color_name, True, WHITE)
+            name_text = render_text(small_font, color_name, WHITE)
             screen.blit(name_text, name_text.get_rect(center=(color_x + 50, color_y2 + 120)))
         
         # Team Mode Checkbox
@@ -3256,41 +5279,41 @@ class Game:
             pygame.draw.line(screen, GREEN, (checkbox_x + 12, checkbox_y + 22), (checkbox_x + 25, checkbox_y + 8), 4)
         
         # Label
-        team_label = menu_font.render("Team Mode (Get CPU Teammates)", True, WHITE)
+        team_label = render_text(menu_font, "Team Mode (Get CPU Teammates)", WHITE)
         screen.blit(team_label, (checkbox_x + 40, checkbox_y))
         
         # Instructions
-        inst = small_font.render("←→: Choose Color | T: Toggle Team Mode | ENTER: Confirm | ESC: Back", True, LIGHT_GRAY)
+        inst = render_text(small_font, "←→: Choose Color | T: Toggle Team Mode | ENTER: Confirm | ESC: Back", LIGHT_GRAY)
         screen.blit(inst, inst.get_rect(center=(SCREEN_WIDTH // 2, 600)))
     
     def draw_join_game(self):
         """Draw server browser with code input"""
         screen.fill(DARK_BLUE)
         
-        title = title_font.render("Join Game", True, YELLOW)
+        title = render_text(title_font, "Join Game", YELLOW)
         screen.blit(title, title.get_rect(center=(SCREEN_WIDTH // 2, 50)))
         
         # Code input section
-        code_label = text_font.render("Enter Lobby Code:", True, WHITE)
+        code_label = render_text(text_font, "Enter Lobby Code:", WHITE)
         screen.blit(code_label, (SCREEN_WIDTH // 2 - 140, 100))
         
         code_box = pygame.Rect(SCREEN_WIDTH // 2 - 150, 140, 300, 50)
         pygame.draw.rect(screen, WHITE, code_box, 3)
         pygame.draw.rect(screen, (30, 30, 50), code_box)
         
-        code_display = menu_font.render(self.input_code, True, YELLOW)
+        code_display = render_text(menu_font, self.input_code, YELLOW)
         screen.blit(code_display, (code_box.x + 10, code_box.y + 8))
         
-        code_inst = tiny_font.render("Type code and press ENTER to join", True, LIGHT_GRAY)
+        code_inst = render_text(tiny_font, "Type code and press ENTER to join", LIGHT_GRAY)
         screen.blit(code_inst, (SCREEN_WIDTH // 2 - 130, 195))
         
         # Divider
         pygame.draw.line(screen, GRAY, (100, 230), (SCREEN_WIDTH - 100, 230), 2)
-        or_text = small_font.render("OR", True, GRAY)
+        or_text = render_text(small_font, "OR", GRAY)
         screen.blit(or_text, (SCREEN_WIDTH // 2 - 15, 220))
         
         # Available games section
-        available_label = text_font.render("Available Games:", True, WHITE)
+        available_label = render_text(text_font, "Available Games:", WHITE)
         screen.blit(available_label, (100, 260))
         
         # Show scanning status with activity indicator
@@ -3302,21 +5325,21 @@ class Game:
             scan_status = "Scanning..."
             scan_color = LIGHT_GRAY
         
-        scan_text = tiny_font.render(f"{scan_status} | Found: {len(self.discovered_servers)}", True, scan_color)
+        scan_text = render_text(tiny_font, f"{scan_status} | Found: {len(self.discovered_servers)}", scan_color)
         screen.blit(scan_text, (SCREEN_WIDTH - 300, 265))
         
         # Connection status message if any
         if self.connection_status and self.connection_status != "Waiting...":
-            status_msg = small_font.render(self.connection_status, True, ORANGE)
+            status_msg = render_text(small_font, self.connection_status, ORANGE)
             screen.blit(status_msg, status_msg.get_rect(center=(SCREEN_WIDTH // 2, 600)))
         
         # Server list
         if not self.discovered_servers:
-            no_servers = small_font.render("No games found yet...", True, GRAY)
+            no_servers = render_text(small_font, "No games found yet...", GRAY)
             screen.blit(no_servers, no_servers.get_rect(center=(SCREEN_WIDTH // 2, 380)))
             
             # Testing help
-            test_hint = tiny_font.render("Testing on same computer? Make sure host is in lobby screen!", True, DARK_GRAY)
+            test_hint = render_text(tiny_font, "Testing on same computer? Make sure host is in lobby screen!", DARK_GRAY)
             screen.blit(test_hint, test_hint.get_rect(center=(SCREEN_WIDTH // 2, 410)))
         else:
             list_y = 300
@@ -3334,20 +5357,20 @@ class Game:
                     text_color = WHITE
                 
                 # Server info with code
-                code_text = small_font.render(f"Code: {server.get('code', 'N/A')}", True, text_color)
+                code_text = render_text(small_font, f"Code: {server.get('code', 'N/A')}", text_color)
                 screen.blit(code_text, (server_rect.x + 20, server_rect.y + 8))
                 
-                info_text = tiny_font.render(f"IP: {server['ip']} | Players: {server['players']}/{self.max_players}", True, text_color)
+                info_text = render_text(tiny_font, f"IP: {server['ip']} | Players: {server['players']}/{self.max_players}", text_color)
                 screen.blit(info_text, (server_rect.x + 20, server_rect.y + 32))
         
         # Debug info
         debug_y = 630
         if self.discovered_servers:
-            debug_msg = tiny_font.render(f"Servers found: {[s.get('code', 'N/A') for s in self.discovered_servers]}", True, DARK_GRAY)
+            debug_msg = render_text(tiny_font, f"Servers found: {[s.get('code', 'N/A') for s in self.discovered_servers]}", DARK_GRAY)
             screen.blit(debug_msg, (20, debug_y))
         
         # Instructions
-        inst = small_font.render("↑↓: Select | ENTER: Join | Type code above | ESC: Cancel", True, LIGHT_GRAY)
+        inst = render_text(small_font, "↑↓: Select | ENTER: Join | Type code above | ESC: Cancel", LIGHT_GRAY)
         screen.blit(inst, inst.get_rect(center=(SCREEN_WIDTH // 2, 665)))
     
     def handle_join_input(self, event):
@@ -3383,47 +5406,27 @@ class Game:
         """Handle lobby input"""
         if event.type == pygame.KEYDOWN:
             # Color selection (arrow keys)
-            if event.key == pygame.K_LEFT:
-                if self.is_host:
-                    # Cycle through available colors
-                    for _ in range(len(self.available_colors)):
-                        self.selected_color_index = (self.selected_color_index - 1) % len(self.available_colors)
-                        # Check if this color is not taken
-                        if self.selected_color_index not in [v for k, v in self.player_colors_taken.items() if k != 0]:
-                            break
-                    self.player_colors_taken[0] = self.selected_color_index
-                    self.player1.color = self.available_colors[self.selected_color_index][1]
-                    print(f"Selected color: {self.available_colors[self.selected_color_index][0]}")
-            elif event.key == pygame.K_RIGHT:
+            if event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                step = -1 if event.key == pygame.K_LEFT else 1
+                # Cycle through available colors
+                for _ in range(len(self.available_colors)):
+                    self.selected_color_index = (self.selected_color_index + step) % len(self.available_colors)
+                    # Check if this color is not taken
+                    if self.selected_color_index not in [v for k, v in self.player_colors_taken.items() if k != self.my_player_index]:
+                        break
+                print(f"Selected color: {self.available_colors[self.selected_color_index][0]}")
                 if self.is_host:
-                    # Cycle through available colors
-                    for _ in range(len(self.available_colors)):
-                        self.selected_color_index = (self.selected_color_index + 1) % len(self.available_colors)
-                        # Check if this color is not taken
-                        if self.selected_color_index not in [v for k, v in self.player_colors_taken.items() if k != 0]:
-                            break
                     self.player_colors_taken[0] = self.selected_color_index
                     self.player1.color = self.available_colors[self.selected_color_index][1]
-                    print(f"Selected color: {self.available_colors[self.selected_color_index][0]}")
-            elif event.key == pygame.K_ESCAPE:
-                # Clean up connections
-                if self.network_socket:
-                    try:
-                        self.network_socket.close()
-                    except:
-                        pass
-                if self.broadcast_socket:
-                    try:
-                        self.broadcast_socket.close()
-                    except:
-                        pass
-                for client in self.client_connections:
+                    self.send_roster()
+                else:
+                    # The host has the final say (the next roster tells us)
                     try:
-                        client.close()
+                        self.network_socket.sendall(encode_frame(MSG_COLOR, 0, struct.pack("!B", self.selected_color_index)))
                     except:
                         pass
-                self.client_connections = []
-                self.lobby_players = []
+            elif event.key == pygame.K_ESCAPE:
+                self.close_network()
                 self.is_host = False
                 self.state = GameState.MENU
             elif event.key == pygame.K_LEFT and self.is_host:
@@ -3444,139 +5447,549 @@ class Game:
                     print(f"Host selected color: {selected_color_name}")
                 
                 # Start the game!
-                print(f"Host starting game with {len(self.lobby_players)} players")
-                
-                # Send START signal to all clients
-                for client in self.client_connections:
-                    try:
-                        client.send(b"START_GAME")
-                        print(f"Sent START signal to client")
-                    except Exception as e:
-                        print(f"Failed to send start signal: {e}")
-                
-                self.reset_battle()
-                self.state = GameState.BATTLE
-                self.network_running = True
-                self.my_player_index = 0  # Host is always player 0
-                
-                # Start network sync thread for host
-                if self.is_network_game:
-                    sync_thread = threading.Thread(target=self.network_sync_loop, daemon=True)
-                    sync_thread.start()
-                
-                print(f"Host entered battle state as player index {self.my_player_index}")
+                self.start_network_battle()
+    
+    def start_network_battle(self, map_name=None):
+        """Host: tell every client to start (on the same map) and enter the battle"""
+        print(f"Host starting game with {len(self.lobby_players)} players")
+        
+        # Send START signal to all clients - with the map, so everyone fights on the same one
+        if map_name is None:
+            map_name = random.choice(list(MAPS.keys()))
+        for client in self.client_connections:
+            try:
+                client.sendall(encode_frame(MSG_START, 0, map_name.encode()))
+                print(f"Sent START signal to client")
+            except Exception as e:
+                print(f"Failed to send start signal: {e}")
+        
+        self.reset_battle(map_name)
+        # Everyone fights in the color they picked in the lobby (clients get it with the state)
+        for index, color_index in self.player_colors_taken.items():
+            if index < len(self.all_players) and color_index < len(self.available_colors):
+                self.all_players[index].color = self.available_colors[color_index][1]
+        self.state = GameState.BATTLE
+        self.network_running = True
+        self.my_player_index = NO_PLAYER if self.dedicated_server else 0  # Host is always player 0
+        
+        # Battle sync runs on the host's network loop, next to the clients' connections
+        asyncio.run_coroutine_threadsafe(self.host_sync_loop(), self.host_loop)
+        
+        print(f"Host entered battle state as player index {self.my_player_index}")
+    
+    def close_network(self):
+        """Stop the host's network loop, close the lobby, battle and broadcast sockets and forget every client"""
+        if self.host_loop is not None:
+            try:
+                self.host_loop.call_soon_threadsafe(self.host_stop.set)
+            except RuntimeError:
+                pass  # Loop already gone
+            if self.network_thread is not None and self.network_thread is not threading.current_thread():
+                self.network_thread.join(2.0)
+            self.host_loop = None
+        if self.network_socket:
+            try:
+                self.network_socket.close()
+            except:
+                pass
+        if self.broadcast_socket:
+            try:
+                self.broadcast_socket.close()
+            except:
+                pass
+        if self.udp_socket:
+            try:
+                self.udp_socket.close()
+            except:
+                pass
+            self.udp_socket = None
+        for client in self.client_connections:
+            try:
+                client.close()
+            except:
+                pass
+        self.client_connections = []
+        self.lobby_players = []
+    
+    def build_sync_data(self, indexes=None):
+        """Snapshot of ALL players (or just the given indexes) for synchronized screens"""
+        all_players_data = []
+        for i, player in enumerate(self.all_players):
+            if indexes is not None and i not in indexes:
+                continue
+            player_data = {
+                'index': i,
+                'x': player.x,
+                'y': player.y,
+                'health': player.health,
+                'max_health': player.max_health,
+                'weapon': player.weapon,
+                'facing_right': player.facing_right,
+                'color': player.color,
+                'velocity_y': player.velocity_y,
+                'on_ground': player.on_ground,
+                'projectiles': [(p.net_id, p.x, p.y, p.dx, p.dy, p.damage, p.color, p.has_explosion) for p in player.projectiles]
+            }
+            all_players_data.append(player_data)
+        
+        # Add metadata about who sent this
+        return {
+            'sender_index': self.my_player_index,
+            'all_players': all_players_data,
+            'timestamp': time.time()
+        }
+    
+    async def host_sync_loop(self):
+        """Host: send hits, input acks and state to every client at network_send_rate (on the host's network loop).
+        The host is the authority: it sends state, clients send their inputs and predict their own
+        player (see update_battle). State, inputs and acks go over UDP (a lost packet only costs that
+        packet); hits, knockouts and oversized snapshots go over the TCP connection.
+        """
+        print(f"Starting network sync loop at {self.network_send_rate} Hz...")
+        
+        # Fresh delta baselines every battle - the first snapshot is a full one
+        peers = list(self.client_connections)
+        self.snapshot_encoders = {peer: SnapshotEncoder() for peer in peers}
+        self.snapshot_decoders = {}
+        self.peer_indexes = {peer: idx + self.first_client_index for idx, peer in enumerate(peers)}
+        self.peer_udp_addresses = {}
+        self.lost_peers = {peer for peer in peers if peer.closed}
+        self.event_health = {i: player.health for i, player in enumerate(self.all_players)}
+        self.last_interaction = {}
+        self.known_projectiles = {}
+        self.telemetry.reset()
+        scheduler = TickScheduler(self.network_send_rate)
+        last_report = time.time()
+        
+        while self.network_running and self.state == GameState.BATTLE:
+            # Clients' data is handled by their own coroutines meanwhile
+            await asyncio.sleep(scheduler.time_until_next())
+            if not scheduler.due():
+                continue
+            scheduler.tick()
+            self.network_tick += 1
+            try:
+                self.send_host_updates()
+            except Exception as e:
+                print(f"Network sync error: {e}")
+            
+            self.network_sync_stats = scheduler.stats()
+            self.send_queue_stats = {client.name: client.stats() for client in self.client_connections}
+            if time.time() - last_report >= NETWORK_STATS_INTERVAL:
+                last_report = time.time()
+                self.print_sync_stats()
+                queues = ", ".join(f"{name} {stats['depth']}/{stats['max_depth']} (replaced {stats['replaced']}"
+                                   f"{', lagging' if stats['lagging'] else ''}{', dropped' if stats['dropped'] else ''})"
+                                   for name, stats in self.send_queue_stats.items())
+                print(f"📤 Send queues now/worst: {queues}")
+        
+        print("Network sync loop ended")
+    
+    def send_host_updates(self):
+        """One host sync tick: hits and knockouts, then each client's input ack and state.
+        Only encodes and sends - the state itself is built by the game loop after each tick (see update_battle)"""
+        # Hits and knockouts first, reliably over TCP
+        hit_events = self.collect_hit_events()
+        if hit_events:
+            event_frame = encode_frame(MSG_EVENT, self.network_tick, encode_events(hit_events))
+            for client in self.client_connections:
+                client.sendall(event_frame)
+                self.telemetry.count_out(len(event_frame))
+        
+        # Host broadcasts game state to all clients (as a delta against what each one has, players that matter
+        # less to a client less often), plus where each client's own inputs got its player
+        with self.sync_lock:
+            sync_data, self.host_sync_data = self.host_sync_data, None
+        if sync_data is None:
+            return  # The game loop hasn't simulated a tick since the last send
+        snapshot = pack_snapshot(sync_data)
+        now = time.time()
+        self.note_interactions(snapshot, now)
+        budget = CLIENT_SNAPSHOT_BUDGET / self.network_send_rate if CLIENT_SNAPSHOT_BUDGET else None
+        for client in self.client_connections:
+            if client in self.lost_peers:
+                continue
+            try:
+                input_ack = self.input_acks.get(self.peer_indexes[client])
+                if input_ack is not None:
+                    self.send_to_peer(client, encode_frame(MSG_INPUT_ACK, self.network_tick, INPUT_ACK_RECORD.pack(*input_ack)))
+                priorities = None
+                if RELEVANCE_FILTERING:
+                    priorities = relevance_priorities(self.all_players, self.peer_indexes[client], self.last_interaction, now)
+                payload = self.snapshot_encoders[client].encode(self.network_tick, sync_data, snapshot, priorities, budget)
+                self.send_to_peer(client, encode_frame(MSG_STATE, self.network_tick, payload))
+                self.telemetry.expect_ack(client, self.network_tick)
+            except Exception as e:
+                self.telemetry.error("send", e)
+    
+    def note_interactions(self, snapshot, now):
+        """Host: remember who just shot at whom (a new projectile flying within RELEVANCE_AIM_ANGLE of a player),
+        for relevance_priorities"""
+        min_cos = math.cos(math.radians(RELEVANCE_AIM_ANGLE))
+        for index, (_, projectiles) in snapshot.items():
+            known = self.known_projectiles.get(index)
+            self.known_projectiles[index] = projectiles
+            if known is None:
+                continue
+            for pid, record in projectiles.items():
+                if pid in known:
+                    continue
+                _, px, py, pdx, pdy = PROJECTILE_RECORD.unpack(record)[:5]
+                speed = math.hypot(pdx, pdy)
+                for target_index, target in enumerate(self.all_players):
+                    if target_index == index or target.health <= 0:
+                        continue
+                    tx, ty = target.x + target.width / 2 - px, target.y + target.height / 2 - py
+                    distance = math.hypot(tx, ty)
+                    if speed and distance and (pdx * tx + pdy * ty) / (speed * distance) >= min_cos:
+                        self.last_interaction[(index, target_index)] = now
+                        self.last_interaction[(target_index, index)] = now
+    
+    def print_sync_stats(self):
+        stats = self.network_sync_stats
+        stale = sum(decoder.stale for decoder in self.snapshot_decoders.values())
+        print(f"📡 Sync rate {stats['rate_hz']}/{stats['target_hz']} Hz, jitter {stats['jitter_ms']} ms, "
+              f"skipped {stats['skipped']}, stale packets dropped {stale}")
+    
+    def sample_telemetry(self):
+        """LAN battles, once per TELEMETRY_INTERVAL: the next telemetry row, also appended to TELEMETRY_LOG"""
+        telemetry = self.telemetry
+        if time.perf_counter() - telemetry.last_sample < TELEMETRY_INTERVAL:
+            return
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 1)
+        
+        clients = []
+        if self.is_host:
+            for client in list(self.client_connections):
+                queue_stats = self.send_queue_stats.get(client.name, {})
+                encoder = self.snapshot_encoders.get(client)
+                clients.append({"name": client.name, "rtt_ms": ms(telemetry.rtt.get(client)),
+                                "queue_depth": queue_stats.get("depth", 0), "max_queue_depth": queue_stats.get("max_depth", 0),
+                                "held_updates": encoder.held if encoder else 0,
+                                "lagging": queue_stats.get("lagging", False), "dropped": client in self.lost_peers})
+            rtts = [client["rtt_ms"] for client in clients if client["rtt_ms"] is not None]
+            rtt = round(sum(rtts) / len(rtts), 1) if rtts else None
+        else:
+            rtt = ms(telemetry.rtt.get(self.network_socket))  # Input to input ack, so it includes up to a host tick
+        sync = self.network_sync_stats
+        row = telemetry.sample(
+            role="server" if self.dedicated_server else "host" if self.is_host else "client",
+            tick=self.network_tick,
+            rtt_ms=rtt,
+            sync_rate_hz=sync.get("rate_hz"),
+            jitter_ms=sync.get("jitter_ms"),
+            stale_snapshots=sum(decoder.stale for decoder in list(self.snapshot_decoders.values())),
+            prediction_error_px=round(self.prediction_error, 1),
+            send_queue_depth=max([client["queue_depth"] for client in clients], default=0),
+            clients=clients
+        )
+        if TELEMETRY_LOG:
+            try:
+                write_telemetry_row(TELEMETRY_LOG, row)
+            except OSError as e:
+                print(f"Can't write telemetry log: {e}")
+    
+    def draw_telemetry_overlay(self):
+        """F4: the newest telemetry row in a panel under our player's info (returns the area drawn)"""
+        row = self.telemetry.history[-1] if self.telemetry.history else None
+        if not self.is_network_game:
+            lines = ["Network telemetry: not a LAN battle"]
+        elif row is None:
+            lines = ["Network telemetry: waiting for data..."]
+        else:
+            def value(field, unit=""):
+                return "-" if row[field] is None else f"{row[field]:g}{unit}"
+            lines = [
+                f"NET {row['role']} | sync {value('sync_rate_hz')}/{self.network_send_rate} Hz, jitter {value('jitter_ms', ' ms')}",
+                f"in {row['bytes_in_per_s'] / 1000:.1f} kB/s {row['messages_in_per_s']:g} msg/s | "
+                f"out {row['bytes_out_per_s'] / 1000:.1f} kB/s {row['messages_out_per_s']:g} msg/s",
+                f"RTT {value('rtt_ms', ' ms')} | snapshot age {value('snapshot_age_ms', ' ms')} (worst gap {value('max_snapshot_gap_ms', ' ms')})",
+                f"decode errors {row['decode_errors']} | send errors {row['send_errors']} | stale {row['stale_snapshots']} | "
+                f"correction {row['prediction_error_px']:g} px"
+            ]
+            for client in row["clients"]:
+                rtt = "-" if client["rtt_ms"] is None else f"{client['rtt_ms']:g} ms"
+                status = " DROPPED" if client["dropped"] else " lagging" if client["lagging"] else ""
+                lines.append(f"  {client['name']}: RTT {rtt}, queue {client['queue_depth']}/{client['max_queue_depth']}{status}")
+            if self.telemetry.last_error:
+                lines.append(f"last error: {self.telemetry.last_error}"[:70])
+        
+        panel = pygame.Rect(5, 90, 470, 10 + 20 * len(lines))
+        overlay = pygame.Surface(panel.size, pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        screen.blit(overlay, panel.topleft)
+        for i, line in enumerate(lines):
+            screen.blit(render_text(tiny_font, line, YELLOW if i == 0 else WHITE), (panel.x + 8, panel.y + 6 + 20 * i))
+        return panel
     
     def network_sync_loop(self):
-        """Continuously sync ALL players' game state - super fast updates"""
-        print("Starting network sync loop with 1ms updates...")
+        """Client: send our inputs to the host at network_send_rate, handling its data as soon as it arrives"""
+        print(f"Starting network sync loop at {self.network_send_rate} Hz...")
+        
+        # Fresh delta baselines every battle - the first snapshot is a full one
+        self.snapshot_encoders = {}
+        self.snapshot_decoders = {self.network_socket: SnapshotDecoder()}
+        self.peer_indexes = {self.network_socket: 0}
+        self.peer_udp_addresses = {}
+        
+        # Host learns where to send our state from the first datagram we send it
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.bind(('0.0.0.0', 0))
+        self.udp_socket.setblocking(False)
+        self.peer_udp_addresses[self.network_socket] = (self.network_socket.getpeername()[0], self.game_port)
+        if self.interpolation_delay > 0:
+            self.remote_interpolator = RemotePlayerInterpolator(self.interpolation_delay)
+        self.telemetry.reset()
+        
+        selector = selectors.DefaultSelector()
+        selector.register(self.network_socket, selectors.EVENT_READ, self.host_decoder)
+        selector.register(self.udp_socket, selectors.EVENT_READ, None)
+        scheduler = TickScheduler(self.network_send_rate)
+        last_report = time.time()
         
         while self.network_running and self.state == GameState.BATTLE:
             try:
-                # Prepare ALL players data for synchronized screens
-                all_players_data = []
-                for i, player in enumerate(self.all_players):
-                    player_data = {
-                        'index': i,
-                        'x': player.x,
-                        'y': player.y,
-                        'health': player.health,
-                        'max_health': player.max_health,
-                        'weapon': player.weapon,
-                        'facing_right': player.facing_right,
-                        'color': player.color,
-                        'velocity_y': player.velocity_y,
-                        'on_ground': player.on_ground,
-                        'projectiles': [(p.x, p.y, p.dx, p.dy, p.damage, p.color, p.has_explosion) for p in player.projectiles]
-                    }
-                    all_players_data.append(player_data)
-                
-                # Add metadata about who sent this
-                sync_data = {
-                    'sender_index': self.my_player_index,
-                    'all_players': all_players_data,
-                    'timestamp': time.time()
-                }
+                # Wait for data until the next send is due
+                timeout = scheduler.time_until_next()
+                for key, _ in selector.select(timeout):
+                    if key.data is None:
+                        self.receive_datagrams()
+                        continue
+                    try:
+                        received = self.network_socket.recv(65536)  # Only called when the selector says there's data, so this never waits
+                        if not received:
+                            raise ConnectionError("connection closed")
+                        self.telemetry.count_in(len(received))
+                        key.data.feed(received)
+                        self.handle_network_frames(self.network_socket, key.data.frames())
+                    except ProtocolError as e:
+                        self.telemetry.error("decode", e)
+                        print(f"Bad data from host: {e}")
+                    except (ConnectionError, OSError) as e:
+                        print(f"Lost connection to host: {e}")
+                        selector.unregister(self.network_socket)
                 
-                data_bytes = pickle.dumps(sync_data)
+                if not scheduler.due():
+                    continue
+                scheduler.tick()
+                self.network_tick += 1
                 
-                if self.is_host:
-                    # Host broadcasts complete game state to all clients
-                    for client in self.client_connections:
-                        try:
-                            client.sendall(data_bytes)
-                        except:
-                            pass
-                    
-                    # Host receives updates from clients
-                    for idx, client in enumerate(self.client_connections):
-                        try:
-                            client.settimeout(0.0001)  # 0.1ms timeout for ultra-fast updates
-                            received = client.recv(8192)
-                            if received:
-                                client_data = pickle.loads(received)
-                                self.merge_network_data(client_data)
-                        except socket.timeout:
-                            pass
-                        except:
-                            pass
-                else:
-                    # Client sends their updates to host
+                # Client sends every input the host hasn't acknowledged yet (so a lost datagram loses nothing)
+                inputs = [entry for entry in list(self.input_history) if entry[0] > self.acked_input_tick]
+                if inputs:
                     try:
-                        self.network_socket.sendall(data_bytes)
-                    except:
-                        pass
-                    
-                    # Client receives complete game state from host
-                    try:
-                        self.network_socket.settimeout(0.0001)  # 0.1ms timeout
-                        received = self.network_socket.recv(8192)
-                        if received:
-                            host_data = pickle.loads(received)
-                            self.sync_all_players(host_data)
-                    except socket.timeout:
-                        pass
-                    except:
-                        pass
+                        payload = encode_inputs(inputs[-INPUT_REDUNDANCY:])
+                        self.send_to_peer(self.network_socket, encode_frame(MSG_INPUT, self.network_tick, payload))
+                        for entry in inputs[-INPUT_REDUNDANCY:]:
+                            self.telemetry.expect_ack(self.network_socket, entry[0])
+                    except Exception as e:
+                        self.telemetry.error("send", e)
                 
-                time.sleep(0.001)  # 1ms sync rate = 1000 updates/second!
+                self.network_sync_stats = scheduler.stats()
+                if time.time() - last_report >= NETWORK_STATS_INTERVAL:
+                    last_report = time.time()
+                    self.print_sync_stats()
                 
             except Exception as e:
                 print(f"Network sync error: {e}")
                 time.sleep(0.01)
         
+        selector.close()
+        self.remote_interpolator = None
+        if self.udp_socket:
+            self.udp_socket.close()
+            self.udp_socket = None
         print("Network sync loop ended")
     
-    def merge_network_data(self, data):
-        """Merge received network data into game state (for host)"""
-        try:
-            sender_idx = data.get('sender_index', -1)
-            all_players_data = data.get('all_players', [])
-            
-            # Update the sender's player data
-            if 0 <= sender_idx < len(self.all_players) and sender_idx < len(all_players_data):
-                sender_data = all_players_data[sender_idx]
-                self.update_single_player(self.all_players[sender_idx], sender_data)
-                
-        except Exception as e:
-            print(f"Merge network data error: {e}")
+    def send_to_peer(self, peer, frame):
+        """Send a state/ack frame over UDP if we know the peer's address and it fits, else over its TCP socket"""
+        address = self.peer_udp_addresses.get(peer)
+        if address is not None and len(frame) <= UDP_MAX_DATAGRAM:
+            datagram = encode_datagram(self.my_player_index, frame)
+            self.telemetry.count_out(len(datagram))
+            try:
+                self.udp_socket.sendto(datagram, address)
+            except BlockingIOError:
+                pass  # Send buffer full - same as the datagram getting lost
+        else:
+            self.telemetry.count_out(len(frame))
+            peer.sendall(frame)
+    
+    def receive_datagrams(self):
+        """Handle every waiting UDP datagram (one frame each)"""
+        while True:
+            try:
+                data, address = self.udp_socket.recvfrom(65536)
+            except (BlockingIOError, socket.timeout):
+                return
+            except OSError:
+                continue  # e.g. Windows reporting an earlier datagram as unreachable
+            self.telemetry.count_in(len(data))
+            try:
+                sender_index, msg_type, tick, payload = decode_datagram(data)
+                if self.is_host:
+                    # A datagram belongs to the connection whose UDP address sent it. The sender index is just a field
+                    # anyone can write, so it only picks the connection for the first datagram from that player's machine
+                    peer = next((p for p, udp_address in self.peer_udp_addresses.items() if udp_address == address), None)
+                    if peer is None:
+                        peer = next((p for p, index in self.peer_indexes.items() if index == sender_index), None)
+                        if peer is None:
+                            raise ProtocolError(f"datagram from unknown player {sender_index}")
+                        if address[0] != peer.address[0]:
+                            raise ProtocolError(f"datagram as player {sender_index} from {address[0]}, not {peer.address[0]}")
+                        if peer in self.peer_udp_addresses:
+                            raise ProtocolError(f"datagram as player {sender_index} from {address}, not {self.peer_udp_addresses[peer]}")
+                        # Where to send its state from now on
+                        self.peer_udp_addresses[peer] = address
+                    elif self.peer_indexes.get(peer) != sender_index:
+                        raise ProtocolError(f"datagram as player {sender_index} from player {self.peer_indexes.get(peer)}")
+                else:
+                    peer = self.network_socket
+                    host_address = self.peer_udp_addresses.get(peer)
+                    if host_address is None or address[0] != host_address[0]:
+                        raise ProtocolError(f"datagram from {address[0]}, not the host")
+                self.handle_network_frames(peer, [(msg_type, tick, payload)])
+            except ProtocolError as e:
+                self.telemetry.error("decode", e)
+                print(f"Bad datagram from {address}: {e}")
+    
+    def handle_network_frames(self, peer, frames):
+        """Apply one peer's frames: acks, inputs, reliable events and snapshots (every delta, in order), then ack the newest"""
+        newest_tick = 0
+        for msg_type, tick, payload in frames:
+            self.telemetry.count_in(messages=1)
+            if msg_type == MSG_ACK:
+                if peer in self.snapshot_encoders:
+                    self.snapshot_encoders[peer].ack(tick)
+                    self.telemetry.acked(peer, tick)
+            elif msg_type == MSG_INPUT and self.is_host:
+                # Inputs move the player whose connection they came in on (never one named in the message)
+                if peer in self.peer_indexes:
+                    self.queue_remote_inputs(self.peer_indexes[peer], decode_inputs(payload))
+                else:
+                    self.telemetry.error("decode", ProtocolError("inputs from a peer with no player"))
+            elif msg_type == MSG_INPUT_ACK and not self.is_host:
+                input_ack = decode_input_ack(payload)
+                if input_ack[0] > self.acked_input_tick:
+                    self.acked_input_tick = input_ack[0]
+                    self.pending_reconcile = input_ack
+                    self.telemetry.acked(peer, input_ack[0])
+            elif msg_type == MSG_EVENT and not self.is_host:
+                self.apply_hit_events(decode_events(payload))
+            elif msg_type == MSG_STATE and peer in self.snapshot_decoders:
+                sync_data = self.snapshot_decoders[peer].decode(tick, payload)
+                if sync_data is not None:
+                    newest_tick = tick
+                    self.telemetry.snapshot_received()
+                    self.sync_all_players(sync_data)
+        if newest_tick:
+            self.send_to_peer(peer, encode_frame(MSG_ACK, newest_tick))
+    
+    def queue_remote_inputs(self, index, inputs):
+        """Host: queue a client's inputs for the game loop, skipping ones already received (they're resent until acked)"""
+        queue = self.remote_inputs.get(index)
+        if queue is None:
+            return
+        last_tick = self.last_input_tick.get(index, 0)
+        for entry in inputs:
+            if entry[0] > last_tick:
+                queue.append(entry)
+                last_tick = entry[0]
+        self.last_input_tick[index] = last_tick
+    
+    def simulate_remote_inputs(self):
+        """Host: move client players by their queued inputs - the client's reported position is never trusted"""
+        for index, queue in self.remote_inputs.items():
+            if not queue or index >= len(self.all_players):
+                continue
+            player = self.all_players[index]
+            for _ in range(min(len(queue), MAX_INPUTS_PER_TICK)):
+                tick, buttons, target_x, target_y = queue.popleft()
+                if player.health > 0:
+                    apply_player_input(player, buttons, self.platforms)
+                    if buttons & INPUT_SHOOT:
+                        player.shoot(target_x, target_y)
+            self.input_acks[index] = (tick, player.x, player.y, player.velocity_y, player.on_ground, player.facing_right)
+    
+    def reconcile_prediction(self):
+        """Client: restart our player from the host's result for an input and replay every input since"""
+        tick, x, y, velocity_y, on_ground, facing_right = self.pending_reconcile
+        self.pending_reconcile = None
+        player = self.all_players[self.my_player_index]
+        predicted = (player.x, player.y)
+        player.x, player.y, player.velocity_y, player.on_ground, player.facing_right = x, y, velocity_y, on_ground, facing_right
+        
+        # Buff timers already ran down for these ticks - replaying mustn't count them twice
+        buffs = (player.temp_speed_boost, player.temp_speed_duration, player.temp_damage_boost, player.temp_damage_duration)
+        while self.input_history and self.input_history[0][0] <= tick:
+            self.input_history.popleft()
+        for entry in self.input_history:
+            apply_player_input(player, entry[1], self.platforms)
+        player.temp_speed_boost, player.temp_speed_duration, player.temp_damage_boost, player.temp_damage_duration = buffs
+        self.prediction_error = math.dist(predicted, (player.x, player.y))
+    
+    def collect_hit_events(self):
+        """Host: (kind, index, health) for every player who lost health since the last call"""
+        events = []
+        for i, player in enumerate(self.all_players):
+            last_health = self.event_health.get(i, player.health)
+            if player.health < last_health:
+                events.append((EVENT_KNOCKOUT if player.health <= 0 < last_health else EVENT_HIT, i, player.health))
+            self.event_health[i] = player.health
+        return events
+    
+    def apply_hit_events(self, events):
+        """Client: hits and knockouts from the host"""
+        for kind, index, health in events:
+            if 0 <= index < len(self.all_players):
+                player = self.all_players[index]
+                self.host_health[index] = health
+                player.health = health
+                if kind == EVENT_KNOCKOUT:
+                    print(f"💥 {player.username} was knocked out!")
     
     def sync_all_players(self, data):
         """Sync complete game state (for clients)"""
         try:
             all_players_data = data.get('all_players', [])
+            interpolator = self.remote_interpolator
             
             # Update ALL players except yourself
             for player_data in all_players_data:
                 player_idx = player_data.get('index', -1)
                 
                 if 0 <= player_idx < len(self.all_players):
+                    if 'health' in player_data:
+                        self.host_health[player_idx] = player_data['health']
                     # Don't overwrite your own player data (you control it locally)
                     if player_idx != self.my_player_index:
+                        if interpolator is not None:
+                            # Positions go through the interpolation buffer instead (see apply_remote_interpolation)
+                            player_data = {key: value for key, value in player_data.items() if key not in ('x', 'y')}
                         self.update_single_player(self.all_players[player_idx], player_data)
+            
+            if interpolator is not None:
+                # Every snapshot is a sample for every remote player - unchanged ones just stood still
+                changed = {player_data.get('index', -1): player_data for player_data in all_players_data}
+                positions = {}
+                for i, player in enumerate(self.all_players):
+                    if i == self.my_player_index:
+                        continue
+                    last = interpolator.latest_position(i) or (player.x, player.y)
+                    player_data = changed.get(i, {})
+                    positions[i] = (player_data.get('x', last[0]), player_data.get('y', last[1]))
+                interpolator.add_snapshot(data.get('timestamp', time.time()), positions)
                         
         except Exception as e:
             print(f"Sync all players error: {e}")
     
+    def apply_remote_interpolation(self):
+        """Move remote players to where the interpolation buffer says they were INTERPOLATION_DELAY ago"""
+        for index, position in self.remote_interpolator.positions().items():
+            if index != self.my_player_index and 0 <= index < len(self.all_players):
+                self.all_players[index].x, self.all_players[index].y = position
+    
     def update_single_player(self, player, data):
         """Update a single player with network data"""
         try:
@@ -3589,35 +6002,74 @@ class Game:
             player.velocity_y = data.get('velocity_y', player.velocity_y)
             player.on_ground = data.get('on_ground', player.on_ground)
             
-            # Update health (but only decrease, never increase to prevent healing)
-            new_health = data.get('health', player.health)
-            if new_health < player.health:
-                player.health = new_health
-            
-            # Sync projectiles
-            if 'projectiles' in data:
-                player.projectiles = []
-                for proj_data in data['projectiles']:
-                    if len(proj_data) >= 7:
-                        px, py, pdx, pdy, pdamage, pcolor, pexplosion = proj_data
-                        weapon_data = WEAPONS.get(player.weapon, WEAPONS["Fist"])
-                        new_proj = Projectile(px, py, pdx, pdy, pdamage, weapon_data["speed"], pcolor, pexplosion)
-                        player.projectiles.append(new_proj)
+            # The host is the authority on health
+            player.health = data.get('health', player.health)
+            
+            # Sync projectiles - a full list, or what was fired/removed since the last snapshot.
+            # This runs on the network thread, so the pool work is left to the game loop (apply_projectile_updates)
+            full = 'projectiles' in data
+            removed = data.get('projectiles_removed')
+            added = data.get('projectiles', data.get('projectiles_added', []))
+            if full or removed or added:
+                speed = WEAPONS.get(player.weapon, WEAPONS["Fist"])["speed"]
+                self.pending_projectiles.append((player, full, removed, added, speed))
             
         except Exception as e:
             print(f"Update single player error: {e}")
+    
+    def apply_projectile_updates(self):
+        """Game loop: apply the projectile changes snapshots brought in, in the order they arrived"""
+        while self.pending_projectiles:
+            player, full, removed, added, speed = self.pending_projectiles.popleft()
+            if full:
+                player.clear_projectiles()
+            if removed:
+                player.remove_projectiles(set(removed))
+            if added:
+                known_ids = {proj.net_id for proj in player.projectiles}
+                for pid, px, py, pdx, pdy, pdamage, pcolor, pexplosion in added:
+                    if pid not in known_ids:
+                        new_proj = PROJECTILE_POOL.acquire(px, py, pdx, pdy, pdamage, speed, pcolor, pexplosion)
+                        new_proj.net_id = pid
+                        player.projectiles.append(new_proj)
                         
-    def update_battle(self):
-        keys = pygame.key.get_pressed()
+    def update_battle(self, keys=None):
+        if keys is None:
+            keys = NO_KEYS if self.headless else pygame.key.get_pressed()
+        
+        # Clients show remote players slightly in the past, smoothly
+        if self.remote_interpolator is not None:
+            self.apply_remote_interpolation()
+        if self.pending_projectiles:
+            self.apply_projectile_updates()
+        if self.is_network_game:
+            self.sample_telemetry()
         
         # In network mode, only move YOUR player (based on my_player_index)
-        if self.is_network_game and self.my_player_index < len(self.all_players):
+        if self.is_network_game and self.is_host:
+            if self.my_player_index < len(self.all_players):
+                my_player = self.all_players[self.my_player_index]
+                apply_player_input(my_player, input_buttons(keys, my_player.controls), self.platforms)
+            # Client players move by the inputs their owners sent
+            self.simulate_remote_inputs()
+        elif self.is_network_game and self.my_player_index < len(self.all_players):
             my_player = self.all_players[self.my_player_index]
-            my_player.move(keys, self.platforms)
-            # Handle jump separately (W key for jump, not Space which is for shooting)
-            if keys[pygame.K_w] and my_player.on_ground:
-                my_player.velocity_y = my_player.jump_power
-                my_player.on_ground = False
+            buttons = input_buttons(keys, my_player.controls)
+            # Predict: move right away, and remember the input for the host and for replays
+            if self.pending_reconcile is not None:
+                self.reconcile_prediction()
+            target_x, target_y = 0, 0
+            if self.pending_shot is not None:
+                buttons |= INPUT_SHOOT
+                target_x, target_y = self.pending_shot
+                self.pending_shot = None
+            self.input_tick += 1
+            self.input_history.append((self.input_tick, buttons, target_x, target_y))
+            apply_player_input(my_player, buttons, self.platforms)
+        elif self.player1_autopilot:
+            # Nobody at the keyboard - player1 fights like a CPU
+            if self.player1.health > 0:
+                self.update_cpu_team(self.player1)
         else:
             # CPU mode - move player1
             self.player1.move(keys, self.platforms)
@@ -3637,37 +6089,35 @@ class Game:
                 # Normal 1v1 CPU
                 self.update_cpu()
         
+        # Bucket everything a projectile can hit (barriers first, so they soak shots before players)
+        self.spatial_hash.clear()
+        for barrier_owner in self.all_players:
+            if barrier_owner.role == "Engineer":
+                for structure in barrier_owner.structures:
+                    if structure["type"] == "barrier":
+                        self.spatial_hash.insert((structure, barrier_owner), structure["x"], structure["y"], structure["width"], structure["height"])
+        for target in self.all_players:
+            if target.health > 0 and not target.is_trapped:
+                self.spatial_hash.insert((target, None), target.x, target.y, target.width, target.height)
+        
+        # Pooled explosion particles all move in one batch
+        if EXPLOSION_PARTICLES is not None:
+            EXPLOSION_PARTICLES.update()
+        
+        # NumPy store: everybody's projectiles move and hit in one batch
+        if self.projectile_store is not None:
+            self.attach_projectile_store()
+            self.projectile_store.update(self.spatial_hash, self.team_mode_enabled)
+        
         # Update all players' projectiles and explosions
         for i, player in enumerate(self.all_players):
             if player.health > 0:
                 # Update explosions
                 player.update_explosions()
                 
-                # Check projectiles against barriers
-                for proj in player.projectiles[:]:
-                    for barrier_owner in self.all_players:
-                        if barrier_owner.role == "Engineer" and barrier_owner.team != player.team:
-                            for structure in barrier_owner.structures[:]:
-                                if structure["type"] == "barrier":
-                                    # Check if projectile hits barrier
-                                    if (structure["x"] < proj.x < structure["x"] + structure["width"] and 
-                                        structure["y"] < proj.y < structure["y"] + structure["height"]):
-                                        # Hit barrier!
-                                        structure["health"] -= proj.damage
-                                        if structure["health"] <= 0:
-                                            barrier_owner.structures.remove(structure)
-                                            print("🔨 Barrier destroyed!")
-                                        if proj in player.projectiles:
-                                            player.projectiles.remove(proj)
-                                        break
-                
-                # Check projectiles against all OTHER players
-                for other in self.all_players:
-                    if other != player and other.health > 0 and not other.is_trapped:
-                        # Friendly fire prevention: skip teammates
-                        if self.team_mode_enabled and player.team == other.team:
-                            continue
-                        player.update_projectiles(other)
+                # Move projectiles and check them against nearby barriers and OTHER players
+                if self.projectile_store is None:
+                    player.update_projectiles(self.spatial_hash, self.team_mode_enabled)
                 
                 # Check melee attacks against all OTHER players
                 for other in self.all_players:
@@ -3686,7 +6136,6 @@ class Game:
             # Ghost mode movement (still can move around as spectator)
             if player.is_ghost and player == self.player1:
                 # Allow player to move as ghost
-                keys = pygame.key.get_pressed()
                 if keys[pygame.K_a]:
                     player.x -= player.speed * 0.5
                 if keys[pygame.K_d]:
@@ -3753,7 +6202,7 @@ class Game:
                 if player.health > 0 and collectible.check_collision(player):
                     if collectible.type == "coin":
                         # Only add coins to player1 (local player)
-                        if player == self.player1 or (self.is_network_game and self.all_players[self.my_player_index] == player):
+                        if player == self.player1 or (self.is_network_game and self.my_player_index < len(self.all_players) and self.all_players[self.my_player_index] == player):
                             player.coins += 5
                             print(f"+5 coins! Total: {player.coins}")
                     elif collectible.type == "health":
@@ -3770,8 +6219,32 @@ class Game:
                     self.collectibles.remove(collectible)
                     break
         
+        # Local hits on a client are only for show - health is whatever the host says
+        if self.is_network_game and not self.is_host:
+            for index, health in list(self.host_health.items()):
+                if index < len(self.all_players):
+                    self.all_players[index].health = health
+        
+        # Host: copy out the state to send now, between ticks - projectiles are recycled mid-tick,
+        # so the sync loop on the network thread must never read the live ones
+        if self.is_network_game and self.is_host:
+            sync_data = self.build_sync_data()
+            with self.sync_lock:
+                self.host_sync_data = sync_data
+        
         # Check for winner (in multiplayer or CPU mode)
-        if self.is_network_game:
+        if self.is_network_game and self.dedicated_server:
+            # Nobody wins or loses on the server itself - it just notes who's left (run_dedicated_server ends the match)
+            alive_players = [p for p in self.all_players if p.health > 0]
+            if len(alive_players) <= 1 and self.match_over_time is None:
+                self.match_over_time = time.time()
+                winner_index = self.all_players.index(alive_players[0]) if alive_players else None
+                if winner_index is not None and winner_index < len(self.lobby_players):
+                    self.winner = self.lobby_players[winner_index]
+                else:
+                    self.winner = None
+                print(f"🏁 Match decided - winner: {self.winner or 'nobody'}")
+        elif self.is_network_game:
             # Get MY player based on index
             my_player = self.all_players[self.my_player_index] if self.my_player_index < len(self.all_players) else self.player1
             
@@ -3851,7 +6324,8 @@ class Game:
     def update_cpu_team(self, cpu):
         """Update CPU AI for team mode - targets nearest enemy"""
         # Find nearest enemy (different team)
-        enemies = [p for p in self.all_players if p.health > 0 and p.team != cpu.team]
+        # (Outside team mode nobody has a team, so everyone else is an enemy)
+        enemies = [p for p in self.all_players if p.health > 0 and p is not cpu and (p.team != cpu.team or cpu.team is None)]
         if not enemies:
             return  # No enemies left
         
@@ -4050,7 +6524,14 @@ class Game:
             
     def run(self):
         running = True
+        tick_length = 1.0 / TICK_RATE
+        tick_accumulator = 0.0  # Real time not yet simulated
+        last_time = time.perf_counter()
         while running:
+            now = time.perf_counter()
+            frame_time = now - last_time
+            last_time = now
+            
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
@@ -4089,6 +6570,12 @@ class Game:
                     self.player1.target_x = mouse_x
                     self.player1.target_y = mouse_y
             
+            # Coming back to battle from another screen needs a full repaint before dirty rects work
+            if self.state == GameState.BATTLE and self.last_drawn_state != GameState.BATTLE:
+                self.battle_full_redraw = True
+                tick_accumulator = 0.0
+            self.last_drawn_state = self.state
+            
             if self.state == GameState.USERNAME_INPUT:
                 self.draw_username_input()
             elif self.state == GameState.ROLE_SELECT:
@@ -4100,8 +6587,18 @@ class Game:
             elif self.state == GameState.COLOR_SELECT:
                 self.draw_color_select()
             elif self.state == GameState.BATTLE:
-                self.update_battle()
-                self.draw_battle()
+                # Simulate in fixed ticks so slow frames don't slow down timers and movement
+                tick_accumulator += frame_time
+                ticks_run = 0
+                while tick_accumulator >= tick_length and ticks_run < MAX_CATCHUP_TICKS and self.state == GameState.BATTLE:
+                    self.store_previous_positions()
+                    self.update_battle()
+                    tick_accumulator -= tick_length
+                    ticks_run += 1
+                if ticks_run == MAX_CATCHUP_TICKS:
+                    # Too far behind - drop the backlog instead of spiralling
+                    tick_accumulator = min(tick_accumulator, tick_length)
+                self.draw_battle(min(1.0, tick_accumulator / tick_length))
             elif self.state == GameState.SHOP:
                 self.draw_shop()
             elif self.state == GameState.WIN:
@@ -4113,13 +6610,761 @@ class Game:
             elif self.state == GameState.JOIN_GAME:
                 self.draw_join_game()
                 
-            pygame.display.flip()
-            clock.tick(FPS)
+            if self.state == GameState.BATTLE and self.display_update_rects is not None:
+                pygame.display.update(self.display_update_rects)
+            else:
+                pygame.display.flip()
+            clock.tick(MAX_RENDER_FPS if self.state == GameState.BATTLE else FPS)
             
         pygame.quit()
         sys.exit()
 
+def pool_stats():
+    """Hit/miss counters for the projectile and explosion object pools"""
+    return {
+        "projectiles": PROJECTILE_POOL.stats(),
+        "explosions": EXPLOSION_POOL.stats()
+    }
+
+def run_headless_battle(seed=None, map_name=None, mode="1v1", ticks=3600, weapon="Fist", num_teams=2, team_size=4):
+    """Simulate a CPU-vs-CPU battle with no display and return the final state and stats"""
+    if map_name is not None and map_name not in MAPS:
+        raise ValueError(f"Unknown map: {map_name}")
+    if mode not in ("1v1", "team"):
+        raise ValueError(f"Unknown mode: {mode}")
+    
+    random.seed(seed)
+    game = Game(headless=True)
+    game.is_cpu_mode = True
+    game.team_mode_enabled = mode == "team"
+    game.num_teams = num_teams
+    game.team_size = team_size
+    game.player1.weapon = weapon  # CPUs copy player1's weapon
+    game.assign_random_roles()
+    game.reset_battle(map_name)
+    game.state = GameState.BATTLE
+    
+    start_time = time.perf_counter()
+    ticks_run = 0
+    while ticks_run < ticks and game.state == GameState.BATTLE:
+        game.update_battle()
+        ticks_run += 1
+    elapsed = time.perf_counter() - start_time
+    
+    outcome = {GameState.WIN: "win", GameState.LOSE: "lose"}.get(game.state, "timeout")
+    return {
+        "seed": seed,
+        "map": game.current_map,
+        "mode": mode,
+        "ticks": ticks_run,
+        "outcome": outcome,  # From player1's side
+        "winner": game.winner if outcome != "timeout" else None,
+        "players": [{
+            "username": player.username,
+            "team": player.team,
+            "role": player.role,
+            "weapon": player.weapon,
+            "health": player.health,
+            "max_health": player.max_health,
+            "x": round(player.x, 2),
+            "y": round(player.y, 2),
+            "coins": player.coins,
+            "alive": player.health > 0
+        } for player in game.all_players],
+        "projectiles": sum(len(player.projectiles) for player in game.all_players),
+        "collectibles": len(game.collectibles),
+        "pools": pool_stats(),
+        "seconds": round(elapsed, 3),
+        "ticks_per_second": round(ticks_run / elapsed, 1) if elapsed > 0 else None
+    }
+
+def tick_time_stats(durations):
+    """Milliseconds per simulation tick: mean, 95th percentile and worst"""
+    if not durations:
+        return {"mean_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(durations)
+    return {"mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3)}
+
+def run_dedicated_server(port=GAME_PORT, max_players=10, maps=None, lobby_wait=10.0, matches=None, send_rate=None, report=None):
+    """Host LAN lobbies and matches with no window and no player of its own, one after another.
+    A match starts once 2+ players are in and nobody new joined for lobby_wait seconds (or the lobby is full),
+    on the next map of the rotation. Returns each match's result (runs until Ctrl+C if matches is None).
+    report, if given, is called with a dict whenever a lobby opens ("lobby"), every NETWORK_STATS_INTERVAL
+    seconds of a match ("ticks") and when a match ends ("match")."""
+    maps = list(maps) if maps else list(MAPS.keys())
+    for map_name in maps:
+        if map_name not in MAPS:
+            raise ValueError(f"Unknown map: {map_name}")
+    if not 2 <= max_players <= 10:
+        raise ValueError("max_players must be 2-10")
+    
+    game = Game(headless=True)
+    game.dedicated_server = True
+    game.game_port = port
+    game.max_players = max_players
+    game.player_name = "Server"
+    if send_rate is not None:
+        game.network_send_rate = send_rate
+    rotation = itertools.cycle(maps)
+    tick_length = 1.0 / TICK_RATE
+    results = []
+    try:
+        while matches is None or len(results) < matches:
+            game.start_host()
+            if game.state != GameState.HOST_WAIT:
+                raise OSError(game.connection_status)
+            print(f"🖥️ Dedicated server lobby {game.lobby_code} open on port {port} ({max_players} players max)")
+            if report is not None:
+                report({"event": "lobby", "port": port, "lobby_code": game.lobby_code})
+            
+            # Lobby
+            players_seen, last_join = 0, time.time()
+            while not (game.can_start and (players_seen >= max_players or time.time() - last_join >= lobby_wait)):
+                time.sleep(0.1)
+                if len(game.lobby_players) != players_seen:
+                    players_seen, last_join = len(game.lobby_players), time.time()
+            
+            # Match - fixed ticks like the game window, dropping the backlog if we fall behind
+            game.start_network_battle(next(rotation))
+            started = time.time()
+            ticks = 0
+            tick_durations = []  # Seconds each update_battle took
+            last_report = time.time()
+            next_tick = time.perf_counter()
+            while game.state == GameState.BATTLE:
+                tick_start = time.perf_counter()
+                game.update_battle()
+                tick_durations.append(time.perf_counter() - tick_start)
+                ticks += 1
+                if report is not None and time.time() - last_report >= NETWORK_STATS_INTERVAL:
+                    last_report = time.time()
+                    report({"event": "ticks", "port": port, "lobby_code": game.lobby_code, "ticks": ticks,
+                            "tick_time": tick_time_stats(tick_durations[-TICK_RATE * NETWORK_STATS_INTERVAL:])})
+                if game.match_over_time is None and len(game.client_connections) - len(game.lost_peers) < 2:
+                    game.match_over_time = time.time()
+                    print("🏁 Match over - not enough players left")
+                # Keep syncing a moment so everyone gets the final hits
+                if game.match_over_time is not None and time.time() - game.match_over_time >= MATCH_END_LINGER:
+                    break
+                next_tick += tick_length
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_tick = time.perf_counter()
+            
+            result = {
+                "lobby_code": game.lobby_code,
+                "map": game.current_map,
+                "players": list(game.lobby_players),
+                "winner": game.winner,
+                "ticks": ticks,
+                "seconds": round(time.time() - started, 1),
+                "tick_time": tick_time_stats(tick_durations)
+            }
+            results.append(result)
+            print(f"🏆 Match {len(results)} on {result['map']}: winner {result['winner'] or 'nobody'} after {result['seconds']}s "
+                  f"(ticks {result['tick_time']['mean_ms']} ms mean, {result['tick_time']['max_ms']} ms worst)")
+            if report is not None:
+                report(dict(result, event="match", port=port))
+            
+            # Back to a fresh lobby (clients rejoin from their menu)
+            game.state = GameState.MENU
+            game.network_running = False
+            game.close_network()
+            game.winner = None
+    except KeyboardInterrupt:
+        print("Server stopped")
+    finally:
+        game.state = GameState.MENU
+        game.network_running = False
+        game.close_network()
+    return results
+
+def _run_match_worker(port, max_players, maps, lobby_wait, matches, settings, reports):
+    """Process pool task: one dedicated server (for matches matches, or forever), reporting to the front-end's queue.
+    settings: the front-end's COMMAND_LINE_SETTINGS values, applied here before anything runs"""
+    globals().update(settings)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            run_dedicated_server(port, max_players, maps, lobby_wait, matches, send_rate=NETWORK_SEND_RATE, report=reports.put)
+    except KeyboardInterrupt:
+        pass
+
+def serve_lobby_lookups(listener, lobby_ports, running):
+    """Front-end thread: answer MSG_LOOKUP with the port of the match holding that lobby code, until running is cleared.
+    Every lookup gets its own coroutine (like the host's clients), so a slow or silent one only holds up itself."""
+    async def answer_lookup(reader, writer):
+        address = writer.get_extra_info("peername")
+        try:
+            msg_type, _, payload = await asyncio.wait_for(read_frame(reader, FrameDecoder()), HANDSHAKE_TIMEOUT)
+            if msg_type == MSG_LOOKUP:
+                code = payload.decode(errors="replace").upper()
+                writer.write(encode_frame(MSG_LOBBY, 0, struct.pack("!H", lobby_ports.get(code, 0))))
+                await writer.drain()
+        except asyncio.TimeoutError:
+            print(f"Lookup from {address[0]} timed out")
+        except Exception as e:
+            print(f"Lookup from {address[0]} failed: {e}")
+        finally:
+            writer.close()
+    
+    async def serve():
+        server = await asyncio.start_server(answer_lookup, sock=listener)
+        try:
+            while running.is_set():
+                await asyncio.sleep(1.0)
+        finally:
+            server.close()
+            await server.wait_closed()
+    
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(serve())
+    except Exception as e:
+        print(f"Lobby lookups stopped: {e}")
+    finally:
+        loop.close()
+
+def run_match_server(port=GAME_PORT, match_count=20, max_players=10, maps=None, lobby_wait=10.0, send_rate=None, matches=None):
+    """Run match_count dedicated servers side by side in a process pool, on ports port+1, port+2...
+    Each hosts its own lobbies (clients find them by broadcast like any host); a front-end on port
+    routes clients that only have a lobby code. Prints every match's tick times until Ctrl+C, or
+    until every server has played matches matches. Returns each match's result."""
+    if match_count < 1:
+        raise ValueError("match_count must be at least 1")
+    if port + match_count > 65535:
+        raise ValueError("not enough ports above the front-end port")
+    
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('0.0.0.0', port))
+    listener.listen(16)
+    
+    lobby_ports = {}  # Lobby code -> port of the match hosting it
+    running = threading.Event()
+    running.set()
+    lookups = threading.Thread(target=serve_lobby_lookups, args=(listener, lobby_ports, running), daemon=True)
+    lookups.start()
+    print(f"🖥️ Match server: {match_count} matches on ports {port + 1}-{port + match_count}, lobby lookups on port {port}")
+    
+    settings = {name: globals()[name] for name in COMMAND_LINE_SETTINGS}
+    if send_rate is not None:
+        settings["NETWORK_SEND_RATE"] = send_rate
+    manager = multiprocessing.Manager()
+    reports = manager.Queue()
+    results = []
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=match_count)
+    try:
+        futures = {pool.submit(_run_match_worker, port + 1 + i, max_players, maps, lobby_wait, matches, settings, reports): port + 1 + i
+                   for i in range(match_count)}
+        while not all(future.done() for future in futures):
+            try:
+                report = reports.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if report["event"] == "lobby":
+                # A match port only ever has one open lobby
+                for code in [code for code, lobby_port in lobby_ports.items() if lobby_port == report["port"]]:
+                    del lobby_ports[code]
+                lobby_ports[report["lobby_code"]] = report["port"]
+            elif report["event"] == "ticks":
+                tick_time = report["tick_time"]
+                print(f"⏱️ Match {report['lobby_code']} (port {report['port']}): tick {tick_time['mean_ms']} ms mean, "
+                      f"{tick_time['p95_ms']} ms p95, {tick_time['max_ms']} ms worst")
+            elif report["event"] == "match":
+                results.append(report)
+                print(f"🏆 Match {report['lobby_code']} (port {report['port']}) on {report['map']}: winner {report['winner'] or 'nobody'}, "
+                      f"tick {report['tick_time']['mean_ms']} ms mean, {report['tick_time']['max_ms']} ms worst")
+        for future, match_port in futures.items():
+            if future.exception() is not None:
+                print(f"Match on port {match_port} stopped: {future.exception()}")
+    except KeyboardInterrupt:
+        print("Match server stopped")
+    finally:
+        running.clear()
+        lookups.join(2.0)  # Its loop closes the listener
+        pool.shutdown(wait=False, cancel_futures=True)
+        manager.shutdown()
+    return results
+
+def run_network_simulator(target, listen_port=GAME_PORT + 1, scenario="wifi", seed=None):
+    """--netsim: put a NetworkSimulator in front of the host at target (ip, port) until Ctrl+C, reporting its counters"""
+    simulator = NetworkSimulator(target[0], target[1], listen_port, scenario, seed)
+    simulator.start()
+    print(f"Clients join with: python battle_game.py --join <this computer's IP>:{listen_port}")
+    try:
+        while simulator.thread.is_alive():
+            simulator.thread.join(NETWORK_STATS_INTERVAL)
+            simulator.print_stats()
+    except KeyboardInterrupt:
+        print("Network simulator stopped")
+    finally:
+        simulator.stop()
+    return simulator.stats
+
+def _dict_backed_copy(cls):
+    """Same class without __slots__ (the old __dict__ layout), for benchmark comparisons"""
+    namespace = {name: value for name, value in cls.__dict__.items()
+                 if name not in cls.__slots__ and name not in ("__slots__", "__dict__", "__weakref__")}
+    return type(cls.__name__ + "Dict", (), namespace)
+
+def run_entity_benchmark(count=20000, repeat=5):
+    """Measure memory per instance and attribute access speed of the slotted entities vs dict-backed copies"""
+    import gc
+    import timeit
+    import tracemalloc
+    
+    factories = {
+        "Projectile": lambda cls: cls(100, 200, 0.6, 0.8, 10, 12, RED),
+        "Player": lambda cls: cls(100, 200, RED, {}),
+        "Platform": lambda cls: cls(100, 200, 150, 20),
+        "Collectible": lambda cls: cls(100, 200, "coin"),
+    }
+    
+    def touch(entities):
+        for entity in entities:
+            entity.x = entity.x + entity.y
+    
+    results = {}
+    for name, make in factories.items():
+        results[name] = {}
+        for layout, cls in (("slots", globals()[name]), ("dict", _dict_backed_copy(globals()[name]))):
+            gc.collect()
+            tracemalloc.start()
+            entities = [make(cls) for _ in range(count)]
+            allocated = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            access_time = min(timeit.repeat(lambda: touch(entities), number=1, repeat=repeat))
+            results[name][layout] = {
+                "bytes_per_instance": round(allocated / count, 1),
+                "ns_per_access": round(access_time / count / 3 * 1e9, 1)  # 2 reads + 1 write each
+            }
+        
+        # Projectiles are the ones we churn through by the thousand - time their update too
+        if name == "Projectile":
+            for layout, cls in (("slots", Projectile), ("dict", _dict_backed_copy(Projectile))):
+                entities = [make(cls) for _ in range(count)]
+                update_time = min(timeit.repeat(lambda: [entity.update() for entity in entities], number=1, repeat=repeat))
+                results[name][layout]["ns_per_update"] = round(update_time / count * 1e9, 1)
+    return results
+
+def run_protocol_benchmark(seed=1, samples=200, ack_delay=3):
+    """Bytes per state update and encode/decode speed of the binary protocol (full and delta) vs pickle.
+    (Roundtrip, delta, split-stream and fuzz checks are in tests/test_protocol.py)"""
+    import timeit
+    
+    # Real snapshots from a busy 10-player CPU battle
+    random.seed(seed)
+    game = Game(headless=True)
+    game.is_cpu_mode = True
+    game.team_mode_enabled = True
+    game.num_teams = 2
+    game.team_size = 5
+    game.player1.weapon = "Water Gun"
+    game.assign_random_roles()
+    game.reset_battle("Arena")
+    game.state = GameState.BATTLE
+    snapshots = []
+    for tick in range(samples * 2):
+        if game.state != GameState.BATTLE:
+            break
+        game.update_battle()
+        if tick % 2 == 0:  # 30 snapshots a second
+            snapshots.append(game.build_sync_data())
+    
+    frames = [encode_frame(MSG_STATE, tick, encode_sync_data(data)) for tick, data in enumerate(snapshots)]
+    pickled = [pickle.dumps(data) for data in snapshots]
+    
+    # Delta stream to one peer whose acks come back a few snapshots late
+    encoder = SnapshotEncoder()
+    delta_sizes = []
+    for tick, data in enumerate(snapshots, 1):
+        delta_sizes.append(FRAME_HEADER.size + len(encoder.encode(tick, data)))
+        if tick > ack_delay:
+            encoder.ack(tick - ack_delay)
+    
+    sample = snapshots[len(snapshots) // 2]
+    sample_frame = encode_sync_data(sample)
+    sample_pickle = pickle.dumps(sample)
+    repeat = 2000
+    return {
+        "snapshots": len(snapshots),
+        "players": len(sample['all_players']),
+        "avg_projectiles": round(sum(sum(len(p['projectiles']) for p in data['all_players']) for data in snapshots) / len(snapshots), 1),
+        "bytes_per_update": {
+            "binary": round(sum(map(len, frames)) / len(frames), 1),
+            "binary_delta": round(sum(delta_sizes) / len(delta_sizes), 1),
+            "pickle": round(sum(map(len, pickled)) / len(pickled), 1)
+        },
+        "us_per_encode": {
+            "binary": round(min(timeit.repeat(lambda: encode_sync_data(sample), number=repeat, repeat=3)) / repeat * 1e6, 1),
+            "pickle": round(min(timeit.repeat(lambda: pickle.dumps(sample), number=repeat, repeat=3)) / repeat * 1e6, 1)
+        },
+        "us_per_decode": {
+            "binary": round(min(timeit.repeat(lambda: decode_sync_data(sample_frame), number=repeat, repeat=3)) / repeat * 1e6, 1),
+            "pickle": round(min(timeit.repeat(lambda: pickle.loads(sample_pickle), number=repeat, repeat=3)) / repeat * 1e6, 1)
+        }
+    }
+
+def run_interpolation_benchmark(seed=1, seconds=20, latency=0.05, delay=INTERPOLATION_DELAY):
+    """A remote player seen through simulated jittery, lossy links: jumping to the newest snapshot
+    (the old behaviour) vs the interpolation buffer. Returns one row per link scenario."""
+    rng = random.Random(seed)
+    ground_y = 500.0
+    
+    # True path, one point per game tick: running back and forth and jumping, like in a battle
+    truth = []
+    x, y, vx, vy = 500.0, ground_y, 5, 0.0
+    for _ in range(int(seconds * TICK_RATE) + 2):
+        if rng.random() < 1 / 40:
+            vx = rng.choice((-5, 0, 5))
+        if y >= ground_y and rng.random() < 1 / 60:
+            vy = -15.0
+        vy += 0.8
+        y = min(ground_y, y + vy)
+        x += vx
+        if not 0 <= x <= SCREEN_WIDTH:
+            vx = -vx
+            x = max(0, min(SCREEN_WIDTH, x))
+        truth.append((x, y))
+    
+    def true_position(t):
+        tick = max(0.0, min(t * TICK_RATE, len(truth) - 1.001))
+        i = int(tick)
+        frac = tick - i
+        return (truth[i][0] + (truth[i + 1][0] - truth[i][0]) * frac,
+                truth[i][1] + (truth[i + 1][1] - truth[i][1]) * frac)
+    
+    def smoothness(shown, lagged_truth):
+        jerk = sum(math.dist((a[0] - 2 * b[0] + c[0], a[1] - 2 * b[1] + c[1]), (0, 0))
+                   for a, b, c in zip(shown, shown[1:], shown[2:])) / (len(shown) - 2)
+        frozen = sum(1 for i in range(1, len(shown))
+                     if shown[i] == shown[i - 1] and math.dist(lagged_truth[i], lagged_truth[i - 1]) > 0.5)
+        return round(jerk, 2), round(frozen / (len(shown) - 1), 3)
+    
+    scenarios = [
+        {"send_rate": 60, "jitter_ms": 0, "loss": 0.0},
+        {"send_rate": 30, "jitter_ms": 0, "loss": 0.0},
+        {"send_rate": 30, "jitter_ms": 20, "loss": 0.0},
+        {"send_rate": 30, "jitter_ms": 20, "loss": 0.05},
+        {"send_rate": 20, "jitter_ms": 30, "loss": 0.1},
+        {"send_rate": 10, "jitter_ms": 30, "loss": 0.05},
+    ]
+    sender_clock_offset = 1234.5  # The sender's clock doesn't agree with ours
+    frame_time = 1.0 / TICK_RATE
+    results = []
+    for scenario in scenarios:
+        # Every snapshot's arrival time (lost ones never arrive), in arrival order
+        arrivals = []
+        send_time = 0.0
+        while send_time < seconds:
+            if rng.random() >= scenario["loss"]:
+                arrival = send_time + latency + rng.uniform(0, scenario["jitter_ms"] / 1000)
+                arrivals.append((arrival, send_time + sender_clock_offset, true_position(send_time)))
+            send_time += 1.0 / scenario["send_rate"]
+        arrivals.sort()
+        
+        interpolator = RemotePlayerInterpolator(delay)
+        newest = None
+        next_arrival = 0
+        raw_shown, raw_truth, smooth_shown, smooth_truth = [], [], [], []
+        dry_frames = 0
+        now = 1.0
+        while now < seconds:
+            while next_arrival < len(arrivals) and arrivals[next_arrival][0] <= now:
+                arrival, timestamp, position = arrivals[next_arrival]
+                if newest is None or timestamp > newest[0]:
+                    newest = (timestamp, position)
+                interpolator.add_snapshot(timestamp, {0: position}, now=arrival)
+                next_arrival += 1
+            if newest is not None:
+                raw_shown.append(newest[1])
+                raw_truth.append(true_position(now - latency))
+                smooth_shown.append(interpolator.positions(now)[0])
+                smooth_truth.append(true_position(now - latency - delay))
+                if now - interpolator.clock_offset - delay > interpolator.buffers[0].latest()[0]:
+                    dry_frames += 1
+            now += frame_time
+        
+        row = dict(scenario)
+        for name, shown, lagged_truth in (("raw", raw_shown, raw_truth), ("interpolated", smooth_shown, smooth_truth)):
+            error = sum(math.dist(a, b) for a, b in zip(shown, lagged_truth)) / len(shown)
+            jerk, frozen = smoothness(shown, lagged_truth)
+            row[name] = {"tracking_error_px": round(error, 2), "jerk_px": jerk, "frozen_frames": frozen}
+        row["interpolated"]["extrapolated_frames"] = round(dry_frames / len(smooth_shown), 3)
+        results.append(row)
+    return {"latency_ms": latency * 1000, "delay_ms": delay * 1000,
+            "true_jerk_px": smoothness([true_position(i * frame_time) for i in range(TICK_RATE, int(seconds * TICK_RATE))],
+                                       [true_position(i * frame_time) for i in range(TICK_RATE, int(seconds * TICK_RATE))])[0],
+            "scenarios": results}
+
+def run_netsim_benchmark(scenarios=None, seconds=10, port=GAME_PORT + 20, seed=1):
+    """A real host and client in this process, the client joined through the NetworkSimulator, both running around
+    for `seconds` per scenario. Shows how sync quality degrades: how long joining and starting take over TCP,
+    how many snapshots make it, how far the client's view of the host's player and the host's view of the
+    client's player are off, the client's prediction corrections and how far behind input acks are.
+    Returns one row per scenario."""
+    def spread(values):
+        ordered = sorted(values) or [0.0]
+        return {"mean": round(sum(ordered) / len(ordered), 2),
+                "p95": round(ordered[int(len(ordered) * 0.95) - 1 if len(ordered) > 1 else 0], 2),
+                "max": round(ordered[-1], 2)}
+    
+    tick_length = 1.0 / TICK_RATE
+    results = []
+    for number, name in enumerate(scenarios or list(NETSIM_SCENARIOS)):
+        host_port = port + 2 * number  # Fresh ports, so nothing from the last scenario is still in flight
+        host = Game(headless=True)
+        host.player1_autopilot = False
+        host.game_port = host_port
+        host.player_name = "Host"
+        client = Game(headless=True)
+        client.player1_autopilot = False
+        client.player_name = "Client"
+        simulator = NetworkSimulator("127.0.0.1", host_port, host_port + 1, name, seed)
+        row = {"scenario": name, "phases": [str(conditions) for _, conditions in simulator.phases]}
+        try:
+            host.start_host()
+            simulator.start()
+            started = time.perf_counter()
+            client.start_client("127.0.0.1", host_port + 1)
+            if client.state != GameState.HOST_WAIT:
+                raise OSError(client.connection_status)
+            row["join_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            deadline = time.time() + 10
+            while not host.can_start and time.time() < deadline:
+                time.sleep(0.01)
+            started = time.perf_counter()
+            host.start_network_battle("Street")
+            while client.state != GameState.BATTLE and time.time() < deadline:
+                time.sleep(0.001)
+            if client.state != GameState.BATTLE:
+                raise OSError("the client never got the START message")
+            row["start_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            
+            host_player_lag, client_player_error, corrections, ack_lag = [], [], [], []
+            sent_before = host.network_tick
+            next_tick = time.perf_counter()
+            for tick in range(int(seconds * TICK_RATE)):
+                # Both players run back and forth and jump now and then, out of step with each other
+                host_keys, client_keys = defaultdict(bool), defaultdict(bool)
+                host_keys[pygame.K_d if tick // 45 % 2 == 0 else pygame.K_a] = True
+                host_keys[pygame.K_w] = tick % 70 == 0
+                client_keys[pygame.K_a if tick // 60 % 2 == 0 else pygame.K_d] = True
+                client_keys[pygame.K_w] = tick % 50 == 25
+                host.update_battle(host_keys)
+                reconciling = client.pending_reconcile is not None
+                client.update_battle(client_keys)
+                if reconciling:
+                    corrections.append(client.prediction_error)
+                host_player_lag.append(math.dist((host.all_players[0].x, host.all_players[0].y),
+                                                 (client.all_players[0].x, client.all_players[0].y)))
+                client_player_error.append(math.dist((client.all_players[1].x, client.all_players[1].y),
+                                                     (host.all_players[1].x, host.all_players[1].y)))
+                ack_lag.append(client.input_tick - client.acked_input_tick)
+                next_tick += tick_length
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            
+            decoder = client.snapshot_decoders.get(client.network_socket) or SnapshotDecoder()
+            sent = max(1, host.network_tick - sent_before)
+            row.update({
+                "snapshots_delivered": round(min(1.0, decoder.decoded / sent), 3),
+                "stale_snapshots": decoder.stale,
+                "host_player_lag_px": spread(host_player_lag),
+                "client_player_error_px": spread(client_player_error),
+                "corrections": len(corrections),
+                "correction_px": spread(corrections),
+                "input_ack_lag_ticks": spread(ack_lag),
+                "proxy": simulator.stats
+            })
+        except OSError as e:
+            row["error"] = str(e)
+        finally:
+            for game in (client, host):
+                game.state = GameState.MENU
+                game.network_running = False
+                game.close_network()
+            simulator.stop()
+        results.append(row)
+    return {"seconds": seconds, "send_rate": NETWORK_SEND_RATE, "interp_delay_ms": INTERPOLATION_DELAY * 1000,
+            "scenarios": results}
+
+def run_relevance_benchmark(seed=1, seconds=10, team_sizes=(1, 5, 10), viewers=4, ack_delay=3):
+    """State bytes per client per second and how far off clients see the other players, sending every player
+    every time vs relevance filtering plus the CLIENT_SNAPSHOT_BUDGET, in CPU team battles of growing size
+    (20 players is twice today's lobby limit). Each of the first `viewers` players gets its own delta stream
+    with acks coming back ack_delay snapshots late. Returns one row per battle size."""
+    rows = []
+    snapshot_every = max(1, TICK_RATE // NETWORK_SEND_RATE)
+    budget = CLIENT_SNAPSHOT_BUDGET / NETWORK_SEND_RATE if CLIENT_SNAPSHOT_BUDGET else None
+    for team_size in team_sizes:
+        random.seed(seed)
+        game = Game(headless=True)
+        game.is_cpu_mode = True
+        game.team_mode_enabled = True
+        game.num_teams = 2
+        game.team_size = team_size
+        game.player1.weapon = "Water Gun"
+        game.assign_random_roles()
+        game.reset_battle("Arena")
+        game.state = GameState.BATTLE
+        players = game.all_players
+        watched = range(min(viewers, len(players)))
+        modes = {"all": {}, "relevance": {}}
+        for streams in modes.values():
+            for viewer in watched:
+                streams[viewer] = {"encoder": SnapshotEncoder(), "decoder": SnapshotDecoder(), "view": {}, "bytes": 0,
+                                   "near_error": [], "far_error": []}
+        snapshots = 0
+        for tick in range(int(seconds * TICK_RATE)):
+            if game.state != GameState.BATTLE:
+                break
+            game.update_battle()
+            if tick % snapshot_every:
+                continue
+            snapshots += 1
+            sync_data = game.build_sync_data()
+            snapshot = pack_snapshot(sync_data)
+            now = tick / TICK_RATE
+            game.note_interactions(snapshot, now)
+            for mode, streams in modes.items():
+                for viewer, stream in streams.items():
+                    if mode == "relevance":
+                        priorities = relevance_priorities(players, viewer, game.last_interaction, now)
+                        payload = stream["encoder"].encode(snapshots, sync_data, snapshot, priorities, budget)
+                    else:
+                        payload = stream["encoder"].encode(snapshots, sync_data, snapshot)
+                    stream["bytes"] += FRAME_HEADER.size + len(payload)
+                    for player_data in stream["decoder"].decode(snapshots, payload)["all_players"]:
+                        old = stream["view"].get(player_data["index"], (0, 0))
+                        stream["view"][player_data["index"]] = (player_data.get("x", old[0]), player_data.get("y", old[1]))
+                    if snapshots > ack_delay:
+                        stream["encoder"].ack(snapshots - ack_delay)
+                    # How far off the client's picture of everyone else is, near its player and farther away
+                    me = players[viewer]
+                    for index, player in enumerate(players):
+                        if index == viewer or index not in stream["view"]:
+                            continue
+                        error = math.dist(stream["view"][index], (player.x, player.y))
+                        near = math.dist((me.x, me.y), (player.x, player.y)) <= RELEVANCE_NEAR
+                        stream["near_error" if near else "far_error"].append(error)
+        
+        row = {"players": len(players), "snapshots": snapshots}
+        for mode, streams in modes.items():
+            game_seconds = max(1, snapshots) * snapshot_every / TICK_RATE
+            rates = [stream["bytes"] / game_seconds for stream in streams.values()]
+            near = [error for stream in streams.values() for error in stream["near_error"]]
+            far = [error for stream in streams.values() for error in stream["far_error"]]
+            row[mode] = {
+                "bytes_per_client_per_s": round(sum(rates) / len(rates)),
+                "max_bytes_per_client_per_s": round(max(rates)),
+                "near_error_px": round(sum(near) / len(near), 2) if near else None,
+                "far_error_px": round(sum(far) / len(far), 2) if far else None,
+                "held_updates": sum(stream["encoder"].held for stream in streams.values())
+            }
+        rows.append(row)
+    return {"send_rate": NETWORK_SEND_RATE, "budget_bytes_per_s": CLIENT_SNAPSHOT_BUDGET, "near_px": RELEVANCE_NEAR, "battles": rows}
+
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    # Frozen (PyInstaller) builds re-run this file for every match server worker - let those go straight to their task
+    multiprocessing.freeze_support()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Battle Street")
+    parser.add_argument("--headless", action="store_true", help="simulate one CPU battle without a window and print its stats as JSON")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for a repeatable battle")
+    parser.add_argument("--map", choices=list(MAPS.keys()), default=None, help="battle map (random if not given)")
+    parser.add_argument("--mode", choices=["1v1", "team"], default="1v1")
+    parser.add_argument("--ticks", type=int, default=3600, help="max simulation ticks (60 per second of game time)")
+    parser.add_argument("--weapon", choices=list(WEAPONS.keys()), default="Fist", help="weapon everybody fights with")
+    parser.add_argument("--teams", type=int, default=2, help="number of teams in team mode")
+    parser.add_argument("--team-size", type=int, default=4, help="players per team in team mode")
+    parser.add_argument("--send-rate", "--tick-rate", dest="send_rate", type=int, default=NETWORK_SEND_RATE, help="LAN battle state snapshots per second (e.g. 20, 30 or 60)")
+    parser.add_argument("--interp-delay", type=float, default=INTERPOLATION_DELAY * 1000, help="ms in the past remote players are drawn at in LAN battles (0 = no interpolation)")
+    parser.add_argument("--client-budget", type=float, default=CLIENT_SNAPSHOT_BUDGET / 1000, help="LAN battle state kB/s per client before less relevant players wait their turn (0 = unlimited)")
+    parser.add_argument("--no-relevance", action="store_true", help="update every player with every snapshot, however far from the client's player")
+    parser.add_argument("--server", action="store_true", help="run a dedicated LAN server (no window, hosts lobbies and matches for clients)")
+    parser.add_argument("--port", type=int, default=GAME_PORT, help="dedicated server port (TCP lobby + UDP battle)")
+    parser.add_argument("--max-players", type=int, default=10, help="dedicated server lobby size (2-10)")
+    parser.add_argument("--maps", nargs="+", choices=list(MAPS.keys()), default=None, help="dedicated server map rotation (all maps if not given)")
+    parser.add_argument("--lobby-wait", type=float, default=10.0, help="seconds a dedicated server lobby waits for more players once 2 have joined")
+    parser.add_argument("--matches", type=int, default=None, help="dedicated server stops after this many matches - per server with --parallel-matches (default: run until Ctrl+C)")
+    parser.add_argument("--parallel-matches", type=int, default=1, help="dedicated server runs this many matches at once, one process each (ports --port+1, +2...)")
+    parser.add_argument("--telemetry-log", metavar="FILE", default=None, help="append a LAN battle network telemetry row every second to this .csv or .jsonl file")
+    parser.add_argument("--numpy-projectiles", action="store_true", help="use the NumPy projectile store (needs numpy)")
+    parser.add_argument("--join", metavar="IP[:PORT]", default=None, help="connect straight to a host (or a --netsim proxy) instead of the menu")
+    parser.add_argument("--netsim", choices=list(NETSIM_SCENARIOS.keys()) + ["custom"], default=None, help="run a network simulator proxy with this scenario (custom = the --net-* options)")
+    parser.add_argument("--netsim-target", metavar="IP[:PORT]", default="127.0.0.1", help="host the network simulator forwards to")
+    parser.add_argument("--netsim-port", type=int, default=GAME_PORT + 1, help="port the network simulator listens on (TCP + UDP)")
+    parser.add_argument("--net-latency", type=float, default=50.0, help="custom scenario latency in ms")
+    parser.add_argument("--net-jitter", type=float, default=20.0, help="custom scenario jitter in ms")
+    parser.add_argument("--net-loss", type=float, default=0.02, help="custom scenario packet loss (0-1)")
+    parser.add_argument("--net-reorder", type=float, default=0.01, help="custom scenario reordering (0-1)")
+    parser.add_argument("--net-bandwidth", type=float, default=None, help="custom scenario bandwidth cap in kB/s (unlimited if not given)")
+    parser.add_argument("--bench", choices=["entities", "protocol", "interpolation", "netsim", "relevance"], help="run a microbenchmark and print the results as JSON (netsim: every scenario, or just --netsim)")
+    args = parser.parse_args()
+    
+    if args.numpy_projectiles:
+        if np is None:
+            parser.error("--numpy-projectiles needs numpy installed")
+        NUMPY_PROJECTILES = True
+    
+    if args.send_rate <= 0:
+        parser.error("--send-rate must be positive")
+    NETWORK_SEND_RATE = args.send_rate
+    if args.interp_delay < 0:
+        parser.error("--interp-delay can't be negative")
+    INTERPOLATION_DELAY = args.interp_delay / 1000
+    
+    TELEMETRY_LOG = args.telemetry_log
+    if args.client_budget < 0:
+        parser.error("--client-budget can't be negative")
+    CLIENT_SNAPSHOT_BUDGET = args.client_budget * 1000 or None
+    RELEVANCE_FILTERING = not args.no_relevance
+    
+    if args.parallel_matches < 1:
+        parser.error("--parallel-matches must be at least 1")
+    if args.matches is not None and args.matches < 1:
+        parser.error("--matches must be at least 1")
+    
+    if not (0 <= args.net_loss <= 1 and 0 <= args.net_reorder <= 1):
+        parser.error("--net-loss and --net-reorder must be 0-1")
+    NETSIM_SCENARIOS["custom"] = [(None, LinkConditions(args.net_latency / 1000, args.net_jitter / 1000, args.net_loss, args.net_reorder,
+                                                        args.net_bandwidth * 1000 if args.net_bandwidth else None))]
+    
+    if args.bench or args.netsim or args.server or args.headless:
+        if args.server and not 2 <= args.max_players <= 10:
+            parser.error("--max-players must be 2-10")
+        # Progress logs go to stderr so stdout is only the JSON results (pipe it straight into json.load or jq)
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.bench == "entities":
+                results = run_entity_benchmark()
+            elif args.bench == "protocol":
+                results = run_protocol_benchmark()
+            elif args.bench == "interpolation":
+                results = run_interpolation_benchmark(delay=INTERPOLATION_DELAY)
+            elif args.bench == "relevance":
+                results = run_relevance_benchmark()
+            elif args.bench == "netsim":
+                results = run_netsim_benchmark([args.netsim] if args.netsim else None, seed=args.seed)
+            elif args.netsim:
+                results = run_network_simulator(parse_address(args.netsim_target), args.netsim_port, args.netsim, args.seed)
+            elif args.server and args.parallel_matches > 1:
+                results = run_match_server(args.port, args.parallel_matches, args.max_players, args.maps, args.lobby_wait, NETWORK_SEND_RATE,
+                                           args.matches)
+            elif args.server:
+                results = run_dedicated_server(args.port, args.max_players, args.maps, args.lobby_wait, args.matches)
+            else:
+                results = run_headless_battle(args.seed, args.map, args.mode, args.ticks, args.weapon, args.teams, args.team_size)
+        print(json.dumps(results, indent=2))
+    else:
+        game = Game()
+        if args.join:
+            game.start_client(*parse_address(args.join))
+        game.run()
 